@@ -1,18 +1,53 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+import sys
+from services.instrumentation import startup_timer
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, current_app, g, abort
 from config import Config
-from models.database import db, CalendarDatabaseConfig, TaskOperation, ScheduleOperation
-from notion_client import Client as NotionClient
+startup_timer.mark('导入 flask/config')
+from models.database import (
+    db, CalendarDatabaseConfig, TaskOperation, ScheduleOperation,
+    ScheduleDailyStat, PageMirror, PageMirrorState, TaskPlanRecord, NotionWriteOutbox
+)
+startup_timer.mark('导入 models')
+from services.history import (
+    create_schedule_operation, complete_schedule_operation, iter_scheduled_tasks,
+    get_schedule_history_page, get_daily_stats, to_utc_naive
+)
+from services.outbox import (
+    enqueue_write, drain_outbox, get_replayable_entries, count_operation_results,
+    count_deferred_entries, get_deferred_operation_ids, get_unattached_deferred_entries, has_deferred_writes
+)
+from services.singleflight import schedule_flight, read_flight, SingleFlightBusy
+from services.mirror import sync_pages, apply_planned_times, mark_pages_archived, get_mirror_version
+from services.search_index import get_search_index, drop_search_index
+from services.freshness import check_plan_freshness, collect_planned_versions, plan_inputs_changed, CLOSED_STATUSES
+from services.notion_gateway import NotionGateway, token_key
+from services.circuit_breaker import circuit_breakers, CircuitOpenError
+from services.cassette import get_cassette
+from services.notion_async import async_runner
+from services.call_scheduler import parse_class_settings, background_calls, DEFAULT_WEIGHTS, DEFAULT_TARGETS_MS
+from services.warmup import warm_tree_cache, warmup_scheduler, database_changed_since, parse_warmup_times
+from services.workspaces import remember_selection, forget_selection
+from services.config_cache import config_cache
+from services.notion_directory import token_status_cache, database_directory
+from services.preview_store import preview_store, find_node, truncate, DEFAULT_DEPTH, MAX_DEPTH
+from services.responses import init_response_pipeline, stream_page, matching_etag, not_modified
+from services.profiling import init_profiling, profiler, MODES as PROFILING_MODES
+from services.instrumentation import request_metrics
 
 from datetime import datetime, timedelta
 import json
+import threading
 from sqlalchemy import inspect
-from flask_migrate import Migrate
 import pytz
 from functools import wraps
 from collections import defaultdict
 from heapq import heappush, heappop
 import math
+import time
+import hashlib
+import hmac
+startup_timer.mark('导入 services')
 
 # 辅助函数：根据优先级名称获取排序键
 def get_priority_sort_key(priority_name):
@@ -24,8 +59,8 @@ def get_priority_sort_key(priority_name):
             return 99  # 无效的 P 系列优先级，排在最后
     return 99 # 非 P 系列或无效的优先级，排在最后
 
-def delete_today_rest_tasks(notion, config, mapping):
-    """删除当天的所有休息任务"""
+def find_today_rest_tasks(notion, config, mapping):
+    """查询当天的所有休息任务"""
     try:
         # 获取当前日期范围（今天00:00到明天00:00）
         shanghai_tz = pytz.timezone('Asia/Shanghai')
@@ -55,31 +90,401 @@ def delete_today_rest_tasks(notion, config, mapping):
                 }
             })
         
-        # 获取所有休息任务
-        rest_tasks = notion.databases.query(
+        return notion.databases.query(
             database_id=config.database_id,
             filter=filter_conditions
         ).get('results', [])
         
-        # 删除所有休息任务
-        deleted_count = 0
-        for task in rest_tasks:
-            try:
-                # 使用archive而不是delete，更安全
-                notion.pages.update(
-                    page_id=task['id'],
-                    archived=True
-                )
-                deleted_count += 1
-            except Exception as e:
-                print(f"⚠️ 无法删除休息任务 {task['id']}: {str(e)}")
-        
-        print(f"🧘 成功删除 {deleted_count}/{len(rest_tasks)} 个休息任务")
-        return deleted_count
-        
     except Exception as e:
-        print(f"❌ 删除休息任务时出错: {str(e)}")
-        return 0
+        print(f"❌ 查询休息任务时出错: {str(e)}")
+        return []
+
+def create_notion_client(token):
+    """
+    创建本次请求使用的 Notion 客户端（带请求级页面缓存，独立调用走异步执行器）
+
+    同步调用和异步调用都经过令牌的优先级调度器，共享同一个限速额度；
+    熔断器打开时调用立即失败（熔断后用 users.me 主动探测恢复）。
+    录制/回放 cassette 时所有调用都走同步客户端，以便逐个记录
+    """
+    cassette = current_cassette()
+    if cassette is not None and cassette.mode == 'replay':
+        client = cassette.wrap(None)
+    else:
+        from notion_client import Client as NotionClient
+        base_url = current_app.config.get('NOTION_API_BASE_URL')
+        client = NotionClient(auth=token, **({'base_url': base_url} if base_url else {}))
+        if cassette is not None:
+            client = cassette.wrap(client)
+    use_async = current_app.config.get('NOTION_ASYNC_ENABLED') and cassette is None
+    return NotionGateway(
+        client, token,
+        shared_ttl_seconds=current_app.config.get('PAGE_CACHE_TTL_SECONDS', 0),
+        dispatcher=async_runner.run_calls if use_async else None,
+        schema_ttl_seconds=current_app.config.get('SCHEMA_CACHE_TTL_SECONDS', 0),
+        scheduler=async_runner.run_sync if current_app.config.get('NOTION_SCHEDULER_ENABLED') else None,
+        breaker=circuit_breakers.for_token(token, probe=lambda: client.users.me())
+    )
+
+def current_cassette():
+    """NOTION_CASSETTE_MODE 配置的录制/回放 cassette，未配置时返回 None"""
+    config = current_app.config
+    return get_cassette(
+        config.get('NOTION_CASSETTE_MODE'), config.get('NOTION_CASSETTE_PATH'),
+        config.get('NOTION_REPLAY_LATENCY_SCALE', 1.0)
+    )
+
+def get_token_status(token, refresh=False):
+    """
+    令牌状态：TTL 内返回缓存；过期时先返回旧状态并在后台刷新，refresh=True 时同步检查
+
+    Returns:
+        dict: {'valid', 'error', 'checked_at', 'checking'}，从未检查过时 valid 为 None
+    """
+    notion = create_notion_client(token)
+    if refresh:
+        status = token_status_cache.refresh(token, notion.users.me)
+        return dict(status, checking=False)
+    status, stale = token_status_cache.get(token)
+    checking = False
+    if stale:
+        checking = token_status_cache.refresh_in_background(token, notion.users.me) or status is None
+    return dict(status or {'valid': None, 'error': None, 'checked_at': None}, checking=checking)
+
+def search_databases(token, refresh=False):
+    """按请求参数 q / cursor / limit 分页搜索令牌可访问的数据库（目录缓存）"""
+    return database_directory.search(
+        token, lambda: create_notion_client(token),
+        query=request.values.get('q', ''),
+        cursor=request.values.get('cursor', 0, type=int),
+        limit=request.values.get('limit', 20, type=int),
+        refresh=refresh
+    )
+
+def localize_shanghai(dt):
+    """无时区信息的时间视为上海时间"""
+    if dt.tzinfo is None:
+        return pytz.timezone('Asia/Shanghai').localize(dt)
+    return dt
+
+def build_task_time_properties(mapping, start_time, end_time, mark_scheduled=False):
+    """
+    构建更新任务时间盒的 properties
+
+    Args:
+        mapping: 属性映射字典
+        start_time: 开始时间 (datetime对象)
+        end_time: 结束时间 (datetime对象)
+        mark_scheduled: 是否同时把排程状态设为已完成值
+    """
+    timebox_start_property_name = mapping.get('timebox_start_property')
+    timebox_end_property_name = mapping.get('timebox_end_property')
+    
+    start_time_iso = localize_shanghai(start_time).isoformat()
+    end_time_iso = localize_shanghai(end_time).isoformat()
+    
+    properties = {}
+    if mark_scheduled:
+        properties[mapping.get('schedule_status_property')] = {
+            'select': {
+                'name': mapping.get('schedule_status_done_value')
+            }
+        }
+    
+    # 如果开始和结束时间是同一个字段，就只更新一个
+    if timebox_start_property_name == timebox_end_property_name:
+        properties[timebox_start_property_name] = {
+            'date': {
+                'start': start_time_iso,
+                'end': end_time_iso
+            }
+        }
+    else:
+        if timebox_start_property_name:
+            properties[timebox_start_property_name] = {
+                'date': {
+                    'start': start_time_iso
+                }
+            }
+        if timebox_end_property_name:
+            properties[timebox_end_property_name] = {
+                'date': {
+                    'start': end_time_iso
+                }
+            }
+    return properties
+
+def build_rest_task_payload(config, mapping, rest_task_info):
+    """构建在 Notion 中创建休息任务的 pages.create 参数"""
+    properties = {}
+    
+    # 设置标题
+    title_property = mapping.get('title_property')
+    if title_property:
+        properties[title_property] = {
+            'title': [
+                {
+                    'text': {
+                        'content': rest_task_info.get('title', '🧘 休息时间')
+                    }
+                }
+            ]
+        }
+    
+    # 设置优先级
+    priority_property = mapping.get('priority_property')
+    if priority_property and rest_task_info.get('priority'):
+        properties[priority_property] = {
+            'select': {
+                'name': rest_task_info['priority']
+            }
+        }
+    
+    # 设置父任务关系（只有在有父任务ID时才设置）
+    parent_task_property = mapping.get('parent_task_property')
+    if parent_task_property and rest_task_info.get('parent_task_id'):
+        properties[parent_task_property] = {
+            'relation': [
+                {
+                    'id': rest_task_info['parent_task_id']
+                }
+            ]
+        }
+    
+    # 设置预估时间
+    estimated_time_property = mapping.get('estimated_time_property')
+    if estimated_time_property:
+        properties[estimated_time_property] = {
+            'number': rest_task_info.get('estimated_time', 15)
+        }
+    
+    # 设置时间范围（确保时间带有时区信息）
+    timebox_start_property = mapping.get('timebox_start_property')
+    timebox_end_property = mapping.get('timebox_end_property')
+    rest_start_time = localize_shanghai(rest_task_info['start_time'])
+    rest_end_time = localize_shanghai(rest_task_info['end_time'])
+    
+    # 如果开始和结束时间是同一个字段
+    if timebox_start_property == timebox_end_property and timebox_start_property:
+        properties[timebox_start_property] = {
+            'date': {
+                'start': rest_start_time.isoformat(),
+                'end': rest_end_time.isoformat()
+            }
+        }
+    else:
+        # 分别设置开始和结束时间
+        if timebox_start_property:
+            properties[timebox_start_property] = {
+                'date': {
+                    'start': rest_start_time.isoformat()
+                }
+            }
+        if timebox_end_property:
+            properties[timebox_end_property] = {
+                'date': {
+                    'start': rest_end_time.isoformat()
+                }
+            }
+    
+    return {
+        'parent': {'database_id': config.database_id},
+        'properties': properties
+    }
+
+def flash_stale_tasks(result_data):
+    """提示因计划后被修改而暂缓写入的任务"""
+    stale_tasks = result_data.get('stale_tasks') or []
+    if stale_tasks:
+        titles = '、'.join(task['title'] for task in stale_tasks[:5])
+        more = f' 等 {len(stale_tasks)} 个任务' if len(stale_tasks) > 5 else ''
+        flash(f'⚠️ {titles}{more}在预览后修改了预估时间、优先级、状态或父任务，本次未安排日程，请重新预览排程', 'warning')
+
+# 计入排程成功率的发件箱写入类别（清理旧休息任务不计入）
+SCHEDULE_RESULT_KINDS = ('task_time', 'rest_task')
+
+def bulk_write_workers():
+    """
+    批量写入在同步模式下的线程数
+
+    启用自适应并发时线程数取 AIMD 上限，实际在途数量由调度器按观测到的延迟和限速响应控制
+    """
+    config = current_app.config
+    if config.get('NOTION_SCHEDULER_ENABLED') and config.get('BULK_WRITE_ADAPTIVE_ENABLED'):
+        return config.get('BULK_WRITE_MAX_CONCURRENCY', 8)
+    return config.get('OUTBOX_DRAIN_WORKERS', 3)
+
+def drain_schedule_operation(notion, operation, task_tree=None, start_time=None, resume_deferred=True):
+    """
+    执行排程操作在发件箱中尚未成功的写入，并更新排程记录
+
+    Args:
+        resume_deferred: 本次写入成功（Notion 可用）时，在后台重放该配置之前暂存的写入
+
+    Returns:
+        dict: 结果页面数据
+    """
+    entries = get_replayable_entries(operation.id)
+    write_started = time.perf_counter()
+    drain_outbox(
+        notion, entries,
+        max_workers=bulk_write_workers(),
+        max_attempts=current_app.config.get('OUTBOX_MAX_ATTEMPTS', 3)
+    )
+    success_count, total_count = count_operation_results(operation.id, SCHEDULE_RESULT_KINDS)
+    written_page_ids = [
+        entry.page_id for entry in entries
+        if entry.kind == 'task_time' and entry.status == 'succeeded'
+    ]
+    
+    # 保存排程操作记录（同时更新日聚合），只为时间已写入的任务保存计划
+    complete_schedule_operation(
+        operation, success_count, total_count,
+        api_duration_ms=(time.perf_counter() - write_started) * 1000,
+        task_tree=task_tree,
+        written_page_ids=set(written_page_ids)
+    )
+    
+    # 写入成功的任务时间和归档直接同步到镜像（子任务计数随之更新）
+    archived_page_ids = [
+        entry.page_id for entry in entries
+        if entry.action == 'update' and entry.status == 'succeeded' and (entry.payload or {}).get('archived')
+    ]
+    updated_rows = apply_planned_times(operation.config_id, operation.id, written_page_ids)
+    if mark_pages_archived(operation.config_id, archived_page_ids) or updated_rows:
+        db.session.commit()
+    
+    deferred_count = count_deferred_entries(operation.id)
+    if resume_deferred and not deferred_count and any(entry.status == 'succeeded' for entry in entries):
+        resume_deferred_writes(operation.config_id)
+    
+    return {
+        'success_count': success_count,
+        'total_count': total_count,
+        'deferred_count': deferred_count,
+        'start_time': start_time or operation.start_time,
+        'operation_id': operation.id,
+        'status': operation.status,
+        'completion_time': datetime.now(pytz.timezone('Asia/Shanghai'))
+    }
+
+def flash_deferred_writes(result_data):
+    """提示因 Notion 熔断而暂存的写入"""
+    deferred_count = result_data.get('deferred_count') or 0
+    if deferred_count:
+        flash(f'🔌 Notion 暂时不可用，{deferred_count} 个写入已保存，恢复后自动写入（排程 #{result_data["operation_id"]}）', 'warning')
+    return deferred_count
+
+def resume_deferred_writes(config_id):
+    """配置有暂存的写入时在后台重放（例如进程重启前暂存、之后的写入已经成功）"""
+    if has_deferred_writes(config_id):
+        replay_deferred_writes(current_app._get_current_object(), config_ids={config_id})
+
+def replay_deferred_writes(app, key=None, config_ids=None):
+    """
+    在后台线程中重放暂存的写入
+
+    熔断关闭时传入令牌键 key；启动预热时不传参数，重放所有配置；
+    同一配置之后的写入成功时传入 config_ids
+    """
+    def run():
+        with app.app_context():
+            for config in config_cache.all():
+                if key is not None and token_key(config.token) != key:
+                    continue
+                if config_ids is not None and config.id not in config_ids:
+                    continue
+                operation_ids = get_deferred_operation_ids(config.id)
+                has_unattached = bool(get_unattached_deferred_entries(config.id))
+                if not operation_ids and not has_unattached:
+                    continue
+                print(f"📮 重放配置 #{config.id} 暂存的 {len(operation_ids)} 个排程" + ("及延期写入" if has_unattached else ""))
+                notion = create_notion_client(config.token)
+                if has_unattached:
+                    # 延期调整等不属于排程的写入，在执行前重新读取，避免重复写入
+                    try:
+                        schedule_flight.run(
+                            config.id, 'resume:delay_time',
+                            lambda: drain_outbox(
+                                notion, get_unattached_deferred_entries(config.id),
+                                max_workers=bulk_write_workers(),
+                                max_attempts=current_app.config.get('OUTBOX_MAX_ATTEMPTS', 3)
+                            )
+                        )
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"❌ 重放延期写入失败: {str(e)}")
+                for operation_id in operation_ids:
+                    operation = db.session.get(ScheduleOperation, operation_id)
+                    try:
+                        schedule_flight.run(
+                            config.id, f'resume:{operation_id}',
+                            lambda: drain_schedule_operation(notion, operation, resume_deferred=False)
+                        )
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"❌ 重放排程 #{operation_id} 失败: {str(e)}")
+    
+    threading.Thread(target=run, name='outbox-replay', daemon=True).start()
+
+def write_schedule_to_notion(notion, config, mapping, task_tree, rest_tasks_info, start_time, mark_scheduled=False,
+                             planned_at=None):
+    """
+    将排程结果写回 Notion：先把所有写操作记录到发件箱，再并发执行
+
+    Args:
+        notion: NotionClient 实例
+        config: 配置对象
+        mapping: 属性映射字典
+        task_tree: 已排程的任务树
+        rest_tasks_info: 需要创建的休息任务信息列表
+        start_time: 排程起始时间
+        mark_scheduled: 是否同时更新排程状态
+        planned_at: 计划计算的时间（plan_schedule 返回），写入前只检查之后修改过的页面
+
+    Returns:
+        dict: 结果页面数据，stale_tasks 为计划后被修改而未写入的任务（不重新排程，需要重新预览）
+    """
+    operation = create_schedule_operation(config, start_time)
+    warm_tree_cache.invalidate(config.id)
+    
+    # 删除当天的所有休息任务（查询为读操作，归档写入走发件箱）
+    for rest_task in find_today_rest_tasks(notion, config, mapping):
+        enqueue_write(config.id, 'rest_cleanup', 'update', {'archived': True},
+                      page_id=rest_task['id'], operation_id=operation.id)
+    
+    # 乐观并发：只对计划后被修改、且影响排程输入的页面暂缓写入
+    scheduled_tasks = list(iter_scheduled_tasks(task_tree))
+    try:
+        edited_pages = check_plan_freshness(
+            notion, config, collect_planned_versions(scheduled_tasks), planned_at=planned_at,
+            skip_threshold=current_app.config.get('FRESHNESS_SKIP_THRESHOLD', 50),
+            mirror_max_age_seconds=current_app.config.get('MIRROR_FRESHNESS_SECONDS', 60)
+        )
+    except CircuitOpenError:
+        # Notion 不可用时无法预检查，写入全部暂存到发件箱，恢复后按计划写入
+        print("🔌 Notion 熔断中，跳过写入前预检查")
+        edited_pages = {}
+    stale_tasks = []
+    for task in scheduled_tasks:
+        fresh_page = edited_pages.get(task['id'])
+        if fresh_page is not None and plan_inputs_changed(task, fresh_page, mapping):
+            stale_tasks.append({'id': task['id'], 'title': task.get('name') or task['id']})
+            continue
+        properties = build_task_time_properties(mapping, task['start_time'], task['end_time'], mark_scheduled)
+        enqueue_write(config.id, 'task_time', 'update', {'properties': properties},
+                      page_id=task['id'], operation_id=operation.id)
+    
+    for rest_info in rest_tasks_info:
+        enqueue_write(config.id, 'rest_task', 'create', build_rest_task_payload(config, mapping, rest_info),
+                      operation_id=operation.id)
+    
+    db.session.commit()
+    print(f"📮 排程 #{operation.id} 已记录 {operation.outbox_entries.count()} 条待写入操作")
+    
+    result_data = drain_schedule_operation(notion, operation, task_tree=task_tree, start_time=start_time)
+    result_data['stale_tasks'] = stale_tasks
+    return result_data
 
 def get_pending_tasks(config, notion, mapping):
     """
@@ -248,6 +653,9 @@ def process_task_delay(notion, config, mapping, delayed_task_id):
             # 步骤3：使用计算出的延期时长来更新父任务
                 if delay_duration is not None:
                     print(f"🍃 计算出的延期时长: {delay_duration}")
+                    # 被其他人修改过的冲突任务按最新时间重新计算（在我们自己写入之前检查）
+                    conflicting_tasks = refresh_conflicting_tasks(notion, config, mapping, conflicting_tasks)
+                    
                     # 更新父任务
                     parent_updates = update_parent_tasks_end_time(notion, config, mapping, delayed_task_id, delay_duration)
                     updated_tasks.extend(parent_updates)
@@ -265,13 +673,16 @@ def process_task_delay(notion, config, mapping, delayed_task_id):
                         delay_duration = timedelta(minutes=30)
                         parent_updates = update_parent_tasks_end_time(notion, config, mapping, delayed_task_id, delay_duration)
                         updated_tasks.extend(parent_updates)
-   
-                return {
-                    'success': True,
-                    'affected_tasks': len(updated_tasks),
-                    'updated_tasks': updated_tasks,
-                    'message': f'成功处理延期任务，共影响 {len(updated_tasks)} 个任务'
-                }
+        
+        # 没有冲突任务（或延期后仍不重叠）时只记录延期任务本身
+        deferred_count = sum(1 for task in updated_tasks if task.get('deferred'))
+        return {
+            'success': True,
+            'affected_tasks': len(updated_tasks),
+            'updated_tasks': updated_tasks,
+            'deferred_count': deferred_count,
+            'message': f'成功处理延期任务，共影响 {len(updated_tasks)} 个任务'
+        }
         
     except Exception as e:
         return {
@@ -310,8 +721,8 @@ def get_task_title(task, title_property):
             return title_prop['title'][0]['plain_text']
     return "未命名任务"
 
-def update_task_time_property(notion, task_id, timebox_property, start_time, end_time):
-    """更新任务的时间属性"""
+def build_time_property_update(timebox_property, start_time, end_time):
+    """构建更新任务时间属性的 properties"""
     def format_datetime_for_notion(dt):
         """将datetime对象格式化为Notion API需要的格式"""
         if dt is None:
@@ -324,7 +735,7 @@ def update_task_time_property(notion, task_id, timebox_property, start_time, end
     start_time_str = format_datetime_for_notion(start_time)
     end_time_str = format_datetime_for_notion(end_time)
     
-    properties_update = {
+    return {
         timebox_property: {
             "date": {
                 "start": start_time_str,
@@ -332,15 +743,32 @@ def update_task_time_property(notion, task_id, timebox_property, start_time, end
             }
         }
     }
-    print(f"🍃 更新任务时间属性: {properties_update}")
-    try:
-        notion.pages.update(
-            page_id=task_id,
-            properties=properties_update
-        )
-        print(f"🍃 更新任务时间属性成功: {task_id}")
-    except Exception as e:
-        print(f"Error updating task time property: {str(e)}")
+
+def write_delay_updates(notion, config, updates):
+    """
+    延期产生的时间写入经过发件箱：熔断打开时暂存为 deferred，Notion 恢复后与排程写入一起重放
+
+    Args:
+        updates: [(page_id, properties)]
+
+    Returns:
+        list: 各写入的状态（succeeded / deferred / failed），与 updates 顺序一致
+    """
+    entries = [
+        enqueue_write(config.id, 'delay_time', 'update', {'properties': properties}, page_id=page_id)
+        for page_id, properties in updates
+    ]
+    if not entries:
+        return []
+    db.session.commit()
+    drain_outbox(
+        notion, entries,
+        max_workers=bulk_write_workers(),
+        max_attempts=current_app.config.get('OUTBOX_MAX_ATTEMPTS', 3)
+    )
+    if any(entry.status == 'succeeded' for entry in entries) and not any(entry.status == 'deferred' for entry in entries):
+        resume_deferred_writes(config.id)
+    return [entry.status for entry in entries]
 
 def update_parent_tasks_end_time(notion, config, mapping, task_id, delay_duration):
     """逐层向上更新父任务的结束时间，使用延期时长"""
@@ -386,15 +814,20 @@ def update_parent_tasks_end_time(notion, config, mapping, task_id, delay_duratio
             new_parent_end_datetime = original_parent_end_datetime + delay_duration
 
             # 更新父任务的结束时间
-            update_task_time_property(notion, parent_id, timebox_start_property, parent_start_time, new_parent_end_datetime)
-            
-            updated_tasks.append({
-                'id': parent_id,
-                'title': get_task_title(parent_task, title_property),
-                'type': '父任务',
-                'old_end_time': parent_end_time,
-                'new_end_time': new_parent_end_datetime.isoformat()
-            })
+            properties_update = build_time_property_update(timebox_start_property, parent_start_time, new_parent_end_datetime)
+            print(f"🍃 更新任务时间属性: {properties_update}")
+            status, = write_delay_updates(notion, config, [(parent_id, properties_update)])
+            if status == 'failed':
+                print(f"Error updating task time property: {parent_id}")
+            else:
+                updated_tasks.append({
+                    'id': parent_id,
+                    'title': get_task_title(parent_task, title_property),
+                    'type': '父任务',
+                    'old_end_time': parent_end_time,
+                    'new_end_time': new_parent_end_datetime.isoformat(),
+                    'deferred': status == 'deferred'
+                })
             
             # 递归更新父任务的父任务，传递相同的延期时长
             parent_updates = update_parent_tasks_end_time(notion, config, mapping, parent_id, delay_duration)
@@ -471,7 +904,8 @@ def find_conflicting_tasks(notion, config, mapping, delayed_task):
                 'id': task['id'],
                 'title': get_task_title(task, title_property),
                 'start_time': task['properties'][timebox_start_property]['date']['start'],
-                'end_time': task['properties'][timebox_start_property]['date'].get('end')
+                'end_time': task['properties'][timebox_start_property]['date'].get('end'),
+                'last_edited_time': task.get('last_edited_time')
             })
         return conflicting_tasks
         
@@ -479,6 +913,45 @@ def find_conflicting_tasks(notion, config, mapping, delayed_task):
         print(f"Error finding conflicting tasks: {str(e)}")
         return []
 
+def refresh_conflicting_tasks(notion, config, mapping, conflicting_tasks):
+    """
+    写入前检查冲突任务是否在查询后被修改，被修改的任务按最新时间重新计算
+
+    Returns:
+        list: 需要调整的冲突任务（已关闭或不再有时间盒的任务被移除）
+    """
+    edited_pages = check_plan_freshness(
+        notion, config, collect_planned_versions(conflicting_tasks),
+        skip_threshold=current_app.config.get('FRESHNESS_SKIP_THRESHOLD', 50),
+        mirror_max_age_seconds=current_app.config.get('MIRROR_FRESHNESS_SECONDS', 60)
+    )
+    if not edited_pages:
+        return conflicting_tasks
+    
+    timebox_start_property = mapping.get('timebox_start_property')
+    status_property = mapping.get('status_property')
+    refreshed = []
+    for task in conflicting_tasks:
+        fresh_page = edited_pages.get(task['id'])
+        if fresh_page is None:
+            refreshed.append(task)
+            continue
+        
+        properties = fresh_page.get('properties', {})
+        status = ((properties.get(status_property) or {}).get('status') or {}).get('name', '')
+        date_value = (properties.get(timebox_start_property) or {}).get('date') or {}
+        if status in CLOSED_STATUSES or not date_value.get('start'):
+            print(f"🍃 冲突任务 {task['id']} 已关闭或清空时间，跳过调整")
+            continue
+        
+        refreshed.append(dict(
+            task,
+            start_time=date_value['start'],
+            end_time=date_value.get('end'),
+            last_edited_time=fresh_page.get('last_edited_time')
+        ))
+    return refreshed
+
 def adjust_conflicting_tasks(notion, config, mapping, conflicting_tasks, delay_duration):
     """调整冲突任务的时间，延期指定的时长"""
     updated_tasks = []
@@ -489,6 +962,7 @@ def adjust_conflicting_tasks(notion, config, mapping, conflicting_tasks, delay_d
         if not timebox_start_property:
             return updated_tasks
         
+        planned_updates = []
         for task in conflicting_tasks:
             try:
                 # 获取任务的当前时间
@@ -505,10 +979,7 @@ def adjust_conflicting_tasks(notion, config, mapping, conflicting_tasks, delay_d
                         original_end_datetime = parse_notion_datetime(original_end_time)
                         new_end_datetime = original_end_datetime + delay_duration
                     
-                    # 更新任务时间
-                    update_task_time_property(notion, task['id'], timebox_start_property, new_start_datetime, new_end_datetime)
-                    
-                    updated_tasks.append({
+                    planned_updates.append((task, {
                         'id': task['id'],
                         'title': task['title'],
                         'type': '冲突调整',
@@ -516,11 +987,21 @@ def adjust_conflicting_tasks(notion, config, mapping, conflicting_tasks, delay_d
                         'new_start_time': new_start_datetime.isoformat(),
                         'old_end_time': original_end_time,
                         'new_end_time': new_end_datetime.isoformat() if new_end_datetime else None
-                    })
+                    }, build_time_property_update(timebox_start_property, new_start_datetime, new_end_datetime)))
                     
             except Exception as e:
                 print(f"Error adjusting task {task['id']}: {str(e)}")
                 continue
+        
+        # 各冲突任务的写入相互独立，经发件箱按批量写入并发执行（并发数由调度器自适应调整）
+        statuses = write_delay_updates(notion, config, [
+            (task['id'], properties) for task, _, properties in planned_updates
+        ])
+        for (task, update_info, _), status in zip(planned_updates, statuses):
+            if status == 'failed':
+                print(f"Error adjusting task {task['id']}")
+                continue
+            updated_tasks.append(dict(update_info, deferred=status == 'deferred'))
     
     except Exception as e:
         print(f"Error adjusting conflicting tasks: {str(e)}")
@@ -529,13 +1010,288 @@ def adjust_conflicting_tasks(notion, config, mapping, conflicting_tasks, delay_d
 
 
 
+def round_time_to_5_minutes(dt):
+    """将时间向上取整到5分钟的倍数，保持时区信息"""
+    minutes = dt.minute
+    rounded_minutes = math.ceil(minutes / 5) * 5
+    
+    # 处理分钟数超过60的情况
+    if rounded_minutes >= 60:
+        dt = dt.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    else:
+        dt = dt.replace(minute=rounded_minutes, second=0, microsecond=0)
+    
+    return dt
+
+def count_scheduled_tasks(tasks):
+    """统计任务树中已排程的任务数"""
+    count = 0
+    for task in tasks:
+        if task.get('scheduled', False):
+            count += 1
+        if task.get('children'):
+            count += count_scheduled_tasks(task['children'])
+    return count
+
+def prepare_task_tree_for_json(tasks):
+    """将任务树中的datetime对象转换为字符串，便于JSON序列化"""
+    json_safe_tasks = []
+    for task in tasks:
+        json_task = task.copy()
+        
+        # 转换datetime对象为ISO字符串
+        if isinstance(json_task.get('start_time'), datetime):
+            json_task['start_time'] = json_task['start_time'].isoformat()
+        if isinstance(json_task.get('end_time'), datetime):
+            json_task['end_time'] = json_task['end_time'].isoformat()
+        
+        # 递归处理子任务
+        if json_task.get('children'):
+            json_task['children'] = prepare_task_tree_for_json(json_task['children'])
+        
+        json_safe_tasks.append(json_task)
+    
+    return json_safe_tasks
+
+# 定义工具函数，按照顺序按照叶节点和兄弟节点的开始和结束时间
+def restore_task_tree_from_json(tasks):
+    """prepare_task_tree_for_json 的逆操作：把开始/结束时间恢复为上海时区的datetime"""
+    restored = []
+    for task in tasks:
+        task = dict(task)
+        for key in ('start_time', 'end_time'):
+            if isinstance(task.get(key), str) and task[key]:
+                task[key] = localize_shanghai(datetime.fromisoformat(task[key]))
+        if task.get('children'):
+            task['children'] = restore_task_tree_from_json(task['children'])
+        restored.append(task)
+    return restored
+
+def schedule_task_tree(task_tree, start_time, continuous_work_minutes=0, rest_tasks_to_create=None, correction_factors=None):
+    """
+    递归地为任务树安排时间，让同级任务首尾相连，并自动插入休息时间
+
+    Args:
+        task_tree: 任务树列表
+        start_time: 开始时间
+        continuous_work_minutes: 持续工作时间（分钟），在递归调用间传递
+        rest_tasks_to_create: 用于收集需要创建的休息任务信息的列表
+        correction_factors: 按优先级的预估修正系数（为空时使用原始预估）
+
+    Returns:
+        tuple: (结束时间, 更新后的持续工作时间)
+    """
+    if rest_tasks_to_create is None:
+        rest_tasks_to_create = []
+
+    def round_up_to_5_minutes(minutes):
+        """向上取整到5的倍数，确保时间安排更加规整"""
+        if minutes <= 0:
+            return 5  # 最少5分钟
+        return math.ceil(minutes / 5) * 5
+
+    current_time = start_time
+
+    for task in task_tree:
+        if task.get('scheduled', False):
+            continue
+
+        # 如果有子任务，先安排子任务
+        if task.get('children') and len(task['children']) > 0:
+            # 子任务从当前时间开始，传递当前的持续工作时间
+            child_end_time, updated_work_minutes = schedule_task_tree(task['children'], current_time, continuous_work_minutes, rest_tasks_to_create, correction_factors)
+            # 父任务的时间跨度覆盖所有子任务
+            task['start_time'] = current_time
+            task['end_time'] = child_end_time
+            task['scheduled'] = True
+            current_time = child_end_time
+            continuous_work_minutes = updated_work_minutes
+        else:
+            # 叶子任务：直接安排时间，使用向上取整的时间
+            estimated_time = task['estimated_time']
+            if correction_factors:
+                # 分析模块依赖 numpy，用到时才导入
+                from services.analytics import corrected_estimate
+                estimated_time = corrected_estimate(estimated_time, task.get('priority'), correction_factors)
+            rounded_time = round_up_to_5_minutes(estimated_time)
+            # 取整前的计划时长，分析计划与实际偏差时扣除取整的部分
+            task['planned_minutes'] = estimated_time
+            task['start_time'] = current_time
+            task['end_time'] = current_time + timedelta(minutes=rounded_time)
+            task['scheduled'] = True
+            current_time = task['end_time']
+            # 更新持续工作时间
+            continuous_work_minutes += rounded_time
+
+            # 检查是否需要插入休息时间
+            if continuous_work_minutes > 45:
+
+                # 准备休息时间的开始和结束时间
+                rest_start_time = current_time
+                rest_end_time = current_time + timedelta(minutes=15)  # 15分钟休息
+
+                # 确定父任务ID（如果当前任务有父任务，则使用相同的父任务）
+                parent_task_id = None
+                if task.get('parent_tasks') and len(task['parent_tasks']) > 0:
+                    # parent_tasks是一个包含关系对象的列表，每个对象都有id字段
+                    parent_task_id = task['parent_tasks'][0].get('id')
+
+                # 获取当前任务的优先级
+                task_priority = task.get('priority', 'P3')
+
+                # 收集休息任务信息，不直接创建
+                rest_task_info = {
+                    'parent_task_id': parent_task_id,
+                    'priority': task_priority,
+                    'start_time': rest_start_time,
+                    'end_time': rest_end_time,
+                    'title': '🧘 休息时间',
+                    'estimated_time': 15
+                }
+                rest_tasks_to_create.append(rest_task_info)
+
+                # 更新current_time到休息结束时间
+                current_time = rest_end_time
+                # 重置持续工作时间计数器
+                continuous_work_minutes = 0
+
+    return current_time, continuous_work_minutes
+
+def plan_schedule(config, notion, mapping, start_time, apply_correction=False):
+    """
+    获取今天的任务树并从 start_time 开始排程（不写入 Notion）
+
+    Args:
+        config: 配置对象
+        notion: Notion 客户端
+        mapping: 属性映射字典
+        start_time: 排程起始时间（上海时区，已对齐到5分钟）
+        apply_correction: 是否根据历史计划与实际的偏差修正预估时间
+
+    Returns:
+        dict: task_tree, rest_tasks_info, start_time, end_time, total_work_minutes,
+              planned_at（读取任务前的 UTC 时间，写入前的修改检查以此为起点）
+    """
+    planned_at = datetime.now(pytz.utc)
+    task_tree = load_task_tree(config, notion, mapping)
+    
+    correction_factors = {}
+    if apply_correction:
+        try:
+            from services.analytics import get_correction_factors
+            sync_pages(notion, config, mapping)
+            correction_factors = get_correction_factors(config.id)
+            print(f"📈 预估修正系数: {correction_factors}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ 计算预估修正系数失败，使用原始预估: {str(e)}")
+    
+    # 准备休息任务收集列表
+    rest_tasks_info = []
+    
+    # 执行排程
+    final_end_time, total_work_minutes = schedule_task_tree(
+        task_tree, start_time, 0, rest_tasks_info, correction_factors
+    )
+    print(f"🎯 排程完成，总工作时间: {total_work_minutes} 分钟")
+    
+    if rest_tasks_info:
+        print(f"🧘 收集到 {len(rest_tasks_info)} 个休息任务")
+    
+    return {
+        'task_tree': task_tree,
+        'rest_tasks_info': rest_tasks_info,
+        'start_time': start_time,
+        'end_time': final_end_time,
+        'total_work_minutes': total_work_minutes,
+        'planned_at': planned_at
+    }
+
+def load_task_tree(config, notion, mapping):
+    """
+    获取今天待排程的任务树：优先使用预热的任务树（确认数据库之后没有修改），
+    否则现场查询并构建
+    """
+    task_tree, built_at = warm_tree_cache.take(config.id)
+    if task_tree is not None:
+        try:
+            if not database_changed_since(notion, config.database_id, built_at):
+                print("🔥 使用预热的任务树")
+                return task_tree
+        except Exception as e:
+            print(f"⚠️ 检查预热任务树失败: {str(e)}")
+        warm_tree_cache.invalidate(config.id)
+    
+    # 获得待排序的根任务列表
+    pending_root_tasks = get_pending_tasks(config, notion, mapping)
+    
+    # 构建任务树（格式化 + 递归子任务）
+    return build_task_tree_with_formatting(notion, config, mapping, pending_root_tasks)
+
+def warm_up_config(config):
+    """预热单个配置：连接池、数据库结构、页面镜像与搜索索引、今天的任务树"""
+    started = time.perf_counter()
+    notion = create_notion_client(config.token)
+    if current_app.config.get('NOTION_ASYNC_ENABLED'):
+        async_runner.warm(config.token)
+    notion.retrieve_schema(config.database_id, refresh=True)
+    
+    mapping = config.mapping
+    # 全量同步：增量同步看不到在 Notion 中归档或删除的页面，预热时一并清理
+    sync_pages(notion, config, mapping, full=True)
+    get_search_index(config.id, force_refresh=True)
+    
+    # 构建开始前记录时间，构建期间的修改会让预热的任务树失效
+    built_at = datetime.utcnow()
+    task_tree = build_task_tree_with_formatting(
+        notion, config, mapping, get_pending_tasks(config, notion, mapping)
+    )
+    warm_tree_cache.put(config.id, task_tree, built_at)
+    print(f"🔥 配置 #{config.id} 预热完成: {len(task_tree)} 个根任务，耗时 {(time.perf_counter() - started) * 1000:.0f} ms")
+
+def warm_up_all():
+    """预热所有完成配置的工作区（单个工作区失败不影响其他工作区），并重放重启前暂存的写入"""
+    app = current_app._get_current_object()
+    ensure_database_schema(app)
+    replay_deferred_writes(app)
+    configs = [
+        config for config in config_cache.all()
+        if config.database_id and config.is_mapping_complete_for_scheduling()
+    ]
+    if not configs:
+        print("ℹ️ 没有完成配置的数据库，跳过预热")
+        return
+    for config in configs:
+        try:
+            warm_up_config(config)
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ 配置 #{config.id} 预热失败: {str(e)}")
+
+def start_warmup(app, use_reloader=False):
+    """
+    启动后台预热（启动时一次，之后按 WARMUP_TIMES 每天运行）
+
+    使用调试重载器时只在实际运行应用的子进程中启动
+    """
+    if not app.config.get('WARMUP_ENABLED'):
+        return False
+    if use_reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return False
+    return warmup_scheduler.start(
+        app, warm_up_all,
+        parse_warmup_times(app.config.get('WARMUP_TIMES')),
+        run_on_startup=app.config.get('WARMUP_ON_STARTUP', True)
+    )
+
 # 装饰器工具：简化配置检查和数据库连接
+# 配置来自进程内缓存（只读快照 + 预先校验的只读映射），热路径上不查询数据库
 
 def require_config(f):
     """装饰器：要求存在有效的配置"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        config = CalendarDatabaseConfig.get_current_config()
+        config = config_cache.current()
         if not config:
             if request.is_json:
                 return jsonify({"error": "No configuration found"}), 400
@@ -545,11 +1301,51 @@ def require_config(f):
         return f(config, *args, **kwargs)
     return decorated_function
 
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+
+def is_admin_request():
+    """
+    运行时诊断（剖析、指标）的访问检查：配置了 ADMIN_TOKEN 时要求请求头 X-Admin-Token
+    或 admin_token 参数与之一致（验证后记在会话中），未配置时只允许本机访问
+    """
+    from flask import session
+    admin_token = current_app.config.get('ADMIN_TOKEN')
+    if not admin_token:
+        return request.remote_addr in LOCAL_ADDRESSES
+    # 会话中只保存令牌的摘要，更换 ADMIN_TOKEN 后旧会话随之失效
+    token_digest = hashlib.sha256(admin_token.encode('utf-8')).hexdigest()
+    if hmac.compare_digest(session.get('admin_token_digest', ''), token_digest):
+        return True
+    supplied = request.headers.get('X-Admin-Token') or request.args.get('admin_token') or ''
+    if supplied and hmac.compare_digest(supplied, admin_token):
+        session['admin_token_digest'] = token_digest
+        return True
+    return False
+
+def require_admin(f):
+    """装饰器：只允许管理员访问（见 is_admin_request）"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_admin_request():
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+def require_profiling(f):
+    """装饰器：剖析页面要求 PROFILING_ENABLED 且为管理员访问，未启用时返回 404"""
+    @wraps(f)
+    @require_admin
+    def decorated_function(*args, **kwargs):
+        if not profiler.enabled:
+            abort(404)
+        return f(*args, **kwargs)
+    return decorated_function
+
 def require_database_config(f):
     """装饰器：要求存在有效的配置和数据库设置"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        config = CalendarDatabaseConfig.get_current_config()
+        config = config_cache.current()
         if not config:
             if request.is_json:
                 return jsonify({"error": "No configuration found"}), 400
@@ -569,7 +1365,7 @@ def require_notion_client(f):
     """装饰器：要求配置存在并自动创建Notion客户端"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        config = CalendarDatabaseConfig.get_current_config()
+        config = config_cache.current()
         if not config:
             if request.is_json:
                 return jsonify({"error": "No configuration found"}), 400
@@ -583,7 +1379,7 @@ def require_notion_client(f):
             return redirect(url_for('connect'))
         
         try:
-            notion = NotionClient(auth=config.token)
+            notion = create_notion_client(config.token)
             return f(config, notion, *args, **kwargs)
         except Exception as e:
             if request.is_json:
@@ -596,7 +1392,7 @@ def require_full_setup(f):
     """装饰器：要求完整设置（配置+数据库+客户端+映射）"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        config = CalendarDatabaseConfig.get_current_config()
+        config = config_cache.current()
         if not config:
             if request.is_json:
                 return jsonify({"error": "No configuration found"}), 400
@@ -610,8 +1406,8 @@ def require_full_setup(f):
             return redirect(url_for('connect'))
         
         try:
-            notion = NotionClient(auth=config.token)
-            mapping = config.get_property_mapping()
+            notion = create_notion_client(config.token)
+            mapping = config.mapping
             return f(config, notion, mapping, *args, **kwargs)
         except Exception as e:
             if request.is_json:
@@ -624,7 +1420,7 @@ def require_mapping_setup(f):
     """装饰器：要求排程功能所需的完整映射配置"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        config = CalendarDatabaseConfig.get_current_config()
+        config = config_cache.current()
         if not config:
             flash('请先连接 Notion', 'error')
             return redirect(url_for('connect'))
@@ -638,15 +1434,39 @@ def require_mapping_setup(f):
             return redirect(url_for('property_mapping'))
         
         try:
-            notion = NotionClient(auth=config.token)
-            mapping = config.get_property_mapping()
+            notion = create_notion_client(config.token)
+            mapping = config.mapping
             return f(config, notion, mapping, *args, **kwargs)
         except Exception as e:
             flash(f'连接 Notion 失败: {str(e)}', 'error')
             return redirect(url_for('connect'))
     return decorated_function
 
+_schema_lock = threading.Lock()
+
+def running_flask_cli():
+    """当前进程是否由 flask 命令行启动"""
+    program = sys.argv[0] if sys.argv else ''
+    return (
+        os.path.basename(program) in ('flask', 'flask.exe')
+        or program.endswith(os.path.join('flask', '__main__.py'))
+    )
+
+def ensure_database_schema(app):
+    """首次使用时创建缺失的表（每个应用只执行一次）"""
+    if app.extensions.get('database_schema_ready'):
+        return
+    with _schema_lock:
+        if app.extensions.get('database_schema_ready'):
+            return
+        started = time.perf_counter()
+        with app.app_context():
+            db.create_all()
+        app.extensions['database_schema_ready'] = True
+        startup_timer.phases.append(('创建数据库表', (time.perf_counter() - started) * 1000))
+
 def create_app(config_class=Config):
+    startup_timer.mark('导入 app 模块其余部分')
     app = Flask(__name__)
     app.config.from_object(config_class)
     
@@ -654,25 +1474,108 @@ def create_app(config_class=Config):
     if not app.config.get('SECRET_KEY'):
         app.config['SECRET_KEY'] = 'your-secret-key-for-session-support'
     
+    # Notion 调用的限速与优先级参数（每个令牌独立计算）
+    async_runner.configure(
+        rate_per_second=app.config.get('NOTION_RATE_LIMIT_PER_SECOND'),
+        burst=app.config.get('NOTION_RATE_LIMIT_BURST'),
+        max_concurrency=app.config.get('NOTION_MAX_CONCURRENCY'),
+        weights=parse_class_settings(app.config.get('NOTION_PRIORITY_WEIGHTS'), DEFAULT_WEIGHTS),
+        targets_ms=parse_class_settings(app.config.get('NOTION_PRIORITY_TARGETS_MS'), DEFAULT_TARGETS_MS),
+        bulk_adaptive={
+            'min_limit': app.config.get('BULK_WRITE_MIN_CONCURRENCY', 1),
+            'max_limit': app.config.get('BULK_WRITE_MAX_CONCURRENCY', 8),
+            'latency_target_ms': app.config.get('BULK_WRITE_LATENCY_TARGET_MS', 1500),
+        } if app.config.get('BULK_WRITE_ADAPTIVE_ENABLED') else {},
+        base_url=app.config.get('NOTION_API_BASE_URL', '')
+    )
+    
+    config_cache.ttl_seconds = app.config.get('CONFIG_CACHE_TTL_SECONDS', 60)
+    token_status_cache.ttl_seconds = app.config.get('TOKEN_STATUS_TTL_SECONDS', 300)
+    database_directory.ttl_seconds = app.config.get('DATABASE_LIST_TTL_SECONDS', 300)
+    read_flight.enabled = app.config.get('READ_COALESCING_ENABLED', True)
+    circuit_breakers.configure(
+        enabled=app.config.get('CIRCUIT_BREAKER_ENABLED', True),
+        failure_threshold=app.config.get('CIRCUIT_FAILURE_THRESHOLD'),
+        open_seconds=app.config.get('CIRCUIT_OPEN_SECONDS'),
+        max_open_seconds=app.config.get('CIRCUIT_MAX_OPEN_SECONDS'),
+        slow_call_ms=app.config.get('CIRCUIT_SLOW_CALL_MS')
+    )
+    circuit_breakers.add_listener('replay_deferred_writes', lambda key: replay_deferred_writes(app, key))
+    
+    startup_timer.mark('创建 Flask 与读取配置')
+    
+    # 压缩、快速 JSON 与请求计时（先注册，压缩在其他 after_request 钩子之后执行）
+    init_response_pipeline(app)
+    # 按需剖析与慢请求捕获（PROFILING_ENABLED），在请求计时之后开始
+    init_profiling(app, header_allowed=is_admin_request)
+    
     # Initialize extensions
     db.init_app(app)
-    migrate = Migrate(app, db)
+    # Flask-Migrate 会导入 alembic，只在 flask 命令行（flask db ...）或显式要求时初始化
+    if app.config.get('MIGRATE_ON_INIT') or running_flask_cli():
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    startup_timer.mark('初始化扩展')
+    
+    # 数据表在第一个请求（或预热）时创建，导入应用本身不访问数据库
+    if app.config.get('CREATE_SCHEMA_ON_STARTUP'):
+        ensure_database_schema(app)
     
-    with app.app_context():
-        db.create_all()
+    @app.before_request
+    def prepare_database_schema():
+        ensure_database_schema(app)
     
     # Add template context processors
     @app.context_processor
     def utility_processor():
         return {
             'now': datetime.now,
-            'format_datetime': lambda dt, format='%Y-%m-%d %H:%M:%S': dt.strftime(format) if dt else ''
+            'format_datetime': lambda dt, format='%Y-%m-%d %H:%M:%S': dt.strftime(format) if dt else '',
+            # 导航栏的工作区切换（只在模板用到时查询）
+            'workspaces': config_cache.all,
+            'current_workspace': config_cache.current,
+            # 当前工作区的 Notion 熔断状态（页面顶部横幅）
+            'notion_circuit': current_circuit_state
         }
     
+    def current_circuit_state():
+        config = config_cache.current()
+        return circuit_breakers.state(config.token) if config else None
+    
+    @app.errorhandler(CircuitOpenError)
+    def handle_circuit_open(error):
+        """未被路由捕获的熔断错误：接口返回 503，页面回到上一页并提示"""
+        if request.path.startswith('/api/'):
+            response = jsonify({'success': False, 'error': str(error), 'circuit_open': True})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(error.retry_after)
+            return response
+        flash(f'🔌 {str(error)}', 'error')
+        return redirect(url_for('index'))
+    
+    @app.after_request
+    def record_route(response):
+        """录制模式下记录页面请求的顺序（回放脚本按这个顺序重放整段会话）"""
+        cassette = current_cassette()
+        if cassette is None or cassette.mode != 'record':
+            return response
+        if request.endpoint in (None, 'static', 'api_metrics'):
+            return response
+        config = config_cache.current()
+        if config:
+            cassette.record_config(config)
+        started = g.get('request_started_at')
+        cassette.record_route(
+            request.method, request.path, request.args.to_dict(flat=False),
+            request.form.to_dict(flat=False), response.status_code,
+            (time.perf_counter() - started) * 1000 if started else 0.0
+        )
+        return response
+    
     @app.route('/')
     def index():
         # Check if there's an active configuration
-        config = CalendarDatabaseConfig.get_current_config()
+        config = config_cache.current()
         if config:
             return render_template('index.html', config=config)
         return redirect(url_for('connect'))
@@ -697,26 +1600,19 @@ def create_app(config_class=Config):
             integration_status['has_database'] = bool(current_config.database_id)
             integration_status['last_updated'] = current_config.updated_at
             
-            # 验证token是否仍然有效
-            try:
-                notion = NotionClient(auth=current_config.token)
-                response = notion.search(
-                    filter={
-                        "value": "database",
-                        "property": "object"
-                    }
-                )
-                if 'results' in response:
-                    integration_status['token_valid'] = True
-                    print("【debug】: Token 有效")
-            except Exception as e:
-                integration_status['token_valid'] = False
-                integration_status['error'] = str(e)
+            # 令牌状态使用缓存，过期时在后台刷新，页面不等待 Notion
+            token_status = get_token_status(current_config.token)
+            integration_status['token_valid'] = bool(token_status['valid'])
+            integration_status['token_checking'] = token_status['checking']
+            if token_status['error']:
+                integration_status['error'] = token_status['error']
         
         if request.method == 'POST':
             # 处理完整配置提交（token + database_id）
             token = request.form.get('token')
             database_id = request.form.get('database_id')
+            # 勾选"添加为新工作区"时保留当前配置，新建一个工作区
+            add_workspace = request.form.get('new_workspace') == 'true'
             
             if not token:
                 flash('请提供有效的 Notion API token', 'error')
@@ -728,7 +1624,7 @@ def create_app(config_class=Config):
             
             try:
                 # 验证token和数据库
-                notion = NotionClient(auth=token)
+                notion = create_notion_client(token)
                 
                 # 先验证token
                 db_list_response = notion.search(
@@ -748,26 +1644,32 @@ def create_app(config_class=Config):
                     return redirect(url_for('connect'))
                 
                 # 保存完整配置
-                if current_config:
+                if current_config and not add_workspace:
                     # 更新现有配置
                     current_config.token = token
                     current_config.database_id = database_id
                     current_config.updated_at = datetime.utcnow()
                     db.session.commit()
+                    config_cache.bump()
+                    token_status_cache.record(token, True)
                     flash('配置已成功更新！', 'success')
                 else:
-                    # 创建新配置
+                    # 创建新配置（新工作区），并切换到它
                     config = CalendarDatabaseConfig(
                         token=token,
                         database_id=database_id
                     )
                     db.session.add(config)
                     db.session.commit()
+                    config_cache.bump()
+                    token_status_cache.record(token, True)
+                    remember_selection(config.id)
                     flash('成功连接到 Notion 并配置数据库！', 'success')
                 
                 return redirect(url_for('connect'))
                 
             except Exception as e:
+                db.session.rollback()
                 flash(f'配置错误: {str(e)}', 'error')
         
         return render_template('connect.html', 
@@ -785,12 +1687,10 @@ def create_app(config_class=Config):
                 flash('请选择要处理的延期任务', 'error')
                 return redirect(url_for('delay'))
             
-            try:
-                # 执行延期操作
+            def run_delay():
+                """执行延期操作并保存操作记录"""
                 result = process_task_delay(notion, config, mapping, task_id)
-                
                 if result['success']:
-                    # 保存操作记录
                     operation = TaskOperation(
                         config_id=config.id,
                         database_id=config.database_id,
@@ -801,12 +1701,24 @@ def create_app(config_class=Config):
                     )
                     db.session.add(operation)
                     db.session.commit()
-                    
+                return result
+            
+            try:
+                # 同一任务的重复提交共享结果，同一配置的其他写操作排队执行
+                result, shared = schedule_flight.run(config.id, f'delay:{task_id}', run_delay)
+                
+                if result['success']:
+                    if shared:
+                        flash('检测到重复提交，已显示进行中操作的结果', 'info')
+                    if result.get('deferred_count'):
+                        flash(f'🔌 Notion 暂时不可用，{result["deferred_count"]} 个时间调整已保存，恢复后自动写入', 'warning')
                     # 返回结果页面
-                    return render_template('delay_result.html', result=result, config=config)
+                    return stream_page('delay_result.html', result=result, config=config)
                 else:
                     flash(f'延期操作失败: {result.get("error", "未知错误")}', 'error')
                     
+            except SingleFlightBusy as e:
+                flash(f'⏳ {str(e)}', 'warning')
             except ValueError as e:
                 flash(f'时间格式错误: {str(e)}', 'error')
             except Exception as e:
@@ -818,7 +1730,7 @@ def create_app(config_class=Config):
     @require_notion_client
     def get_property_options(config, notion, property_name):
         try:
-            db_info = notion.databases.retrieve(database_id=config.database_id)
+            db_info = notion.retrieve_schema(config.database_id)
             properties = db_info.get('properties', {})
             
             prop_info = properties.get(property_name)
@@ -846,7 +1758,7 @@ def create_app(config_class=Config):
         # 获取数据库的所有属性
         properties = {}
         try:
-            db_info = notion.databases.retrieve(database_id=config.database_id)
+            db_info = notion.retrieve_schema(config.database_id, refresh=True)
             if 'properties' in db_info:
                 properties = db_info['properties']
         except Exception as e:
@@ -875,8 +1787,8 @@ def create_app(config_class=Config):
                 mapping_to_save['schedule_status_todo_value'] = form_data.get('schedule_status_todo_value')
                 mapping_to_save['schedule_status_done_value'] = form_data.get('schedule_status_done_value')
 
-                # 使用 set_property_mapping 一次性完整更新
-                config.set_property_mapping(mapping_to_save)
+                # 使用 set_property_mapping 一次性完整更新（config 是只读快照，写入 ORM 对象）
+                config.model().set_property_mapping(mapping_to_save)
                 
                 db.session.commit()
                 flash('属性映射配置成功保存!', 'success')
@@ -951,7 +1863,7 @@ def create_app(config_class=Config):
     @require_notion_client
     def api_database_property_options(config, notion, property_id):
         try:
-            db_info = notion.databases.retrieve(database_id=config.database_id)
+            db_info = notion.retrieve_schema(config.database_id)
             properties = db_info.get('properties', {})
             
             # Find property by ID by iterating over the dict's values
@@ -1002,12 +1914,6 @@ def create_app(config_class=Config):
     @require_mapping_setup
     def schedule_tasks(config, notion, mapping):
         try:
-            # 获得待排序的根任务列表
-            pending_root_tasks = get_pending_tasks(config, notion, mapping)
-            
-            # 构建任务树（格式化 + 递归子任务）
-            task_tree = build_task_tree_with_formatting(notion, config, mapping, pending_root_tasks)
-            
             # 开始排程
             # 初始化日程安排的时间游标
             start_time_str = request.form.get('start_time')
@@ -1023,19 +1929,6 @@ def create_app(config_class=Config):
                 raw_start_time = shanghai_tz.localize(raw_start_time_naive)
                 
                 # 将用户输入的时间也对齐到5分钟倍数
-                def round_time_to_5_minutes(dt):
-                    """将时间向上取整到5分钟的倍数，保持时区信息"""
-                    minutes = dt.minute
-                    rounded_minutes = math.ceil(minutes / 5) * 5
-                    
-                    # 处理分钟数超过60的情况
-                    if rounded_minutes >= 60:
-                        dt = dt.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-                    else:
-                        dt = dt.replace(minute=rounded_minutes, second=0, microsecond=0)
-                    
-                    return dt
-                
                 start_time = round_time_to_5_minutes(raw_start_time)
                 # 如果时间被调整了，给用户一个友好提示
                 if start_time != raw_start_time:
@@ -1047,180 +1940,17 @@ def create_app(config_class=Config):
                 flash('无效的起始时间格式', 'error')
                 return redirect(url_for('schedule'))
             
-            # 工具函数，给定page ID 和 开始、结束时间，调用 notion SDK，更新任务的开始和结束时间
-            def update_task_time(page_id, start_time, end_time):
-                """
-                更新任务的开始和结束时间到Notion
-                
-                Args:
-                    page_id: Notion页面ID
-                    start_time: 开始时间 (datetime对象)
-                    end_time: 结束时间 (datetime对象)
-                
-                Returns:
-                    bool: 更新是否成功
-                """
-                try:
-                    timebox_start_property_name = mapping.get('timebox_start_property')
-                    timebox_end_property_name = mapping.get('timebox_end_property')
-                    schedule_status_property_name = mapping.get('schedule_status_property')
-                    schedule_status_done_value = mapping.get('schedule_status_done_value')
-
-                    # 转换为ISO格式字符串
-                    start_time_iso = start_time.isoformat()
-                    end_time_iso = end_time.isoformat()
-                    
-                    # 如果开始和结束时间是同一个字段，就只更新一个
-                    if timebox_start_property_name == timebox_end_property_name:
-                        notion.pages.update(
-                            page_id=page_id, 
-                            properties={
-                                timebox_start_property_name: {
-                                    'date': {
-                                        'start': start_time_iso,
-                                        'end': end_time_iso
-                                    }
-                                },
-                                schedule_status_property_name: {
-                                    'select': {
-                                        'name': schedule_status_done_value
-                                    }
-                                }
-                            }
-                        )
-                    else:
-                        # 分别更新开始和结束时间字段
-                        properties_to_update = {
-                            schedule_status_property_name: {
-                                'select': {
-                                    'name': schedule_status_done_value
-                                }
-                            }
-                        }
-                        
-                        if timebox_start_property_name:
-                            properties_to_update[timebox_start_property_name] = {
-                                'date': {
-                                    'start': start_time_iso
-                                }
-                            }
-                        
-                        if timebox_end_property_name:
-                            properties_to_update[timebox_end_property_name] = {
-                                'date': {
-                                    'start': end_time_iso
-                                }
-                            }
-                        
-                        if properties_to_update:
-                            notion.pages.update(
-                                page_id=page_id,
-                                properties=properties_to_update
-                            )
-                    
-                    return True
-                    
-                except Exception as e:
-                    print(f"❌ 更新任务 {page_id} 时间失败: {str(e)}")
-                    return False
-
-            # 定义工具函数，按照顺序按照叶节点和兄弟节点的开始和结束时间
-            def schedule_task_tree(task_tree, start_time, continuous_work_minutes=0, rest_tasks_to_create=None):
-                """
-                递归地为任务树安排时间，让同级任务首尾相连，并自动插入休息时间
-                
-                Args:
-                    task_tree: 任务树列表
-                    start_time: 开始时间
-                    continuous_work_minutes: 持续工作时间（分钟），在递归调用间传递
-                    rest_tasks_to_create: 用于收集需要创建的休息任务信息的列表
-                    
-                Returns:
-                    tuple: (结束时间, 更新后的持续工作时间)
-                """
-                if rest_tasks_to_create is None:
-                    rest_tasks_to_create = []
-                
-                def round_up_to_5_minutes(minutes):
-                    """向上取整到5的倍数，确保时间安排更加规整"""
-                    if minutes <= 0:
-                        return 5  # 最少5分钟
-                    return math.ceil(minutes / 5) * 5
-                
-                current_time = start_time
-                
-                for task in task_tree:
-                    if task.get('scheduled', False):
-                        continue
-                    
-                    # 如果有子任务，先安排子任务
-                    if task.get('children') and len(task['children']) > 0:
-                        # 子任务从当前时间开始，传递当前的持续工作时间
-                        child_end_time, updated_work_minutes = schedule_task_tree(task['children'], current_time, continuous_work_minutes, rest_tasks_to_create)
-                        # 父任务的时间跨度覆盖所有子任务
-                        task['start_time'] = current_time
-                        task['end_time'] = child_end_time
-                        task['scheduled'] = True
-                        current_time = child_end_time
-                        continuous_work_minutes = updated_work_minutes
-                    else:
-                        # 叶子任务：直接安排时间，使用向上取整的时间
-                        estimated_time = task['estimated_time']
-                        rounded_time = round_up_to_5_minutes(estimated_time)
-                        task['start_time'] = current_time
-                        task['end_time'] = current_time + timedelta(minutes=rounded_time)
-                        task['scheduled'] = True
-                        current_time = task['end_time']
-                        # 更新持续工作时间
-                        continuous_work_minutes += rounded_time
-                        
-                        # 检查是否需要插入休息时间
-                        if continuous_work_minutes > 45:
-                            
-                            # 准备休息时间的开始和结束时间
-                            rest_start_time = current_time
-                            rest_end_time = current_time + timedelta(minutes=15)  # 15分钟休息
-                            
-                            # 确定父任务ID（如果当前任务有父任务，则使用相同的父任务）
-                            parent_task_id = None
-                            if task.get('parent_tasks') and len(task['parent_tasks']) > 0:
-                                # parent_tasks是一个包含关系对象的列表，每个对象都有id字段
-                                parent_task_id = task['parent_tasks'][0].get('id')
-                            
-                            # 获取当前任务的优先级
-                            task_priority = task.get('priority', 'P3')
-                            
-                            # 收集休息任务信息，不直接创建
-                            rest_task_info = {
-                                'parent_task_id': parent_task_id,
-                                'priority': task_priority,
-                                'start_time': rest_start_time,
-                                'end_time': rest_end_time,
-                                'title': '🧘 休息时间',
-                                'estimated_time': 15
-                            }
-                            rest_tasks_to_create.append(rest_task_info)
-                            
-                            # 更新current_time到休息结束时间
-                            current_time = rest_end_time
-                            # 重置持续工作时间计数器
-                            continuous_work_minutes = 0
-                                        
-                return current_time, continuous_work_minutes
+            # 获取任务树（优先使用预热数据）并排程，可选按历史偏差修正预估时间
+            plan = plan_schedule(
+                config, notion, mapping, start_time,
+                apply_correction=bool(request.form.get('apply_estimate_correction'))
+            )
+            task_tree = plan['task_tree']
+            rest_tasks_info = plan['rest_tasks_info']
             
             # 检查是否是预览模式
             is_preview = request.form.get('preview') == 'true'
             
-            # 准备休息任务收集列表
-            rest_tasks_info = []
-            
-            # 执行排程
-            final_end_time, total_work_minutes = schedule_task_tree(task_tree, start_time, 0, rest_tasks_info)
-            print(f"🎯 排程完成，总工作时间: {total_work_minutes} 分钟")
-            
-            if rest_tasks_info:
-                print(f"🧘 收集到 {len(rest_tasks_info)} 个休息任务")
-            
             if is_preview:
                 # 预览模式：只返回排程结果，不更新Notion
                 # 将任务树数据存储到session中，供确认时使用
@@ -1233,234 +1963,70 @@ def create_app(config_class=Config):
                     'task_tree': task_tree,
                     'start_time': start_time.isoformat(),
                     'config_id': config.id,
-                    'rest_tasks_info': rest_tasks_info
+                    'rest_tasks_info': rest_tasks_info,
+                    'planned_at': plan['planned_at'].isoformat()
                 }
                 serialized_data = base64.b64encode(pickle.dumps(task_tree_data)).decode('utf-8')
                 session['schedule_preview'] = serialized_data
                 
                 # 统计信息
-                def count_tasks(tasks):
-                    count = 0
-                    for task in tasks:
-                        if task.get('scheduled', False):
-                            count += 1
-                        if task.get('children'):
-                            count += count_tasks(task['children'])
-                    return count
-                
-                total_tasks = count_tasks(task_tree)
-                
-                # 为JavaScript准备JSON安全的任务树数据
-                def prepare_task_tree_for_json(tasks):
-                    """将任务树中的datetime对象转换为字符串，便于JSON序列化"""
-                    json_safe_tasks = []
-                    for task in tasks:
-                        json_task = task.copy()
-                        
-                        # 转换datetime对象为ISO字符串
-                        if isinstance(json_task.get('start_time'), datetime):
-                            json_task['start_time'] = json_task['start_time'].isoformat()
-                        if isinstance(json_task.get('end_time'), datetime):
-                            json_task['end_time'] = json_task['end_time'].isoformat()
-                        
-                        # 递归处理子任务
-                        if json_task.get('children'):
-                            json_task['children'] = prepare_task_tree_for_json(json_task['children'])
-                        
-                        json_safe_tasks.append(json_task)
-                    
-                    return json_safe_tasks
+                total_tasks = count_scheduled_tasks(task_tree)
                 
-                json_safe_task_tree = prepare_task_tree_for_json(task_tree)
+                # 页面只包含汇总信息，任务树由预览接口按层级懒加载
+                preview_id, summary = preview_store.put(
+                    config.id, task_tree, rest_tasks_info, start_time, total_tasks
+                )
+                session['schedule_preview_id'] = preview_id
                 
                 # 渲染预览页面
-                return render_template('schedule_preview.html', 
-                                     config=config,
-                                     task_tree=task_tree,
-                                     json_task_tree=json_safe_task_tree,
-                                     start_time=start_time,
-                                     total_tasks=total_tasks,
-                                     rest_tasks_count=len(rest_tasks_info),
-                                     rest_tasks_info=rest_tasks_info)
+                return stream_page('schedule_preview.html', 
+                                 config=config,
+                                 preview_id=preview_id,
+                                 summary=summary,
+                                 start_time=start_time,
+                                 total_tasks=total_tasks,
+                                 rest_tasks_count=len(rest_tasks_info))
             else:
                 # 确认模式：执行实际的Notion更新
-                # 删除当天的所有休息任务
-                delete_today_rest_tasks(notion, config, mapping)
-                
-                # 定义创建休息任务的函数
-                def create_rest_task(rest_task_info):
-                    """在Notion中创建休息任务"""
-                    try:
-                        # 准备休息任务的属性
-                        properties = {}
-                        
-                        # 设置标题
-                        title_property = mapping.get('title_property')
-                        if title_property:
-                            properties[title_property] = {
-                                'title': [
-                                    {
-                                        'text': {
-                                            'content': rest_task_info['title']
-                                        }
-                                    }
-                                ]
-                            }
-                        
-                        # 设置优先级
-                        priority_property = mapping.get('priority_property')
-                        if priority_property and rest_task_info.get('priority'):
-                            properties[priority_property] = {
-                                'select': {
-                                    'name': rest_task_info['priority']
-                                }
-                            }
-                        
-                        # 设置父任务关系（只有在有父任务ID时才设置）
-                        parent_task_property = mapping.get('parent_task_property')
-                        if parent_task_property and rest_task_info.get('parent_task_id'):
-                            properties[parent_task_property] = {
-                                'relation': [
-                                    {
-                                        'id': rest_task_info['parent_task_id']
-                                    }
-                                ]
-                            }
-                        
-                        # 设置预估时间
-                        estimated_time_property = mapping.get('estimated_time_property')
-                        if estimated_time_property:
-                            properties[estimated_time_property] = {
-                                'number': rest_task_info.get('estimated_time', 15)
-                            }
-                        
-                        # 设置时间范围
-                        timebox_start_property = mapping.get('timebox_start_property')
-                        timebox_end_property = mapping.get('timebox_end_property')
-                        
-                        # 确保时间带有时区信息
-                        shanghai_tz = pytz.timezone('Asia/Shanghai')
-                        rest_start_time = rest_task_info['start_time']
-                        rest_end_time = rest_task_info['end_time']
-                        
-                        if rest_start_time.tzinfo is None:
-                            rest_start_time = shanghai_tz.localize(rest_start_time)
-                        if rest_end_time.tzinfo is None:
-                            rest_end_time = shanghai_tz.localize(rest_end_time)
-                        
-                        # 如果开始和结束时间是同一个字段
-                        if timebox_start_property == timebox_end_property and timebox_start_property:
-                            properties[timebox_start_property] = {
-                                'date': {
-                                    'start': rest_start_time.isoformat(),
-                                    'end': rest_end_time.isoformat()
-                                }
-                            }
-                        else:
-                            # 分别设置开始和结束时间
-                            if timebox_start_property:
-                                properties[timebox_start_property] = {
-                                    'date': {
-                                        'start': rest_start_time.isoformat()
-                                    }
-                                }
-                            if timebox_end_property:
-                                properties[timebox_end_property] = {
-                                    'date': {
-                                        'start': rest_end_time.isoformat()
-                                    }
-                                }
-                        
-                        # 创建休息任务页面
-                        response = notion.pages.create(
-                            parent={'database_id': config.database_id},
-                            properties=properties
-                        )
-                        
-                        print(f"✅ 成功创建休息任务: {response.get('id')}")
-                        return response.get('id')
-                        
-                    except Exception as e:
-                        print(f"❌ 创建休息任务失败: {str(e)}")
-                        return None
-                
-                # 递归更新任务树中所有任务的时间到Notion
-                def update_task_tree_to_notion(tasks):
-                    """递归更新任务树中所有任务的时间到Notion"""
-                    success_count = 0
-                    total_count = 0
-                    
-                    for task in tasks:
-                        if task.get('scheduled', False) and task.get('start_time') and task.get('end_time'):
-                            total_count += 1
-                            if update_task_time(task['id'], task['start_time'], task['end_time']):
-                                success_count += 1
-                        
-                        # 递归处理子任务
-                        if task.get('children'):
-                            child_success, child_total = update_task_tree_to_notion(task['children'])
-                            success_count += child_success
-                            total_count += child_total
-                    
-                    return success_count, total_count
-                
-                # 更新所有任务到Notion
                 try:
-                    success_count, total_count = update_task_tree_to_notion(task_tree)
-                    
-                    # 创建休息任务
-                    rest_tasks_created = 0
-                    if rest_tasks_info:
-                        print(f"🧘 开始创建 {len(rest_tasks_info)} 个休息任务...")
-                        for rest_info in rest_tasks_info:
-                            rest_task_id = create_rest_task(rest_info)
-                            if rest_task_id:
-                                rest_tasks_created += 1
-                        print(f"🎯 成功创建了 {rest_tasks_created}/{len(rest_tasks_info)} 个休息任务")
-                    
-                    # 将休息任务计入总数
-                    total_count += len(rest_tasks_info)
-                    success_count += rest_tasks_created
-                    
-                    # 保存排程操作记录
-                    operation = ScheduleOperation(
-                        config_id=config.id,
-                        database_id=config.database_id,
-                        tasks_scheduled=success_count,
-                        start_time=start_time,
-                        status='completed' if success_count == total_count else 'partial'
+                    result_data, _ = schedule_flight.run(
+                        config.id,
+                        f'schedule:{start_time.isoformat()}',
+                        lambda: write_schedule_to_notion(
+                            notion, config, mapping, task_tree, rest_tasks_info, start_time, mark_scheduled=True,
+                            planned_at=plan['planned_at']
+                        )
                     )
-                    db.session.add(operation)
-                    db.session.commit()
-                    
-                    # 准备结果页面数据
-                    result_data = {
-                        'success_count': success_count,
-                        'total_count': total_count,
-                        'start_time': start_time,
-                        'operation_id': operation.id,
-                        'status': operation.status,
-                        'completion_time': datetime.now(pytz.timezone('Asia/Shanghai'))
-                    }
+                    success_count = result_data['success_count']
+                    total_count = result_data['total_count']
+                    flash_stale_tasks(result_data)
+                    deferred_count = flash_deferred_writes(result_data)
                     
                     # 根据更新结果跳转到不同页面
                     if success_count == total_count:
                         # 完全成功，跳转到成功结果页面
-                        return render_template('schedule_success.html', 
-                                             config=config,
-                                             result=result_data)
+                        return stream_page('schedule_success.html', 
+                                         config=config,
+                                         result=result_data)
                     elif success_count > 0:
                         # 部分成功，也跳转到结果页面但显示警告信息
                         flash(f'⚠️ 部分成功：{success_count}/{total_count} 个任务已安排日程，其余任务更新失败', 'warning')
-                        return render_template('schedule_success.html', 
-                                             config=config,
-                                             result=result_data)
+                        return stream_page('schedule_success.html', 
+                                         config=config,
+                                         result=result_data)
+                    elif deferred_count:
+                        # 写入已暂存，恢复后自动执行
+                        return redirect(url_for('schedule_history'))
                     else:
                         # 完全失败，返回原页面并显示错误
-                        flash(f'❌ 日程安排失败：无法更新任务时间到Notion，请检查网络连接和权限', 'error')
+                        flash(f'❌ 日程安排失败：无法更新任务时间到Notion，请检查网络连接和权限（可在排程历史中重试 #{result_data["operation_id"]}）', 'error')
                         return redirect(url_for('schedule'))
                         
+                except SingleFlightBusy as e:
+                    flash(f'⏳ {str(e)}', 'warning')
+                    return redirect(url_for('schedule'))
                 except Exception as e:
+                    db.session.rollback()
                     flash(f'❌ 日程安排出错: {str(e)}', 'error')
                     return redirect(url_for('schedule'))
             
@@ -1507,270 +2073,193 @@ def create_app(config_class=Config):
                 start_time_naive = datetime.fromisoformat(start_time_str)
                 start_time = shanghai_tz.localize(start_time_naive)
             
-            # 重新定义update_task_time函数（因为在不同scope）
-            def update_task_time(page_id, start_time, end_time):
-                """更新任务的开始和结束时间到Notion"""
-                try:
-                    timebox_start_property_name = mapping.get('timebox_start_property')
-                    timebox_end_property_name = mapping.get('timebox_end_property')
-                    
-                    # 确保时间带有时区信息，转换为ISO格式字符串
-                    shanghai_tz = pytz.timezone('Asia/Shanghai')
-                    
-                    # 如果时间没有时区信息，添加上海时区
-                    if start_time.tzinfo is None:
-                        start_time = shanghai_tz.localize(start_time)
-                    if end_time.tzinfo is None:
-                        end_time = shanghai_tz.localize(end_time)
-                    
-                    # 转换为ISO格式字符串（Notion API格式）
-                    start_time_iso = start_time.isoformat()
-                    end_time_iso = end_time.isoformat()
-                    
-                    # 如果开始和结束时间是同一个字段，就只更新一个
-                    if timebox_start_property_name == timebox_end_property_name:
-                        notion.pages.update(
-                            page_id=page_id, 
-                            properties={
-                                timebox_start_property_name: {
-                                    'date': {
-                                        'start': start_time_iso,
-                                        'end': end_time_iso
-                                    }
-                                }
-                            }
-                        )
-                    else:
-                        # 分别更新开始和结束时间字段
-                        properties_to_update = {}
-                        
-                        if timebox_start_property_name:
-                            properties_to_update[timebox_start_property_name] = {
-                                'date': {
-                                    'start': start_time_iso
-                                }
-                            }
-                        
-                        if timebox_end_property_name:
-                            properties_to_update[timebox_end_property_name] = {
-                                'date': {
-                                    'start': end_time_iso
-                                }
-                            }
-                        
-                        if properties_to_update:
-                            notion.pages.update(
-                                page_id=page_id,
-                                properties=properties_to_update
-                            )
-                    
-                    return True
-                    
-                except Exception as e:
-                    print(f"❌ 更新任务 {page_id} 时间失败: {str(e)}")
-                    return False
-            
-            # 递归更新任务树中所有任务的时间到Notion
-            def update_task_tree_to_notion(tasks):
-                """递归更新任务树中所有任务的时间到Notion"""
-                success_count = 0
-                total_count = 0
-                
-                for task in tasks:
-                    if task.get('scheduled', False) and task.get('start_time') and task.get('end_time'):
-                        total_count += 1
-                        if update_task_time(task['id'], task['start_time'], task['end_time']):
-                            success_count += 1
-                    
-                    # 递归处理子任务
-                    if task.get('children'):
-                        child_success, child_total = update_task_tree_to_notion(task['children'])
-                        success_count += child_success
-                        total_count += child_total
-                
-                return success_count, total_count
+            planned_at = task_tree_data.get('planned_at')
+            planned_at = datetime.fromisoformat(planned_at) if planned_at else None
             
-            # 定义创建休息任务的函数
-            def create_rest_task(rest_task_info):
-                """在Notion中创建休息任务"""
-                try:
-                    # 准备休息任务的属性
-                    properties = {}
-                    
-                    # 设置标题
-                    title_property = mapping.get('title_property')
-                    if title_property:
-                        properties[title_property] = {
-                            'title': [
-                                {
-                                    'text': {
-                                        'content': rest_task_info.get('title', '🧘 休息时间')
-                                    }
-                                }
-                            ]
-                        }
-                    
-                    # 设置优先级
-                    priority_property = mapping.get('priority_property')
-                    if priority_property and rest_task_info.get('priority'):
-                        properties[priority_property] = {
-                            'select': {
-                                'name': rest_task_info['priority']
-                            }
-                        }
-                    
-                    # 设置父任务关系（只有在有父任务ID时才设置）
-                    parent_task_property = mapping.get('parent_task_property')
-                    if parent_task_property and rest_task_info.get('parent_task_id'):
-                        properties[parent_task_property] = {
-                            'relation': [
-                                {
-                                    'id': rest_task_info['parent_task_id']
-                                }
-                            ]
-                        }
-                    
-                    # 设置预估时间
-                    estimated_time_property = mapping.get('estimated_time_property')
-                    if estimated_time_property:
-                        properties[estimated_time_property] = {
-                            'number': rest_task_info.get('estimated_time', 15)
-                        }
-                    
-                    # 设置时间范围
-                    timebox_start_property = mapping.get('timebox_start_property')
-                    timebox_end_property = mapping.get('timebox_end_property')
-                    
-                    # 确保时间带有时区信息
-                    rest_start_time = rest_task_info['start_time']
-                    rest_end_time = rest_task_info['end_time']
-                    
-                    if rest_start_time.tzinfo is None:
-                        rest_start_time = shanghai_tz.localize(rest_start_time)
-                    if rest_end_time.tzinfo is None:
-                        rest_end_time = shanghai_tz.localize(rest_end_time)
-                    
-                    # 如果开始和结束时间是同一个字段
-                    if timebox_start_property == timebox_end_property and timebox_start_property:
-                        properties[timebox_start_property] = {
-                            'date': {
-                                'start': rest_start_time.isoformat(),
-                                'end': rest_end_time.isoformat()
-                            }
-                        }
-                    else:
-                        # 分别设置开始和结束时间
-                        if timebox_start_property:
-                            properties[timebox_start_property] = {
-                                'date': {
-                                    'start': rest_start_time.isoformat()
-                                }
-                            }
-                        if timebox_end_property:
-                            properties[timebox_end_property] = {
-                                'date': {
-                                    'start': rest_end_time.isoformat()
-                                }
-                            }
-                    
-                    # 创建休息任务页面
-                    response = notion.pages.create(
-                        parent={'database_id': config.database_id},
-                        properties=properties
-                    )
-                    
-                    print(f"✅ 成功创建休息任务: {response.get('id')}")
-                    return response.get('id')
-                    
-                except Exception as e:
-                    print(f"❌ 创建休息任务失败: {str(e)}")
-                    return None
-            
-            # 删除当天的所有休息任务
-            delete_today_rest_tasks(notion, config, mapping)
-            
-            # 执行实际的Notion更新
-            success_count, total_count = update_task_tree_to_notion(task_tree)
-            
-            # 创建休息任务
-            rest_tasks_created = 0
-            if rest_tasks_info:
-                print(f"🧘 开始创建 {len(rest_tasks_info)} 个休息任务...")
-                for rest_info in rest_tasks_info:
-                    rest_task_id = create_rest_task(rest_info)
-                    if rest_task_id:
-                        rest_tasks_created += 1
-                print(f"🎯 成功创建了 {rest_tasks_created}/{len(rest_tasks_info)} 个休息任务")
-            
-            # 将休息任务计入总数
-            total_count += len(rest_tasks_info)
-            success_count += rest_tasks_created
-            
-            # 保存排程操作记录
-            operation = ScheduleOperation(
-                config_id=config.id,
-                database_id=config.database_id,
-                tasks_scheduled=success_count,
-                start_time=start_time,
-                status='completed' if success_count == total_count else 'partial'
+            # 执行实际的Notion更新：同一份预览的重复确认共享一次执行
+            preview_key = hashlib.sha1(serialized_data.encode('utf-8')).hexdigest()
+            result_data, shared = schedule_flight.run(
+                config.id,
+                f'confirm:{preview_key}',
+                lambda: write_schedule_to_notion(
+                    notion, config, mapping, task_tree, rest_tasks_info, start_time, planned_at=planned_at
+                )
             )
-            db.session.add(operation)
-            db.session.commit()
+            if shared:
+                flash('检测到重复确认，已显示进行中排程的结果', 'info')
+            success_count = result_data['success_count']
+            total_count = result_data['total_count']
+            flash_stale_tasks(result_data)
+            deferred_count = flash_deferred_writes(result_data)
             
             # 清除session中的预览数据
             session.pop('schedule_preview', None)
-            
-            # 准备结果页面数据
-            result_data = {
-                'success_count': success_count,
-                'total_count': total_count,
-                'start_time': start_time,
-                'operation_id': operation.id,
-                'status': operation.status,
-                'completion_time': datetime.now(pytz.timezone('Asia/Shanghai'))
-            }
+            preview_id = session.pop('schedule_preview_id', None)
+            if preview_id:
+                preview_store.discard(preview_id)
             
             # 根据更新结果跳转到不同页面
             if success_count == total_count:
                 # 完全成功，跳转到成功结果页面
-                return render_template('schedule_success.html', 
-                                     config=config,
-                                     result=result_data)
+                return stream_page('schedule_success.html', 
+                                 config=config,
+                                 result=result_data)
             elif success_count > 0:
                 # 部分成功，也跳转到结果页面但显示警告信息
                 flash(f'⚠️ 部分成功：{success_count}/{total_count} 个任务已安排日程，其余任务更新失败', 'warning')
-                return render_template('schedule_success.html', 
-                                     config=config,
-                                     result=result_data)
+                return stream_page('schedule_success.html', 
+                                 config=config,
+                                 result=result_data)
+            elif deferred_count:
+                # 写入已暂存，恢复后自动执行
+                return redirect(url_for('schedule_history'))
             else:
                 # 完全失败，返回原页面并显示错误
-                flash(f'❌ 日程安排失败：无法更新任务时间到Notion，请检查网络连接和权限', 'error')
+                flash(f'❌ 日程安排失败：无法更新任务时间到Notion，请检查网络连接和权限（可在排程历史中重试 #{result_data["operation_id"]}）', 'error')
                 return redirect(url_for('schedule'))
             
+        except SingleFlightBusy as e:
+            flash(f'⏳ {str(e)}', 'warning')
+            return redirect(url_for('schedule'))
         except Exception as e:
             flash(f'❌ 确认日程安排出错: {str(e)}', 'error')
             return redirect(url_for('schedule'))
     
+    @app.route('/schedule/resume/<int:operation_id>', methods=['POST'])
+    @require_mapping_setup
+    def resume_schedule(config, notion, mapping, operation_id):
+        """只重放排程操作中失败的 Notion 写入"""
+        operation = ScheduleOperation.query.filter_by(id=operation_id, config_id=config.id).first()
+        if not operation:
+            flash('❌ 未找到该排程记录', 'error')
+            return redirect(url_for('schedule_history'))
+        
+        if operation.status == 'completed':
+            flash('该排程已全部写入，无需重试', 'info')
+            return redirect(url_for('schedule_history'))
+        
+        try:
+            result_data, _ = schedule_flight.run(
+                config.id,
+                f'resume:{operation.id}',
+                lambda: drain_schedule_operation(notion, operation)
+            )
+        except SingleFlightBusy as e:
+            flash(f'⏳ {str(e)}', 'warning')
+            return redirect(url_for('schedule_history'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'❌ 重试排程写入出错: {str(e)}', 'error')
+            return redirect(url_for('schedule_history'))
+        
+        if flash_deferred_writes(result_data):
+            return redirect(url_for('schedule_history'))
+        if result_data['success_count'] != result_data['total_count']:
+            flash(f'⚠️ 部分成功：{result_data["success_count"]}/{result_data["total_count"]} 个任务已安排日程，可再次重试', 'warning')
+        return stream_page('schedule_success.html', 
+                         config=config,
+                         result=result_data)
+    
     @app.route('/schedule/cancel', methods=['POST'])
     def cancel_schedule():
         """取消预览并清除session数据"""
         from flask import session
         session.pop('schedule_preview', None)
+        preview_id = session.pop('schedule_preview_id', None)
+        if preview_id:
+            preview_store.discard(preview_id)
         flash('📋 预览已取消', 'info')
         return redirect(url_for('schedule'))
     
+    def preview_depth():
+        return max(1, min(request.args.get('depth', DEFAULT_DEPTH, type=int), MAX_DEPTH))
+    
+    @app.route('/api/schedule/preview/<preview_id>', methods=['GET'])
+    @require_config
+    def api_schedule_preview(config, preview_id):
+        """排程预览的汇总信息和前 depth 层任务（默认2层）"""
+        summary, nodes = preview_store.get(preview_id, config.id)
+        if summary is None:
+            return jsonify({"error": "Preview not found or expired"}), 404
+        return jsonify(dict(summary, preview_id=preview_id, tasks=truncate(nodes, preview_depth())))
+    
+    @app.route('/api/schedule/preview/<preview_id>/nodes/<path>', methods=['GET'])
+    @require_config
+    def api_schedule_preview_node(config, preview_id, path):
+        """按节点路径（如 0.2.1）获取子任务，返回 depth 层"""
+        summary, nodes = preview_store.get(preview_id, config.id)
+        if summary is None:
+            return jsonify({"error": "Preview not found or expired"}), 404
+        node = find_node(nodes, path)
+        if node is None:
+            return jsonify({"error": "Node not found"}), 404
+        return jsonify({
+            'preview_id': preview_id,
+            'path': path,
+            'child_count': node['child_count'],
+            'children': truncate(node['children'], preview_depth())
+        })
+    
     @app.route('/api/databases', methods=['GET'])
     @require_config
     def api_databases(config):
+        """当前令牌可访问的数据库：?q= 按标题过滤，?cursor=&limit= 分页，?refresh=1 重新拉取"""
         try:
-            notion = NotionClient(auth=config.token)
-            response = notion.search(
-                filter={
-                    "value": "database",
-                    "property": "object"
-                }
-            )
-            return jsonify(response)
+            return jsonify(search_databases(config.token, refresh=request.args.get('refresh') == '1'))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+    
+    @app.route('/api/metrics', methods=['GET'])
+    @require_admin
+    def api_metrics():
+        """运行时统计：各端点的首字节时间、耗时与传输大小，Notion 读取的合并比例、各类调用的排队时间与熔断状态"""
+        return jsonify({
+            'requests': request_metrics.snapshot(),
+            'read_coalescing': read_flight.snapshot(),
+            'notion_scheduler': async_runner.scheduler_snapshot(),
+            'circuit_breakers': circuit_breakers.snapshot(),
+            'profiling': profiler.status()
+        })
+    
+    @app.route('/admin/profiles', methods=['GET'])
+    @require_profiling
+    def profiles():
+        """剖析结果：显式剖析的请求与自动捕获的慢请求（从新到旧）"""
+        return render_template('profiles.html', status=profiler.status(), modes=PROFILING_MODES,
+                               entries=profiler.store.list(), selected=None)
+    
+    @app.route('/admin/profiles/<int:profile_id>', methods=['GET'])
+    @require_profiling
+    def profile_detail(profile_id):
+        """一个请求的热点函数、调用栈与 Notion 调用分布"""
+        selected = profiler.store.get(profile_id)
+        if selected is None:
+            flash(f'剖析结果 #{profile_id} 不存在（可能已被新的结果替换）', 'warning')
+            return redirect(url_for('profiles'))
+        return render_template('profiles.html', status=profiler.status(), modes=PROFILING_MODES,
+                               entries=profiler.store.list(), selected=selected)
+    
+    @app.route('/admin/profiling', methods=['POST'])
+    @require_profiling
+    def update_profiling():
+        """切换剖析所有请求的模式，或清空保存的结果"""
+        if request.form.get('action') == 'clear':
+            profiler.store.clear()
+            flash('已清空剖析结果', 'success')
+        else:
+            try:
+                profiler.set_mode(request.form.get('mode', 'off'))
+                flash(f'剖析模式已切换为 {profiler.mode}', 'success')
+            except ValueError as e:
+                flash(str(e), 'danger')
+        return redirect(url_for('profiles'))
+    
+    @app.route('/api/token-status', methods=['GET'])
+    @require_config
+    def api_token_status(config):
+        """当前令牌状态（缓存），?refresh=1 立即重新检查"""
+        try:
+            return jsonify(get_token_status(config.token, refresh=request.args.get('refresh') == '1'))
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     
@@ -1778,7 +2267,7 @@ def create_app(config_class=Config):
     @require_notion_client
     def api_database_properties(config, notion):
         try:
-            response = notion.databases.retrieve(database_id=config.database_id)
+            response = notion.retrieve_schema(config.database_id)
             
             # Extract only the properties
             properties = response.get('properties', {})
@@ -1797,8 +2286,8 @@ def create_app(config_class=Config):
         try:
             
             # 先获取数据库属性信息，用于名称转ID
-            notion = NotionClient(auth=config.token)
-            db_info = notion.databases.retrieve(database_id=config.database_id)
+            notion = create_notion_client(config.token)
+            db_info = notion.retrieve_schema(config.database_id)
             properties = db_info.get('properties', {})
             
             # 创建属性名称到ID的映射
@@ -1892,75 +2381,169 @@ def create_app(config_class=Config):
         except Exception as e:
             return jsonify({"error": f"获取任务失败: {str(e)}"}), 500
 
+    @app.route('/api/analytics/estimates', methods=['GET'])
+    @require_full_setup
+    def api_analytics_estimates(config, notion, mapping):
+        """API端点：预估时间与实际时间盒的对比分析"""
+        try:
+            synced = 0
+            if request.args.get('sync', '1') != '0':
+                synced = sync_pages(notion, config, mapping)
+            
+            started = time.perf_counter()
+            from services.analytics import (
+                load_duration_columns, compute_overrun_distribution, compute_correction_factors
+            )
+            columns = load_duration_columns(config.id)
+            distribution = compute_overrun_distribution(columns)
+            factors = compute_correction_factors(columns)
+            compute_ms = (time.perf_counter() - started) * 1000
+            
+            return jsonify({
+                'success': True,
+                'samples': int(len(columns['estimate'])),
+                'synced_pages': synced,
+                'distribution': distribution,
+                'correction_factors': factors,
+                'compute_ms': round(compute_ms, 2)
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
     @app.route('/api/leaf-tasks', methods=['GET'])
     @require_mapping_setup
     def api_leaf_tasks(config, notion, mapping):
-        """API端点：获取叶节点任务（没有子任务的任务）"""
+        """
+        API端点：获取叶节点任务（没有子任务的任务）
+
+        从本地镜像读取，叶节点由维护好的子任务计数判断。可选参数：
+        start / end（YYYY-MM-DD，上海时间，按时间盒开始时间过滤）、
+        status（逗号分隔）、limit；镜像没有变化时返回 304
+        """
         try:
-            # 获取所有任务（包括有开始时间的任务）
-            timebox_start_property = mapping.get('timebox_start_property')
-            if not timebox_start_property:
+            if not mapping.get('timebox_start_property'):
                 return jsonify({
                     'success': False,
                     'error': '未配置时间盒开始属性'
                 }), 400
             
-            # 查询所有有开始时间的任务
-            tasks_response = notion.databases.query(
-                database_id=config.database_id,
-                filter={
-                    "property": timebox_start_property,
-                    "date": {
-                        "is_not_empty": True
+            shanghai_tz = pytz.timezone('Asia/Shanghai')
+            try:
+                range_start = request.args.get('start')
+                range_end = request.args.get('end')
+                if range_start:
+                    range_start = to_utc_naive(shanghai_tz.localize(datetime.strptime(range_start, '%Y-%m-%d')))
+                if range_end:
+                    range_end = to_utc_naive(shanghai_tz.localize(
+                        datetime.strptime(range_end, '%Y-%m-%d') + timedelta(days=1)
+                    ))
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'error': '日期格式应为 YYYY-MM-DD'
+                }), 400
+            statuses = [value.strip() for value in request.args.get('status', '').split(',') if value.strip()]
+            limit = request.args.get('limit', type=int)
+            
+            # 镜像过旧时先增量同步（一次带 last_edited_time 过滤的查询），
+            # 多个标签页同时轮询时只有一个请求执行同步，其余等待它完成
+            # 同步失败时记录日志并继续返回镜像中已有的数据
+            content_version, last_synced_at = get_mirror_version(config.id)
+            max_age = timedelta(seconds=current_app.config.get('MIRROR_FRESHNESS_SECONDS', 60))
+            if last_synced_at is None or datetime.utcnow() - last_synced_at > max_age:
+                try:
+                    read_flight.do(
+                        notion.scope, 'mirror.sync', {'config_id': config.id},
+                        lambda: sync_pages(notion, config, mapping)
+                    )
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️  镜像同步失败，返回已有的镜像数据: {str(e)}")
+                content_version, last_synced_at = get_mirror_version(config.id)
+            
+            # ETag 只取镜像内容版本（没有变化的同步不会改变它）和查询参数，压缩时由响应管道加编码后缀
+            etag = hashlib.sha1('|'.join([
+                str(config.id), str(content_version),
+                str(range_start), str(range_end), ','.join(sorted(statuses)), str(limit)
+            ]).encode('utf-8')).hexdigest()
+            matched_etag = matching_etag(etag)
+            if matched_etag:
+                return not_modified(matched_etag)
+            
+            def load_leaf_tasks():
+                query = PageMirror.query.filter(
+                    PageMirror.config_id == config.id,
+                    PageMirror.archived.is_(False),
+                    PageMirror.timebox_start.isnot(None),
+                    PageMirror.child_count == 0
+                )
+                if range_start:
+                    query = query.filter(PageMirror.timebox_start >= range_start)
+                if range_end:
+                    query = query.filter(PageMirror.timebox_start < range_end)
+                if statuses:
+                    query = query.filter(PageMirror.status.in_(statuses))
+                query = query.order_by(PageMirror.timebox_start, PageMirror.id)
+                if limit:
+                    query = query.limit(max(1, limit))
+                return [
+                    {
+                        'id': row.page_id,
+                        'title': row.title or "未命名任务",
+                        'status': row.status,
+                        'start_time': pytz.utc.localize(row.timebox_start).astimezone(shanghai_tz).isoformat()
                     }
-                }
-            )
+                    for row in query
+                ]
             
-            all_tasks = tasks_response.get('results', [])
+            # ETag 已包含镜像版本和全部查询参数，相同 ETag 的并发请求共享一次查询结果
+            formatted_tasks = read_flight.do(notion.scope, 'api.leaf_tasks', {'etag': etag}, load_leaf_tasks)
             
-            # 找出叶节点任务（没有子任务的任务）
-            leaf_tasks = []
-            parent_task_property = mapping.get('parent_task_property')
+            response = jsonify({
+                'success': True,
+                'tasks': formatted_tasks
+            })
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
             
-            if parent_task_property:
-                # 如果有父任务属性，通过检查是否有子任务来确定叶节点
-                parent_ids = set()
-                for task in all_tasks:
-                    if parent_task_property in task['properties']:
-                        parent_relations = task['properties'][parent_task_property].get('relation', [])
-                        for parent_relation in parent_relations:
-                            parent_ids.add(parent_relation['id'])
-                
-                # 叶节点 = 所有任务 - 有子任务的任务
-                for task in all_tasks:
-                    if task['id'] not in parent_ids:
-                        leaf_tasks.append(task)
-            else:
-                # 如果没有父任务属性，则将所有任务视为叶节点
-                leaf_tasks = all_tasks
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    @app.route('/api/leaf-tasks/search', methods=['GET'])
+    @require_mapping_setup
+    def api_leaf_tasks_search(config, notion, mapping):
+        """API端点：按标题搜索叶节点任务（内存索引，供延期页面的选择器使用）"""
+        try:
+            query = request.args.get('q', '')
+            limit = max(1, min(request.args.get('limit', 20, type=int), 100))
             
-            # 格式化任务信息
-            formatted_tasks = []
-            title_property = mapping.get('title_property')
+            # refresh=1 时先增量同步镜像（页面首次加载时使用），空镜像时做一次全量同步
+            index = get_search_index(config.id)
+            if request.args.get('refresh') == '1' or index.watermark is None:
+                sync_pages(notion, config, mapping)
+                index = get_search_index(config.id, force_refresh=True)
             
-            for task in leaf_tasks:
-                task_title = "未命名任务"
-                if title_property and title_property in task['properties']:
-                    title_prop = task['properties'][title_property]
-                    if 'title' in title_prop and title_prop['title']:
-                        task_title = title_prop['title'][0]['plain_text']
-                
-                formatted_tasks.append({
-                    'id': task['id'],
-                    'title': task_title
-                })
+            started = time.perf_counter()
+            tasks = index.search(query, limit=limit)
+            took_ms = (time.perf_counter() - started) * 1000
             
             return jsonify({
                 'success': True,
-                'tasks': formatted_tasks
+                'tasks': tasks,
+                'took_ms': round(took_ms, 3)
             })
             
         except Exception as e:
+            db.session.rollback()
             return jsonify({
                 'success': False,
                 'error': str(e)
@@ -2027,14 +2610,50 @@ def create_app(config_class=Config):
     
     @app.route('/reset-config', methods=['POST'])
     def reset_config():
-        """重置配置（删除当前配置）"""
+        """重置配置（删除当前工作区的配置，其他工作区不受影响）"""
         config = CalendarDatabaseConfig.get_current_config()
         if config:
+            drop_search_index(config.id)
+            warm_tree_cache.invalidate(config.id)
+            forget_selection(config.id)
             db.session.delete(config)
             db.session.commit()
+            config_cache.bump()
             flash('配置已重置', 'success')
         return redirect(url_for('connect'))
     
+    @app.route('/workspaces/select', methods=['POST'])
+    def select_workspace():
+        """切换当前会话使用的工作区"""
+        config_id = request.form.get('config_id', type=int)
+        config = db.session.get(CalendarDatabaseConfig, config_id) if config_id else None
+        if not config:
+            flash('工作区不存在', 'error')
+            return redirect(url_for('index'))
+        remember_selection(config.id)
+        flash(f'已切换到工作区 #{config.id}', 'success')
+        # 回到切换前的页面（只接受站内路径）
+        next_url = request.form.get('next') or ''
+        if not next_url.startswith('/') or next_url.startswith('//'):
+            next_url = url_for('index')
+        return redirect(next_url)
+    
+    @app.route('/api/workspaces', methods=['GET'])
+    def api_workspaces():
+        """工作区列表，current 标记当前请求使用的工作区"""
+        current = config_cache.current()
+        return jsonify({
+            'workspaces': [
+                {
+                    'id': config.id,
+                    'database_id': config.database_id,
+                    'mapping_complete': config.is_mapping_complete_for_scheduling(),
+                    'current': current is not None and config.id == current.id
+                }
+                for config in config_cache.all()
+            ]
+        })
+    
     @app.route('/validate-mapping', methods=['GET'])
     def validate_mapping():
         """验证和修复属性映射"""
@@ -2044,7 +2663,7 @@ def create_app(config_class=Config):
             return redirect(url_for('connect'))
         
         try:
-            notion = NotionClient(auth=config.token)
+            notion = create_notion_client(config.token)
             
             # 验证属性映射（简化版本，因为现在直接存储名称）
             db_info = notion.databases.retrieve(database_id=config.database_id)
@@ -2076,7 +2695,7 @@ def create_app(config_class=Config):
             return redirect(url_for('connect'))
         
         try:
-            notion = NotionClient(auth=config.token)
+            notion = create_notion_client(config.token)
             
             # 修复属性映射（简化版本，因为现在直接存储名称）
             db_info = notion.databases.retrieve(database_id=config.database_id)
@@ -2117,58 +2736,85 @@ def create_app(config_class=Config):
     
     @app.route('/api/validate-token', methods=['POST'])
     def api_validate_token():
-        """验证 Notion API Token 并获取可用数据库列表"""
-        data = request.get_json()
+        """
+        验证 Notion API Token 并返回第一页可用数据库
+
+        请求体可带 q / cursor / limit 用于过滤和翻页；翻页和过滤复用验证时拉取的目录
+        """
+        data = request.get_json() or {}
         token = data.get('token')
         
         if not token:
             return jsonify({"error": "Token is required"}), 400
         
         try:
-            notion = NotionClient(auth=token)
-            response = notion.search(
-                filter={
-                    "value": "database",
-                    "property": "object"
-                }
+            # 首次验证重新拉取目录（同时确认令牌有效），之后的过滤/翻页使用缓存
+            first_page = not data.get('q') and not data.get('cursor')
+            result = database_directory.search(
+                token, lambda: create_notion_client(token),
+                query=data.get('q') or '',
+                cursor=int(data.get('cursor') or 0),
+                limit=int(data.get('limit') or 20),
+                refresh=first_page
             )
-            
-            if 'results' in response:
-                return jsonify({
-                    "valid": True,
-                    "databases": response.get('results', [])
-                })
-            else:
-                return jsonify({
-                    "valid": False,
-                    "error": "Invalid token or API request failed"
-                })
+            token_status_cache.record(token, True)
+            return jsonify(dict(result, valid=True))
         except Exception as e:
+            token_status_cache.record(token, False, str(e))
             return jsonify({
                 "valid": False,
                 "error": str(e)
             }), 500
     
     @app.route('/schedule_history', methods=['GET'])
-    def schedule_history():
-        """显示日程操作历史"""
-        operations = ScheduleOperation.query.all()
-        return render_template('schedule_history.html', operations=operations)
+    @require_config
+    def schedule_history(config):
+        """显示日程操作历史（keyset 分页 + 日聚合统计）"""
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', 20, type=int)
+        
+        operations, next_cursor = get_schedule_history_page(config.id, cursor=cursor, limit=limit)
+        daily_stats = get_daily_stats(config.id, days=request.args.get('days', 14, type=int))
+        
+        return stream_page('schedule_history.html',
+                         config=config,
+                         operations=operations,
+                         next_cursor=next_cursor,
+                         limit=limit,
+                         daily_stats=daily_stats)
     
+    app.cli.command("clean-config")(clean_config)
+    # 批处理命令（preview / confirm / delay / sync）
+    from commands import register_batch_commands
+    register_batch_commands(app)
+    
+    startup_timer.mark('注册路由')
+    startup_timer.report()
     return app
 
-app = create_app()
+def __getattr__(name):
+    """模块级 app 在第一次访问时才创建（flask run、from app import app 仍然可用）"""
+    if name == 'app':
+        application = create_app()
+        globals()['app'] = application
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-@app.cli.command("clean-config")
 def clean_config():
     """Deletes all existing configuration data from the database."""
     try:
         # Since operations have foreign keys to the config, they must be deleted first.
         num_task_ops = db.session.query(TaskOperation).delete()
+        db.session.query(TaskPlanRecord).delete()
+        db.session.query(ScheduleDailyStat).delete()
+        db.session.query(PageMirror).delete()
+        db.session.query(PageMirrorState).delete()
+        db.session.query(NotionWriteOutbox).delete()
         num_schedule_ops = db.session.query(ScheduleOperation).delete()
         num_configs = db.session.query(CalendarDatabaseConfig).delete()
         
         db.session.commit()
+        config_cache.bump()
         
         print(f"Successfully deleted:")
         print(f"- {num_configs} configuration(s)")
@@ -2293,80 +2939,75 @@ def build_task_tree_with_formatting(notion_client, config, mapping, root_tasks):
             'schedule_status': safe_get_status(schedule_status_property),
             'parent_tasks': safe_get_relation(parent_task_property),
             'date': safe_get_date(date_property, 'start'),
+            'last_edited_time': task.get('last_edited_time'),
             'sorted': False
         }
     
-    def get_child_tasks_sorted_by_priority(page_id):
-        """获取指定父任务的排序子任务列表"""
-        try:
-            data = notion_client.databases.query(
-                database_id=config.database_id,
-                filter={
-                    "and": [
-                        {
-                            "property": mapping.get('parent_task_property'),
-                            "relation": {
-                                "contains": page_id
-                            }
-                        },
-                        {
-                            "property": mapping.get('title_property'),
-                            "title": {
-                                "does_not_contain": "🧘"  # 不包含休息任务
-                            }
-                        },
-                        {
-                            "property": mapping.get('status_property'),
-                            "status": {
-                                "does_not_equal": "已完成"
-                            }
-                        },
-                        {
-                            "property": mapping.get('status_property'),
-                            "status": {
-                                "does_not_equal": "已取消"
-                            }
+    def child_query_kwargs(page_id):
+        """查询指定父任务的子任务（按优先级排序）的参数"""
+        return {
+            'database_id': config.database_id,
+            'filter': {
+                "and": [
+                    {
+                        "property": mapping.get('parent_task_property'),
+                        "relation": {
+                            "contains": page_id
                         }
-                    ]
-                },
-                sorts=[
+                    },
                     {
-                        "property": mapping.get('priority_property'),
-                        "direction": "ascending"
+                        "property": mapping.get('title_property'),
+                        "title": {
+                            "does_not_contain": "🧘"  # 不包含休息任务
+                        }
+                    },
+                    {
+                        "property": mapping.get('status_property'),
+                        "status": {
+                            "does_not_equal": "已完成"
+                        }
+                    },
+                    {
+                        "property": mapping.get('status_property'),
+                        "status": {
+                            "does_not_equal": "已取消"
+                        }
                     }
                 ]
-            ).get('results', [])
-            
-            if len(data) == 0:
-                return []
-            
-            # 格式化所有子任务
-            return [format_task(task) for task in data]
-        except Exception as e:
-            print(f"DEBUG❌❌❌❌❌❌ 获取子任务失败: {e}")
-            return []
+            },
+            'sorts': [
+                {
+                    "property": mapping.get('priority_property'),
+                    "direction": "ascending"
+                }
+            ]
+        }
     
-    def get_child_task_tree(parent_task):
-        """递归构建子任务树"""
-        # 获取排序后的直接子任务
-        child_tasks = get_child_tasks_sorted_by_priority(parent_task['id'])
-        if not child_tasks:
-            return []
-        
-        # 为每个子任务递归构建其子任务树
-        for child_task in child_tasks:
-            child_task['children'] = get_child_task_tree(child_task)
-        
-        return child_tasks
+    def attach_children(tasks):
+        """并发获取同一层所有任务的子任务，返回下一层任务"""
+        responses = notion_client.gather([
+            ('databases.query', child_query_kwargs(task['id'])) for task in tasks
+        ])
+        next_level = []
+        for task, response in zip(tasks, responses):
+            if isinstance(response, Exception):
+                print(f"DEBUG❌❌❌❌❌❌ 获取子任务失败: {response}")
+                task['children'] = []
+                continue
+            # 格式化所有子任务
+            task['children'] = [format_task(child) for child in response.get('results', [])]
+            next_level.extend(task['children'])
+        return next_level
     
     # 主函数逻辑：构建完整的任务树
     try:
         # 首先格式化所有根任务
         formatted_root_tasks = [format_task(task) for task in root_tasks]
         
-        # 为每个根任务构建子任务树
-        for task in formatted_root_tasks:
-            task['children'] = get_child_task_tree(task)
+        # 逐层构建子任务树，同一层的查询相互独立
+        level = formatted_root_tasks
+        while level:
+            level = attach_children(level)
         
         return formatted_root_tasks
         
@@ -2375,4 +3016,6 @@ def build_task_tree_with_formatting(notion_client, config, mapping, root_tasks):
         return []
 
 if __name__ == '__main__':
+    app = create_app()
+    start_warmup(app, use_reloader=True)
     app.run(debug=True)
@@ -0,0 +1,123 @@
+"""
+基准结果的基线：按 git 版本保存每个场景的耗时、Notion 调用数和峰值内存，并与之前的版本比较
+
+基线文件（默认 benchmarks/baseline.json）的结构：
+{"revisions": {"<版本>": {"recorded_at": ..., "settings": {...}, "scenarios": {...}}}, "order": ["<版本>", ...]}
+
+指标超过基线的百分比阈值、且增加量超过最小绝对值时视为退化；
+Notion 调用数默认不允许任何增加（例如某个路径退化为逐个查询）
+"""
+
+from datetime import datetime
+import json
+import os
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# 指标 -> 允许增加的百分比
+DEFAULT_THRESHOLDS = {'wall_ms': 25.0, 'api_calls': 0.0, 'peak_memory_kb': 20.0}
+# 指标 -> 小于该增加量时不算退化（耗时与内存的测量噪声）
+ABSOLUTE_FLOORS = {'wall_ms': 5.0, 'api_calls': 0, 'peak_memory_kb': 64.0}
+METRICS = tuple(DEFAULT_THRESHOLDS)
+
+
+def git_revision():
+    """当前 git 版本（有未提交的修改时带 -dirty 后缀）"""
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def parse_thresholds(items):
+    """
+    解析 ["wall_ms=30", "peak_memory_kb=50"] 形式的阈值，未列出的指标使用默认值
+
+    Raises:
+        ValueError: 未知的指标或无效的数值
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for item in items or ():
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in thresholds:
+            raise ValueError(f"未知的指标: {name}（可用: {', '.join(METRICS)}）")
+        thresholds[name] = float(value)
+    return thresholds
+
+
+def load_baseline(path=DEFAULT_BASELINE_PATH):
+    if not os.path.exists(path):
+        return {'revisions': {}, 'order': []}
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def save_baseline(report, revision, path=DEFAULT_BASELINE_PATH):
+    """把一次运行记录为 revision 的基线（同一版本覆盖之前的记录）"""
+    baseline = load_baseline(path)
+    baseline['revisions'][revision] = {
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'settings': report['settings'],
+        'scenarios': {
+            name: {metric: item[metric] for metric in METRICS}
+            for name, item in report['scenarios'].items()
+        },
+    }
+    baseline['order'] = [item for item in baseline['order'] if item != revision] + [revision]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(baseline, handle, ensure_ascii=False, indent=2)
+    return baseline
+
+
+def settings_differ(before, after):
+    """运行参数是否不同（运行次数只影响中位数的稳定性，不计入）"""
+    before = {key: value for key, value in before.items() if key != 'repeat'}
+    return before != {key: value for key, value in after.items() if key != 'repeat'}
+
+
+def select_reference(baseline, revision, against=None):
+    """
+    选择比较的基线版本：指定的版本，否则是最近记录的其他版本，都没有时用当前版本之前的记录
+
+    Returns:
+        str | None: 版本，没有可比较的基线时返回 None
+    """
+    if against:
+        if against not in baseline['revisions']:
+            raise LookupError(f"基线中没有版本 {against}（已记录: {', '.join(baseline['order']) or '无'}）")
+        return against
+    others = [item for item in baseline['order'] if item != revision]
+    if others:
+        return others[-1]
+    return revision if revision in baseline['revisions'] else None
+
+
+def compare(report, reference, thresholds):
+    """
+    与基线比较
+
+    Returns:
+        (list, list): (每个场景每个指标的比较行, 其中退化的行)
+    """
+    rows = []
+    for name, item in report['scenarios'].items():
+        before = reference['scenarios'].get(name)
+        if before is None:
+            continue
+        for metric in METRICS:
+            old, new = before.get(metric), item.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else (0.0 if new == old else float('inf'))
+            regressed = change > thresholds[metric] and new - old > ABSOLUTE_FLOORS[metric]
+            rows.append({
+                'scenario': name, 'metric': metric, 'baseline': old, 'current': new,
+                'change_percent': round(change, 1) if change != float('inf') else None,
+                'threshold_percent': thresholds[metric], 'regressed': regressed,
+            })
+    return rows, [row for row in rows if row['regressed']]
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+多用户并发负载测试：在本地 Notion 替身上驱动应用的主要路由，测量单个进程能承载多少同时使用的用户
+
+- 应用在本进程内由固定大小的工作线程池提供服务（--workers，对应 gunicorn 的线程数），
+  Notion 请求发往 benchmarks/notion_standin.py 启动的替身（--notion-latency 模拟响应时间）
+- 每个路由、每个并发度单独运行一轮：--concurrency 个虚拟用户（各自的会话）共发出 --requests 个请求；
+  schedule_confirm 每次确认前先生成一次预览（不计入延迟，但计入这一轮的耗时和吞吐量）
+- 报告每轮的吞吐量、p50/p95/p99 延迟、错误数、工作线程饱和度（忙碌占比、排队等待）、
+  每个请求的 Notion 调用数（应用内按请求追踪）以及替身实际收到的调用数
+- 结果保存为 JSON（默认 benchmarks/results/），--compare 与之前的结果比较
+
+运行方式：
+python benchmarks/load_test.py [--concurrency 1,4,16] [--requests 40] [--routes schedule_preview,leaf_tasks]
+                               [--workers 8] [--notion-latency 150] [--compare benchmarks/results/上次.json] [--json]
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.notion_standin import NotionStandin, STANDIN_MAPPING, SHANGHAI, build_workspace  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+DEFAULT_ROUTES = ('schedule_preview', 'schedule_confirm', 'delay', 'delay_submit', 'leaf_tasks', 'task_details')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return values[index]
+
+
+class WorkerMonitor:
+    """统计工作线程池的忙碌时间、排队等待与峰值"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.busy = 0
+        self.queued = 0
+        self.reset()
+
+    def reset(self):
+        """开始新的一轮统计（上一轮还在处理的请求继续计入忙碌数）"""
+        with self._lock:
+            self.peak_busy = self.busy
+            self.peak_queued = self.queued
+            self.busy_seconds = 0.0
+            self.queue_waits = []
+            self._changed_at = time.perf_counter()
+            self.started_at = self._changed_at
+
+    def _advance(self):
+        now = time.perf_counter()
+        self.busy_seconds += self.busy * (now - self._changed_at)
+        self._changed_at = now
+        return now
+
+    def enqueued(self):
+        with self._lock:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            return time.perf_counter()
+
+    def started(self, enqueued_at):
+        with self._lock:
+            now = self._advance()
+            self.queued -= 1
+            self.busy += 1
+            self.peak_busy = max(self.peak_busy, self.busy)
+            self.queue_waits.append((now - enqueued_at) * 1000)
+
+    def finished(self):
+        with self._lock:
+            self._advance()
+            self.busy -= 1
+
+    def snapshot(self):
+        with self._lock:
+            now = self._advance()
+            elapsed = max(now - self.started_at, 1e-9)
+            return {
+                'workers': self.workers,
+                'utilization': round(self.busy_seconds / (self.workers * elapsed), 3),
+                'peak_busy': self.peak_busy,
+                'peak_queued': self.peak_queued,
+                'queue_wait_p95_ms': round(percentile(self.queue_waits, 0.95) or 0, 1),
+            }
+
+
+def serve(application, workers, monitor):
+    """用固定大小的线程池提供 WSGI 服务，返回 (服务器, 地址)"""
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    class PooledWSGIServer(BaseWSGIServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='load-worker')
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._process, request, client_address, monitor.enqueued())
+
+        def _process(self, request, client_address, enqueued_at):
+            monitor.started(enqueued_at)
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                monitor.finished()
+
+    server = PooledWSGIServer('127.0.0.1', 0, application, handler=QuietHandler)
+    server.request_queue_size = 256
+    threading.Thread(target=server.serve_forever, name='load-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class VirtualUser:
+    """一个使用者：自己的会话 cookie 和工作区"""
+
+    def __init__(self, base_url, config_id, leaf_ids, index):
+        import httpx
+        self.client = httpx.Client(base_url=base_url, timeout=300, follow_redirects=False,
+                                   headers={'X-Config-Id': str(config_id)})
+        self.leaf_ids = leaf_ids
+        self.index = index
+        self.iteration = 0
+
+    def close(self):
+        self.client.close()
+
+    def start_time(self):
+        start = datetime.now(SHANGHAI) + timedelta(hours=1)
+        return start.strftime('%Y-%m-%dT%H:%M')
+
+    def leaf_id(self):
+        self.iteration += 1
+        return self.leaf_ids[(self.index * 7 + self.iteration) % len(self.leaf_ids)]
+
+    def prepare(self, route):
+        """不计时的前置请求（确认排程前需要先生成预览）"""
+        if route == 'schedule_confirm':
+            self.client.post('/schedule', data={'start_time': self.start_time(), 'preview': 'true'}).read()
+
+    def request(self, route):
+        if route == 'schedule_preview':
+            return self.client.post('/schedule', data={'start_time': self.start_time(), 'preview': 'true'})
+        if route == 'schedule_confirm':
+            return self.client.post('/schedule/confirm')
+        if route == 'delay':
+            return self.client.get('/delay')
+        if route == 'delay_submit':
+            return self.client.post('/delay', data={'task_id': self.leaf_id()})
+        if route == 'leaf_tasks':
+            return self.client.get('/api/leaf-tasks')
+        if route == 'task_details':
+            return self.client.get(f'/api/task-details/{self.leaf_id()}')
+        raise ValueError(f'未知的路由: {route}')
+
+
+def run_phase(route, concurrency, total, users, monitor, standin, request_metrics):
+    """一个路由、一个并发度的一轮负载"""
+    remaining = iter(range(total))
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def next_request():
+        with lock:
+            return next(remaining, None)
+
+    def drive(user):
+        while next_request() is not None:
+            user.prepare(route)
+            started = time.perf_counter()
+            try:
+                response = user.request(route)
+                response.read()
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+            except Exception as e:
+                errors.append(type(e).__name__)
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    request_metrics.reset()
+    standin.reset_counts()
+    monitor.reset()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=drive, args=(user,)) for user in users[:concurrency]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    snapshot = request_metrics.snapshot()
+    # 包括前置请求在内，应用在这一轮中发出的 Notion 调用
+    app_notion_calls = sum(item['notion_calls_avg'] * item['count'] for item in snapshot.values())
+    endpoint_metrics = snapshot.get(ROUTE_ENDPOINTS[route], {})
+    standin_calls = sum(standin.counts().values())
+    return {
+        'route': route,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_samples': sorted(set(map(str, errors)))[:5],
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.5), 1),
+        'p95_ms': round(percentile(latencies, 0.95), 1),
+        'p99_ms': round(percentile(latencies, 0.99), 1),
+        'notion_calls_per_request': endpoint_metrics.get('notion_calls_avg'),
+        'app_notion_calls': round(app_notion_calls),
+        'standin_calls': standin_calls,
+        'standin_calls_per_request': round(standin_calls / max(len(latencies), 1), 2),
+        'standin_peak_in_flight': standin.peak_in_flight,
+        'saturation': monitor.snapshot(),
+    }
+
+
+# 路由 -> Flask 端点名（读取应用内按端点统计的 Notion 调用数）
+ROUTE_ENDPOINTS = {
+    'schedule_preview': 'schedule_tasks',
+    'schedule_confirm': 'confirm_schedule',
+    'delay': 'delay',
+    'delay_submit': 'delay',
+    'leaf_tasks': 'api_leaf_tasks',
+    'task_details': 'api_task_details',
+}
+
+
+def setup_app(database_url, standin, workspaces):
+    """创建应用和 workspaces 个工作区（各自的令牌，共用替身数据库）"""
+    import app as app_module
+    from config import Config
+    from models.database import db, CalendarDatabaseConfig
+
+    load_config = type('LoadTestConfig', (Config,), {
+        'SQLALCHEMY_DATABASE_URI': database_url, 'WARMUP_ENABLED': False,
+        'NOTION_API_BASE_URL': standin.base_url,
+    })
+    application = app_module.create_app(load_config)
+    config_ids = []
+    with application.app_context():
+        app_module.ensure_database_schema(application)
+        for index in range(workspaces):
+            config = CalendarDatabaseConfig(
+                token=f'secret_loadtest{index:04d}', database_id=f'{standin.database_id}-{index}',
+                property_mapping=dict(STANDIN_MAPPING)
+            )
+            db.session.add(config)
+            db.session.flush()
+            config_ids.append(config.id)
+        db.session.commit()
+        app_module.config_cache.bump()
+    return application, config_ids
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(report, previous):
+    """与之前的结果比较 p95 与吞吐量，返回文字说明的列表"""
+    earlier = {(item['route'], item['concurrency']): item for item in previous.get('phases', [])}
+    lines = []
+    for item in report['phases']:
+        before = earlier.get((item['route'], item['concurrency']))
+        if not before:
+            continue
+        p95 = (item['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+        rps = (item['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] * 100 \
+            if before['throughput_rps'] else 0
+        lines.append(f"{item['route']:<18}×{item['concurrency']:<4} p95 {before['p95_ms']:>8.1f} → "
+                     f"{item['p95_ms']:>8.1f} ms ({p95:+.0f}%)   吞吐 {before['throughput_rps']:>6.2f} → "
+                     f"{item['throughput_rps']:>6.2f}/s ({rps:+.0f}%)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并发负载测试（本地 Notion 替身）')
+    parser.add_argument('--concurrency', default='1,4,16', help='逗号分隔的并发用户数')
+    parser.add_argument('--requests', type=int, default=40, help='每轮（路由 × 并发度）的请求数')
+    parser.add_argument('--routes', default=','.join(DEFAULT_ROUTES), help='逗号分隔的路由')
+    parser.add_argument('--workers', type=int, default=8, help='应用的工作线程数')
+    parser.add_argument('--workspaces', type=int, default=1, help='工作区（令牌）数，用户轮流分配')
+    parser.add_argument('--roots', type=int, default=20, help='替身中的根任务数（每个 3 个子任务）')
+    parser.add_argument('--notion-latency', type=float, default=150, help='替身的响应时间（毫秒）')
+    parser.add_argument('--output', help='结果文件（默认 benchmarks/results/load-<时间>-<版本>.json）')
+    parser.add_argument('--compare', help='与之前的结果文件比较')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+
+    routes = [route.strip() for route in args.routes.split(',') if route.strip()]
+    unknown = [route for route in routes if route not in ROUTE_ENDPOINTS]
+    if unknown:
+        parser.error(f"未知的路由: {', '.join(unknown)}（可用: {', '.join(DEFAULT_ROUTES)}）")
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+
+    os.environ['WARMUP_ENABLED'] = 'false'
+    os.chdir(ROOT)
+    pages = build_workspace(roots=args.roots)
+    parents = {page['properties']['Parent']['relation'][0]['id']
+               for page in pages if page['properties']['Parent']['relation']}
+    leaf_ids = [page['id'] for page in pages if page['id'] not in parents]
+
+    standin = NotionStandin(pages, latency_ms=args.notion_latency, jitter_ms=args.notion_latency * 0.2)
+    standin.start()
+    monitor = WorkerMonitor(args.workers)
+    from services.instrumentation import request_metrics
+    request_metrics.window = max(request_metrics.window, args.requests * 2)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        application, config_ids = setup_app(f"sqlite:///{os.path.join(workdir, 'load.db')}",
+                                            standin, args.workspaces)
+        server, base_url = serve(application, args.workers, monitor)
+        users = [VirtualUser(base_url, config_ids[index % len(config_ids)], leaf_ids, index)
+                 for index in range(max(levels))]
+        phases = []
+        try:
+            for route in routes:
+                for level in levels:
+                    phase = run_phase(route, level, args.requests, users, monitor, standin, request_metrics)
+                    phases.append(phase)
+                    if not args.json:
+                        print(f"⏱️ {route} ×{level}: {phase['throughput_rps']}/s，"
+                              f"p95 {phase['p95_ms']} ms", file=sys.stderr)
+        finally:
+            for user in users:
+                user.close()
+            server.shutdown()
+            standin.stop()
+
+    report = {
+        'kind': 'load_test',
+        'revision': git_revision(),
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'settings': {
+            'workers': args.workers, 'workspaces': args.workspaces, 'requests': args.requests,
+            'notion_latency_ms': args.notion_latency, 'pages': len(pages),
+            'rate_limit_per_second': application.config.get('NOTION_RATE_LIMIT_PER_SECOND'),
+        },
+        'phases': phases,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}-{report['revision']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, ensure_ascii=False, indent=2)
+
+    comparison = []
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as handle:
+            comparison = compare(report, json.load(handle))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    print(f"\n{'路由':<18}{'并发':>5}{'吞吐/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'错误':>6}"
+          f"{'Notion/请求':>12}{'替身调用':>9}{'线程忙碌':>9}{'排队p95':>9}")
+    for phase in phases:
+        saturation = phase['saturation']
+        print(f"{phase['route']:<18}{phase['concurrency']:>5}{phase['throughput_rps']:>9.2f}"
+              f"{phase['p50_ms']:>9.1f}{phase['p95_ms']:>9.1f}{phase['p99_ms']:>9.1f}{phase['errors']:>6}"
+              f"{phase['notion_calls_per_request'] or 0:>12.2f}{phase['standin_calls']:>9}"
+              f"{saturation['utilization'] * 100:>8.0f}%{saturation['queue_wait_p95_ms']:>9.1f}")
+    if comparison:
+        print(f"\n与 {args.compare} 比较：")
+        for line in comparison:
+            print(f"  {line}")
+    print(f"\n结果已保存到 {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,378 @@
+"""
+本地 Notion 替身：用标准库 http.server 实现应用用到的 Notion API 子集，供负载测试和基准测试使用
+
+- POST /v1/databases/{id}/query：支持 and/or 组合条件，title / select / status / relation /
+  date / number / checkbox 条件、last_edited_time 时间戳条件、排序与分页
+- GET /v1/databases/{id}、GET/PATCH /v1/pages/{id}、POST /v1/pages、GET /v1/users/me、POST /v1/search
+- 每个请求按 latency_ms（± jitter_ms）延迟后返回，模拟 Notion 的响应时间
+- 默认不保存写入（返回写入后的页面，但工作区保持不变），反复运行的负载保持一致；
+  persist_writes=True 时写入生效
+
+应用通过 NOTION_API_BASE_URL 指向替身（见 benchmarks/load_test.py）
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import copy
+import json
+import random
+import threading
+import time
+import uuid
+
+DATABASE_ID = '00000000-0000-4000-8000-0000000000db'
+SHANGHAI = timezone(timedelta(hours=8))
+
+# 属性名 -> (属性 ID, 类型)
+SCHEMA = {
+    'Name': ('title', 'title'),
+    'Priority': ('prio', 'select'),
+    'Est': ('est', 'number'),
+    'Status': ('stat', 'status'),
+    'Time': ('time', 'date'),
+    'Parent': ('prnt', 'relation'),
+    'Sched': ('schd', 'select'),
+}
+STANDIN_MAPPING = {
+    'title_property': 'Name',
+    'priority_property': 'Priority',
+    'estimated_time_property': 'Est',
+    'parent_task_property': 'Parent',
+    'status_property': 'Status',
+    'timebox_start_property': 'Time',
+    'timebox_end_property': 'Time',
+    'schedule_status_property': 'Sched',
+    'schedule_status_todo_value': 'todo',
+    'schedule_status_done_value': 'done',
+}
+PRIORITIES = ('P0', 'P1', 'P2', 'P3')
+
+
+def _iso(value):
+    return value.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def make_page(title, priority='P1', estimate=30, start=None, end=None, parent=None, database_id=DATABASE_ID):
+    """一个 Notion 页面对象（与 API 返回的结构一致）"""
+    edited = _iso(datetime.now(timezone.utc).replace(second=0, microsecond=0))
+    values = {
+        'Name': {'title': [{'type': 'text', 'text': {'content': title}, 'plain_text': title}]},
+        'Priority': {'select': {'name': priority}},
+        'Est': {'number': estimate},
+        'Status': {'status': {'name': '进行中'}},
+        'Time': {'date': {'start': start.isoformat(), 'end': end.isoformat() if end else None} if start else None},
+        'Parent': {'relation': [{'id': parent}] if parent else [], 'has_more': False},
+        'Sched': {'select': {'name': 'todo'}},
+    }
+    return {
+        'object': 'page',
+        'id': str(uuid.uuid4()),
+        'created_time': edited,
+        'last_edited_time': edited,
+        'archived': False,
+        'parent': {'type': 'database_id', 'database_id': database_id},
+        'properties': {
+            name: {'id': SCHEMA[name][0], 'type': SCHEMA[name][1], **value}
+            for name, value in values.items()
+        },
+    }
+
+
+def build_workspace(roots=20, children=3, depth=2, seed=1, start=None):
+    """
+    生成一个任务树：roots 个根任务，每个任务 children 个子任务，共 depth 层
+
+    时间盒从 start（默认当前时间后一小时，上海时间）起每 15 分钟开始一个，时长为预估时间，
+    预估超过 15 分钟的任务与下一个任务重叠；优先级和预估时间按 seed 随机
+    """
+    rng = random.Random(seed)
+    if start is None:
+        start = datetime.now(SHANGHAI).replace(second=0, microsecond=0) + timedelta(hours=1)
+    pages = []
+
+    def add(title, parent, level):
+        estimate = rng.choice((15, 30, 45, 60, 90))
+        task_start = start + timedelta(minutes=15 * len(pages))
+        page = make_page(
+            title, priority=rng.choice(PRIORITIES), estimate=estimate,
+            start=task_start, end=task_start + timedelta(minutes=estimate), parent=parent
+        )
+        pages.append(page)
+        if level < depth:
+            for index in range(children):
+                add(f'{title}.{index + 1}', page['id'], level + 1)
+
+    for index in range(roots):
+        add(f'任务 {index + 1}', None, 1)
+    return pages
+
+
+def database_object(database_id=DATABASE_ID):
+    return {
+        'object': 'database',
+        'id': database_id,
+        'title': [{'type': 'text', 'text': {'content': '任务（替身）'}, 'plain_text': '任务（替身）'}],
+        'properties': {
+            name: {'id': property_id, 'name': name, 'type': kind, kind: {}}
+            for name, (property_id, kind) in SCHEMA.items()
+        },
+    }
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=SHANGHAI)
+    return parsed
+
+
+def _property(page, name):
+    """按属性名或属性 ID 取页面的属性值"""
+    properties = page['properties']
+    if name in properties:
+        return properties[name]
+    for value in properties.values():
+        if value.get('id') == name:
+            return value
+    return None
+
+
+def _text(value):
+    return ''.join(item.get('plain_text', '') for item in value.get(value['type']) or [])
+
+
+def _compare(actual, condition):
+    """按 Notion 的条件运算符比较（未支持的运算符视为匹配）"""
+    for operator, expected in condition.items():
+        if operator == 'is_empty':
+            ok = actual in (None, '', [])
+        elif operator == 'is_not_empty':
+            ok = actual not in (None, '', [])
+        elif operator == 'equals':
+            ok = actual == expected
+        elif operator == 'does_not_equal':
+            ok = actual != expected
+        elif operator == 'contains':
+            ok = actual is not None and expected in actual
+        elif operator == 'does_not_contain':
+            ok = actual is None or expected not in actual
+        elif operator in ('after', 'before', 'on_or_after', 'on_or_before', 'greater_than', 'less_than',
+                          'greater_than_or_equal_to', 'less_than_or_equal_to'):
+            if isinstance(expected, str):
+                expected = _parse_time(expected)
+            if actual is None:
+                return False
+            ok = {
+                'after': actual > expected, 'greater_than': actual > expected,
+                'before': actual < expected, 'less_than': actual < expected,
+                'on_or_after': actual >= expected, 'greater_than_or_equal_to': actual >= expected,
+                'on_or_before': actual <= expected, 'less_than_or_equal_to': actual <= expected,
+            }[operator]
+        else:
+            ok = True
+        if not ok:
+            return False
+    return True
+
+
+def matches(page, condition):
+    """页面是否满足查询条件"""
+    if not condition:
+        return True
+    if 'and' in condition:
+        return all(matches(page, item) for item in condition['and'])
+    if 'or' in condition:
+        return any(matches(page, item) for item in condition['or'])
+    if condition.get('timestamp') in ('last_edited_time', 'created_time'):
+        name = condition['timestamp']
+        return _compare(_parse_time(page[name]), condition.get(name) or {})
+    value = _property(page, condition.get('property'))
+    if value is None:
+        return True
+    kind = value['type']
+    if kind not in condition:
+        return True
+    if kind in ('title', 'rich_text'):
+        actual = _text(value)
+    elif kind in ('select', 'status'):
+        actual = (value.get(kind) or {}).get('name')
+    elif kind == 'relation':
+        actual = [item['id'] for item in value.get('relation') or []]
+    elif kind == 'date':
+        actual = _parse_time((value.get('date') or {}).get('start'))
+    else:
+        actual = value.get(kind)
+    return _compare(actual, condition[kind])
+
+
+def _sort_key(page, sort):
+    if 'timestamp' in sort:
+        return page[sort['timestamp']]
+    value = _property(page, sort.get('property'))
+    if value is None:
+        return ''
+    kind = value['type']
+    if kind in ('select', 'status'):
+        return (value.get(kind) or {}).get('name') or ''
+    if kind == 'date':
+        return (value.get('date') or {}).get('start') or ''
+    if kind == 'title':
+        return _text(value)
+    return value.get(kind) if value.get(kind) is not None else ''
+
+
+class NotionStandin:
+    """在后台线程中运行的 Notion 替身"""
+
+    def __init__(self, pages=None, latency_ms=150, jitter_ms=30, persist_writes=False,
+                 database_id=DATABASE_ID, host='127.0.0.1', port=0):
+        self.pages = {page['id']: page for page in (pages if pages is not None else build_workspace())}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.persist_writes = persist_writes
+        self.database_id = database_id
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._in_flight = 0
+        self.peak_in_flight = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='notion-standin', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def counts(self):
+        """按端点统计的调用次数"""
+        with self._lock:
+            return dict(self._counts)
+
+    def reset_counts(self):
+        with self._lock:
+            self._counts.clear()
+            self.peak_in_flight = self._in_flight
+
+    # ---- 请求处理 ----
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _serve(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                status, payload = standin.handle(self.command, self.path.split('?')[0], body)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle(self, method, path, body):
+        """处理一个 API 请求，返回 (HTTP 状态码, 响应体)"""
+        with self._lock:
+            self._in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+        try:
+            delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+            if delay > 0:
+                time.sleep(delay / 1000)
+            endpoint, status, payload = self._route(method, path, body)
+            with self._lock:
+                self._counts[endpoint] += 1
+            return status, payload
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _route(self, method, path, body):
+        parts = [part for part in path.split('/') if part][1:]  # 去掉 v1
+        if parts[:1] == ['databases'] and len(parts) == 3 and parts[2] == 'query':
+            return 'databases.query', 200, self._query(body)
+        if parts[:1] == ['databases'] and len(parts) == 2:
+            return 'databases.retrieve', 200, database_object(parts[1])
+        if parts[:1] == ['pages'] and len(parts) == 2:
+            page_id = parts[1]
+            if method == 'PATCH':
+                return 'pages.update', *self._update(page_id, body)
+            with self._lock:
+                page = copy.deepcopy(self.pages.get(page_id))
+            if page is None:
+                return 'pages.retrieve', 404, {'object': 'error', 'status': 404, 'code': 'object_not_found',
+                                               'message': f'Could not find page with ID: {page_id}.'}
+            return 'pages.retrieve', 200, page
+        if parts == ['pages'] and method == 'POST':
+            return 'pages.create', 200, self._create(body)
+        if parts == ['users', 'me']:
+            return 'users.me', 200, {'object': 'user', 'id': 'standin-bot', 'type': 'bot', 'name': 'Notion 替身'}
+        if parts == ['search']:
+            return 'search', 200, {'object': 'list', 'results': [database_object(self.database_id)],
+                                   'has_more': False, 'next_cursor': None}
+        return 'unknown', 400, {'object': 'error', 'status': 400, 'code': 'invalid_request_url',
+                                'message': f'Invalid request URL: {method} {path}'}
+
+    def _query(self, body):
+        with self._lock:
+            pages = [page for page in self.pages.values() if not page.get('archived')]
+        pages = [page for page in pages if matches(page, body.get('filter'))]
+        for sort in reversed(body.get('sorts') or []):
+            pages.sort(key=lambda page: _sort_key(page, sort), reverse=sort.get('direction') == 'descending')
+        size = min(int(body.get('page_size') or 100), 100)
+        start = int(body.get('start_cursor') or 0)
+        chunk = pages[start:start + size]
+        more = start + size < len(pages)
+        return {'object': 'list', 'results': copy.deepcopy(chunk), 'has_more': more,
+                'next_cursor': str(start + size) if more else None}
+
+    def _update(self, page_id, body):
+        with self._lock:
+            page = self.pages.get(page_id)
+            if page is None:
+                return 404, {'object': 'error', 'status': 404, 'code': 'object_not_found',
+                             'message': f'Could not find page with ID: {page_id}.'}
+            updated = copy.deepcopy(page)
+            if 'archived' in body:
+                updated['archived'] = body['archived']
+            for name, value in (body.get('properties') or {}).items():
+                current = _property(updated, name)
+                if current is not None:
+                    current.update(copy.deepcopy(value))
+            updated['last_edited_time'] = _iso(datetime.now(timezone.utc).replace(second=0, microsecond=0))
+            if self.persist_writes:
+                self.pages[page_id] = updated
+            return 200, copy.deepcopy(updated)
+
+    def _create(self, body):
+        page = make_page('', database_id=self.database_id)
+        for name, value in (body.get('properties') or {}).items():
+            current = _property(page, name)
+            if current is not None:
+                current.update(copy.deepcopy(value))
+        if self.persist_writes:
+            with self._lock:
+                self.pages[page['id']] = page
+        return page
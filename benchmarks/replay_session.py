@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+离线重放一段录制的会话（例如真实的 /schedule → /schedule/confirm → /delay）
+
+录制：
+NOTION_CASSETTE_MODE=record NOTION_CASSETTE_PATH=session.jsonl.gz flask run
+（在浏览器中走一遍要测量的流程，令牌不会写入 cassette）
+
+重放：
+python benchmarks/replay_session.py session.jsonl.gz [--latency-scale 1.0] [--repeat 3] [--json]
+
+重放时不访问 Notion：按录制顺序请求同样的页面，Notion 调用由 cassette 返回录制的响应，
+延迟为录制值乘以 --latency-scale（0 表示不等待，只测量应用自身的开销）。
+应用本地的限速（NOTION_RATE_LIMIT_PER_SECOND / BURST）在重放时同样生效，属于被测量的行为；
+只比较应用开销时可以用环境变量调高。
+每次重放在新的子进程中进行（进程内缓存不会跨次保留），使用新的临时数据库，
+并按 cassette 中的配置（数据库 ID、属性映射）创建工作区
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLACEHOLDER_TOKEN = 'replay-token-{}'
+RESULT_MARKER = '__replay_result__'
+
+
+def load_session(path):
+    """cassette 中的配置与页面请求"""
+    from services.cassette import read_entries
+    entries = read_entries(path)
+    configs = [entry for entry in entries if entry.get('type') == 'config']
+    routes = [entry for entry in entries if entry.get('type') == 'route']
+    calls = sum(1 for entry in entries if entry.get('type') == 'call')
+    return configs, routes, calls
+
+
+def replay_once(cassette_path, latency_scale, database_url, configs, routes):
+    """在新的应用和数据库上按顺序重放全部页面请求，返回每个请求的耗时与 Notion 调用数"""
+    import app as app_module
+    from config import Config
+    from models.database import db, CalendarDatabaseConfig
+    from services.cassette import get_cassette, reset_cassettes
+
+    replay_config = type('ReplayConfig', (Config,), {
+        'SQLALCHEMY_DATABASE_URI': database_url, 'WARMUP_ENABLED': False,
+        'NOTION_CASSETTE_MODE': 'replay', 'NOTION_CASSETTE_PATH': cassette_path,
+        'NOTION_REPLAY_LATENCY_SCALE': latency_scale,
+    })
+    application = app_module.create_app(replay_config)
+    with application.app_context():
+        app_module.ensure_database_schema(application)
+        for entry in configs:
+            db.session.add(CalendarDatabaseConfig(
+                id=entry['config_id'], token=PLACEHOLDER_TOKEN.format(entry['config_id']),
+                database_id=entry['database_id'], property_mapping=entry.get('property_mapping') or {}
+            ))
+        db.session.commit()
+        app_module.config_cache.bump()
+
+    # 每次重放从 cassette 开头匹配
+    reset_cassettes()
+    cassette = get_cassette('replay', cassette_path, latency_scale)
+
+    client = application.test_client()
+    results = []
+    for route in routes:
+        calls_before = cassette.stats['calls']
+        started = time.perf_counter()
+        response = client.open(
+            route['path'], method=route['method'],
+            query_string=route.get('query') or None,
+            data=route.get('form') if route['method'] != 'GET' else None,
+        )
+        response.get_data()
+        results.append({
+            'route': f"{route['method']} {route['path']}",
+            'status': response.status_code,
+            'recorded_status': route.get('status'),
+            'elapsed_ms': (time.perf_counter() - started) * 1000,
+            'recorded_ms': route.get('elapsed_ms'),
+            'notion_calls': cassette.stats['calls'] - calls_before,
+        })
+    return results, dict(cassette.stats)
+
+
+def run_subprocess(cassette_path, latency_scale, database_url):
+    """在新进程中重放一次"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), cassette_path,
+         '--latency-scale', str(latency_scale), '--once', database_url],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"重放没有输出结果: {result.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线重放录制的 Notion 会话')
+    parser.add_argument('cassette', help='录制的 cassette 文件')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='录制延迟的倍数（0 表示不等待）')
+    parser.add_argument('--repeat', type=int, default=3, help='重放的次数')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    parser.add_argument('--once', metavar='DATABASE_URL', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    cassette_path = os.path.abspath(args.cassette)
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    os.environ['WARMUP_ENABLED'] = 'false'
+
+    configs, routes, recorded_calls = load_session(cassette_path)
+    if args.once:
+        # 子进程：重放一次，结果写到标准输出的最后一行
+        result = replay_once(cassette_path, args.latency_scale, args.once, configs, routes)
+        print(RESULT_MARKER, json.dumps(result))
+        return 0
+    if not routes:
+        print('❌ cassette 中没有页面请求（录制时需要通过应用访问页面）')
+        return 1
+
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for i in range(args.repeat):
+            database_url = f"sqlite:///{os.path.join(workdir, f'replay_{i}.db')}"
+            runs.append(run_subprocess(cassette_path, args.latency_scale, database_url))
+
+    summary = []
+    for index, route in enumerate(routes):
+        samples = [run[0][index] for run in runs]
+        summary.append({
+            'route': samples[0]['route'],
+            'status': samples[-1]['status'],
+            'recorded_status': route.get('status'),
+            'median_ms': round(statistics.median(sample['elapsed_ms'] for sample in samples), 1),
+            'recorded_ms': route.get('elapsed_ms'),
+            'notion_calls': samples[-1]['notion_calls'],
+        })
+    report = {
+        'cassette': cassette_path,
+        'latency_scale': args.latency_scale,
+        'repeat': args.repeat,
+        'recorded_calls': recorded_calls,
+        'total_median_ms': round(statistics.median(
+            sum(item['elapsed_ms'] for item in run[0]) for run in runs), 1),
+        'routes': summary,
+        'matching': runs[-1][1],
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    print(f"重放 {len(routes)} 个请求 × {args.repeat} 次（延迟倍数 {args.latency_scale}）")
+    print(f"{'请求':<40}{'状态':>6}{'重放 ms':>10}{'录制 ms':>10}{'Notion 调用':>12}")
+    for item in summary:
+        status = item['status'] if item['status'] == item['recorded_status'] else f"{item['status']}!"
+        print(f"{item['route'][:39]:<40}{status:>6}{item['median_ms']:>10.1f}"
+              f"{item['recorded_ms'] or 0:>10.1f}{item['notion_calls']:>12}")
+    matching = report['matching']
+    print(f"总耗时中位数 {report['total_median_ms']} ms；Notion 调用 {matching['calls']} 次"
+          f"（精确匹配 {matching['exact']}，按顺序匹配 {matching['fallback']}，未匹配 {matching['misses']}）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
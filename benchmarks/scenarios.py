@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+基准场景：在本地 Notion 替身上运行排程与延期的核心流程，测量耗时、Notion 调用数和峰值内存
+
+- tree_build：查询待排程的根任务并构建任务树（逐层查询子任务）
+- scheduling_core：对已构建的任务树排程（纯计算，重复 SCHEDULING_ROUNDS 次）
+- confirm_write_back：把排程结果写回 Notion（发件箱 + 批量写入）
+- delay_cascade：延期一个任务，顺延父任务与后续的冲突任务
+
+每次运行在新的子进程中进行（进程内缓存不会跨次保留），使用新的临时数据库；替身在父进程中运行，
+不保存写入，每次运行看到相同的工作区。只测量场景本身：准备步骤（例如确认前生成排程）不计入。
+Notion 调用数来自应用内的调用追踪；峰值内存由 tracemalloc 在单独的一次运行中测量
+（tracemalloc 会拖慢执行，不与耗时一起测）。应用本地的限速在基准中关闭，调用数反映对 Notion 的压力。
+
+通常通过 flask bench 运行（保存基线、与基线比较），也可以单独运行：
+python benchmarks/scenarios.py [--scenario tree_build] [--repeat 3] [--roots 20] [--json]
+"""
+
+import argparse
+import copy
+from datetime import datetime, timedelta
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.notion_standin import NotionStandin, STANDIN_MAPPING, SHANGHAI, build_workspace  # noqa: E402
+
+SCENARIO_NAMES = ('tree_build', 'scheduling_core', 'confirm_write_back', 'delay_cascade')
+SCHEDULING_ROUNDS = 20
+RESULT_MARKER = '__scenario_result__'
+DEFAULT_NOTION_LATENCY_MS = 20
+
+
+def workspace_start():
+    """工作区的第一个时间盒：今天 01:00（上海时间），延期的冲突范围与运行时刻无关"""
+    return datetime.now(SHANGHAI).replace(hour=1, minute=0, second=0, microsecond=0)
+
+
+def pick_delayed_task(pages):
+    """延期场景的任务：第一个与下一个任务重叠的叶任务"""
+    parents = {page['properties']['Parent']['relation'][0]['id']
+               for page in pages if page['properties']['Parent']['relation']}
+    for page, following in zip(pages, pages[1:]):
+        if page['id'] in parents:
+            continue
+        date = page['properties']['Time']['date']
+        if date['end'] > following['properties']['Time']['date']['start']:
+            return page['id']
+    raise LookupError('工作区中没有可以延期的任务')
+
+
+# ---- 子进程：运行一个场景 ----
+
+def _setup(base_url):
+    import app as app_module
+    from config import Config
+    from models.database import db, CalendarDatabaseConfig
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    bench_config = type('BenchmarkConfig', (Config,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'WARMUP_ENABLED': False, 'NOTION_API_BASE_URL': base_url,
+        'NOTION_RATE_LIMIT_PER_SECOND': 1000, 'NOTION_RATE_LIMIT_BURST': 1000,
+    })
+    application = app_module.create_app(bench_config)
+    context = application.app_context()
+    context.push()
+    app_module.ensure_database_schema(application)
+    config = CalendarDatabaseConfig(token='secret_benchmark0000', database_id='bench-database',
+                                    property_mapping=dict(STANDIN_MAPPING))
+    db.session.add(config)
+    db.session.commit()
+    return app_module, config
+
+
+def _prepare(name, app_module, config, options):
+    """场景的准备步骤（不计入测量），返回要测量的无参函数"""
+    notion = app_module.create_notion_client(config.token)
+    mapping = config.get_property_mapping()
+    start_time = app_module.round_time_to_5_minutes(datetime.now(SHANGHAI) + timedelta(hours=1))
+
+    if name == 'tree_build':
+        return lambda: app_module.build_task_tree_with_formatting(
+            notion, config, mapping, app_module.get_pending_tasks(config, notion, mapping)
+        )
+    if name == 'scheduling_core':
+        tree = app_module.build_task_tree_with_formatting(
+            notion, config, mapping, app_module.get_pending_tasks(config, notion, mapping)
+        )
+        trees = [copy.deepcopy(tree) for _ in range(SCHEDULING_ROUNDS)]
+        return lambda: [app_module.schedule_task_tree(item, start_time, 0, [], {}) for item in trees]
+    if name == 'confirm_write_back':
+        plan = app_module.plan_schedule(config, notion, mapping, start_time)
+        # 写入使用新的客户端，不复用准备阶段的请求缓存
+        writer = app_module.create_notion_client(config.token)
+        return lambda: app_module.write_schedule_to_notion(
+            writer, config, mapping, plan['task_tree'], plan['rest_tasks_info'], start_time, mark_scheduled=True,
+            planned_at=plan['planned_at']
+        )
+    if name == 'delay_cascade':
+        def run_delay():
+            result = app_module.process_task_delay(notion, config, mapping, options['task_id'])
+            if not result.get('success'):
+                raise RuntimeError(result.get('error'))
+            return result
+        return run_delay
+    raise ValueError(f'未知的场景: {name}')
+
+
+def run_scenario(name, base_url, options, measure_memory=False):
+    """在当前进程中运行一次场景，返回耗时、Notion 调用数和（可选的）峰值内存"""
+    from services.instrumentation import begin_notion_trace, end_notion_trace
+
+    app_module, config = _setup(base_url)
+    measured = _prepare(name, app_module, config, options)
+    if measure_memory:
+        import tracemalloc
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+    trace = begin_notion_trace()
+    started = time.perf_counter()
+    try:
+        measured()
+    finally:
+        wall_ms = (time.perf_counter() - started) * 1000
+        end_notion_trace()
+    result = {'wall_ms': wall_ms, 'api_calls': trace.count, 'api_errors': trace.summary()['errors']}
+    if measure_memory:
+        result['peak_memory_kb'] = (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+        tracemalloc.stop()
+    return result
+
+
+# ---- 父进程：启动替身，逐次在子进程中运行 ----
+
+def _run_subprocess(name, base_url, options, measure_memory):
+    command = [sys.executable, os.path.abspath(__file__), '--once', name, '--base-url', base_url,
+               '--options', json.dumps(options)]
+    if measure_memory:
+        command.append('--memory')
+    env = dict(os.environ, WARMUP_ENABLED='false')
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"场景 {name} 运行失败: {(result.stderr or result.stdout)[-2000:]}")
+
+
+def run_suite(names=SCENARIO_NAMES, repeat=3, roots=20, notion_latency_ms=DEFAULT_NOTION_LATENCY_MS,
+              progress=None):
+    """
+    运行一组场景
+
+    Returns:
+        dict: {'settings': {...}, 'scenarios': {场景: {'wall_ms', 'api_calls', 'peak_memory_kb', 'samples_ms'}}}
+    """
+    pages = build_workspace(roots=roots, start=workspace_start())
+    options = {'task_id': pick_delayed_task(pages)}
+    standin = NotionStandin(pages, latency_ms=notion_latency_ms, jitter_ms=0)
+    standin.start()
+    scenarios = {}
+    try:
+        for name in names:
+            runs = [_run_subprocess(name, standin.base_url, options, False) for _ in range(repeat)]
+            memory = _run_subprocess(name, standin.base_url, options, True)
+            scenarios[name] = {
+                'wall_ms': round(statistics.median(run['wall_ms'] for run in runs), 1),
+                'api_calls': max(run['api_calls'] for run in runs),
+                'api_errors': max(run['api_errors'] for run in runs),
+                'peak_memory_kb': round(memory['peak_memory_kb'], 1),
+                'samples_ms': [round(run['wall_ms'], 1) for run in runs],
+            }
+            if progress:
+                progress(name, scenarios[name])
+    finally:
+        standin.stop()
+    return {
+        'settings': {'repeat': repeat, 'roots': roots, 'pages': len(pages), 'notion_latency_ms': notion_latency_ms},
+        'scenarios': scenarios,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='运行排程与延期的基准场景')
+    parser.add_argument('--scenario', action='append', choices=SCENARIO_NAMES, help='要运行的场景，可重复')
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景运行的次数')
+    parser.add_argument('--roots', type=int, default=20, help='替身中的根任务数（每个 3 个子任务）')
+    parser.add_argument('--notion-latency', type=float, default=DEFAULT_NOTION_LATENCY_MS, help='替身的响应时间（毫秒）')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    parser.add_argument('--once', choices=SCENARIO_NAMES, help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--options', default='{}', help=argparse.SUPPRESS)
+    parser.add_argument('--memory', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    if args.once:
+        # 子进程：运行一次，结果写到标准输出的最后一行
+        result = run_scenario(args.once, args.base_url, json.loads(args.options), args.memory)
+        print(RESULT_MARKER, json.dumps(result))
+        return 0
+
+    report = run_suite(args.scenario or SCENARIO_NAMES, args.repeat, args.roots, args.notion_latency)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    print(f"{'场景':<22}{'耗时 ms':>10}{'Notion 调用':>12}{'峰值内存 KB':>13}")
+    for name, item in report['scenarios'].items():
+        print(f"{name:<22}{item['wall_ms']:>10.1f}{item['api_calls']:>12}{item['peak_memory_kb']:>13.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
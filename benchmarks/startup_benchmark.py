@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准：在全新的子进程中分别测量
+
+- import：只导入 app 模块（CLI 命令、迁移脚本、工作进程的冷启动）
+- create_app：导入并创建应用
+- first_request：创建应用并处理第一个请求（包含建表）
+
+运行方式：
+python benchmarks/startup_benchmark.py [--repeat 7] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    'import': "import app",
+    'create_app': "import app; app.create_app()",
+    'first_request': (
+        "import app; application = app.create_app(); "
+        "application.test_client().get('/')"
+    ),
+}
+
+
+def run_once(code, database_url):
+    """在新进程中执行一次，返回 (墙钟毫秒, 进程内毫秒)"""
+    probe = (
+        "import time; _started = time.perf_counter()\n"
+        f"{code}\n"
+        "print('__elapsed_ms__', (time.perf_counter() - _started) * 1000)\n"
+    )
+    env = dict(os.environ, DATABASE_URL=database_url, WARMUP_ENABLED='false')
+    env.pop('STARTUP_TIMING', None)
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', probe], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    inner_ms = None
+    for line in result.stdout.splitlines():
+        if line.startswith('__elapsed_ms__'):
+            inner_ms = float(line.split()[1])
+    return wall_ms, inner_ms
+
+
+def summarize(samples):
+    return {
+        'median_ms': round(statistics.median(samples), 1),
+        'min_ms': round(min(samples), 1),
+        'max_ms': round(max(samples), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量应用冷启动耗时')
+    parser.add_argument('--repeat', type=int, default=7, help='每个场景运行的次数')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, code in SCENARIOS.items():
+            wall, inner = [], []
+            for i in range(args.repeat):
+                # 每次使用新的数据库文件，first_request 包含建表的开销
+                database_url = f"sqlite:///{os.path.join(workdir, f'{name}_{i}.db')}"
+                wall_ms, inner_ms = run_once(code, database_url)
+                wall.append(wall_ms)
+                inner.append(inner_ms)
+            results[name] = {'wall': summarize(wall), 'in_process': summarize(inner)}
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"🚀 启动耗时（{args.repeat} 次，中位数 / 最小值）")
+    print(f"{'场景':<16}{'进程总耗时':>18}{'进程内耗时':>18}")
+    for name, result in results.items():
+        wall, inner = result['wall'], result['in_process']
+        print(f"{name:<16}{wall['median_ms']:>10.1f} / {wall['min_ms']:<6.1f}"
+              f"{inner['median_ms']:>10.1f} / {inner['min_ms']:<6.1f}")
+
+
+if __name__ == '__main__':
+    main()
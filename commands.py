@@ -0,0 +1,352 @@
+"""
+批处理命令行：不经过 Web 层，直接复用排程/延期/同步的核心逻辑，结果以 JSON 输出（含耗时）
+
+    flask --app app preview [--config-id 1 --config-id 2] [--start 2024-05-20T09:00] [--save plan.json]
+    flask --app app confirm [--preview-file plan.json]
+    flask --app app delay --config-id 1 --task-id <page_id>
+    flask --app app sync [--full]
+    flask --app app bench [--scenario tree_build] [--save] [--against <版本>] [--threshold wall_ms=30]
+
+不指定 --config-id 时处理所有已完成映射配置的数据库；--workers N 让多个配置在
+独立的工作进程中并行执行，适合 cron 一次为多个数据库排程。
+
+bench 在本地 Notion 替身上运行基准场景（benchmarks/scenarios.py），与按 git 版本保存的基线
+（benchmarks/baseline.json）比较，有指标超过阈值时以非零状态退出，可以放在 CI 中
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import json
+import multiprocessing
+import sys
+import time
+
+import click
+import pytz
+
+SHANGHAI_TZ = pytz.timezone('Asia/Shanghai')
+
+
+def default_start_time():
+    """默认起始时间：当前时间后5分钟，向上取整到5分钟倍数（与排程页面一致）"""
+    from app import round_time_to_5_minutes
+    return round_time_to_5_minutes(datetime.now(SHANGHAI_TZ) + timedelta(minutes=5))
+
+
+def parse_start_time(value):
+    """解析 --start（本地时间视为上海时间），并对齐到5分钟倍数"""
+    from app import round_time_to_5_minutes, localize_shanghai
+    if not value:
+        return default_start_time()
+    return round_time_to_5_minutes(localize_shanghai(datetime.fromisoformat(value)).astimezone(SHANGHAI_TZ))
+
+
+def preview_job(config, notion, mapping, options):
+    """排程预览：只计算，不写入 Notion"""
+    from app import plan_schedule, count_scheduled_tasks, prepare_task_tree_for_json
+    start_time = parse_start_time(options.get('start'))
+    plan = plan_schedule(config, notion, mapping, start_time, apply_correction=options.get('apply_correction'))
+    return {
+        'start_time': plan['start_time'].isoformat(),
+        'end_time': plan['end_time'].isoformat(),
+        'planned_at': plan['planned_at'].isoformat(),
+        'total_tasks': count_scheduled_tasks(plan['task_tree']),
+        'total_work_minutes': plan['total_work_minutes'],
+        'rest_tasks_count': len(plan['rest_tasks_info']),
+        'task_tree': prepare_task_tree_for_json(plan['task_tree']),
+        'rest_tasks_info': prepare_task_tree_for_json(plan['rest_tasks_info'])
+    }
+
+
+def confirm_job(config, notion, mapping, options):
+    """确认排程：有保存的预览时写入预览结果，否则重新排程后直接写入"""
+    from app import (
+        plan_schedule, write_schedule_to_notion, restore_task_tree_from_json
+    )
+    from services.singleflight import schedule_flight
+
+    saved = (options.get('previews') or {}).get(str(config.id))
+    if saved is not None:
+        task_tree = restore_task_tree_from_json(saved['task_tree'])
+        rest_tasks_info = restore_task_tree_from_json(saved.get('rest_tasks_info') or [])
+        start_time = parse_start_time(saved['start_time'])
+        key = f"confirm:{saved['start_time']}"
+        mark_scheduled = False
+        planned_at = datetime.fromisoformat(saved['planned_at']) if saved.get('planned_at') else None
+    else:
+        start_time = parse_start_time(options.get('start'))
+        plan = plan_schedule(config, notion, mapping, start_time, apply_correction=options.get('apply_correction'))
+        task_tree, rest_tasks_info = plan['task_tree'], plan['rest_tasks_info']
+        key = f'schedule:{start_time.isoformat()}'
+        mark_scheduled = True
+        planned_at = plan['planned_at']
+
+    result_data, _ = schedule_flight.run(
+        config.id, key,
+        lambda: write_schedule_to_notion(
+            notion, config, mapping, task_tree, rest_tasks_info, start_time, mark_scheduled=mark_scheduled,
+            planned_at=planned_at
+        )
+    )
+    return result_data
+
+
+def delay_job(config, notion, mapping, options):
+    """延期任务并保存操作记录（与 /delay 相同）"""
+    from app import process_task_delay
+    from models.database import db, TaskOperation
+    from services.singleflight import schedule_flight
+
+    task_id = options['task_id']
+
+    def run_delay():
+        result = process_task_delay(notion, config, mapping, task_id)
+        if result['success']:
+            db.session.add(TaskOperation(
+                config_id=config.id,
+                database_id=config.database_id,
+                tasks_affected=result.get('affected_tasks', 0),
+                delay_hours=0,
+                delay_minutes=0,
+                status='completed'
+            ))
+            db.session.commit()
+        return result
+
+    result, _ = schedule_flight.run(config.id, f'delay:{task_id}', run_delay)
+    if not result.get('success'):
+        raise RuntimeError(result.get('error', '未知错误'))
+    return result
+
+
+def sync_job(config, notion, mapping, options):
+    """同步页面镜像并刷新搜索索引"""
+    from services.mirror import sync_pages
+    from services.search_index import get_search_index
+    synced = sync_pages(notion, config, mapping, full=options.get('full', False))
+    get_search_index(config.id, force_refresh=True)
+    return {'synced_pages': synced}
+
+
+JOBS = {
+    'preview': preview_job,
+    'confirm': confirm_job,
+    'delay': delay_job,
+    'sync': sync_job,
+}
+
+
+def run_config_job(kind, config_id, options):
+    """在当前应用上下文中为一个配置执行任务，返回可 JSON 序列化的结果"""
+    from app import create_notion_client
+    from models.database import db, CalendarDatabaseConfig
+
+    started = time.perf_counter()
+    outcome = {'config_id': config_id, 'command': kind}
+    try:
+        config = db.session.get(CalendarDatabaseConfig, config_id)
+        if config is None:
+            raise LookupError(f'配置 #{config_id} 不存在')
+        if not config.database_id or not config.is_mapping_complete_for_scheduling():
+            raise ValueError(f'配置 #{config_id} 尚未完成数据库或属性映射设置')
+        notion = create_notion_client(config.token)
+        outcome['result'] = JOBS[kind](config, notion, config.get_property_mapping(), options)
+        outcome['ok'] = True
+    except Exception as e:
+        db.session.rollback()
+        outcome['ok'] = False
+        outcome['error'] = str(e)
+    outcome['timing_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return outcome
+
+
+def _worker_run(kind, config_id, options):
+    """工作进程入口：创建自己的应用与数据库连接后执行任务（数据表已由主进程创建）"""
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        return run_config_job(kind, config_id, options)
+
+
+def select_config_ids(config_ids):
+    """未指定时返回所有已配置数据库且映射完整的配置"""
+    from models.database import CalendarDatabaseConfig
+    if config_ids:
+        return list(config_ids)
+    return [
+        config.id for config in CalendarDatabaseConfig.query.order_by(CalendarDatabaseConfig.id)
+        if config.database_id and config.is_mapping_complete_for_scheduling()
+    ]
+
+
+def run_batch(kind, config_ids, options, workers=1):
+    """
+    对多个配置执行同一任务
+
+    Args:
+        kind: preview / confirm / delay / sync
+        config_ids: 配置 ID 列表
+        options: 传给任务的参数（必须可以 pickle）
+        workers: 大于 1 时用独立进程并行执行（每个进程有自己的应用与连接）
+
+    Returns:
+        dict: {'command', 'workers', 'results', 'timing_ms'}
+    """
+    started = time.perf_counter()
+    if workers > 1 and len(config_ids) > 1:
+        # spawn 避免 fork 继承数据库连接与事件循环线程
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(config_ids)), mp_context=context) as executor:
+            futures = [executor.submit(_worker_run, kind, config_id, options) for config_id in config_ids]
+            results = []
+            for config_id, future in zip(config_ids, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append({'config_id': config_id, 'command': kind, 'ok': False, 'error': str(e)})
+    else:
+        results = [run_config_job(kind, config_id, options) for config_id in config_ids]
+    return {
+        'command': kind,
+        'workers': workers,
+        'results': results,
+        'timing_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def emit(report, output=None):
+    """输出 JSON 报告；有失败的配置时以非零状态退出"""
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    click.echo(text)
+    if any(not item.get('ok') for item in report['results']):
+        sys.exit(1)
+
+
+def _prepare(config_ids):
+    from flask import current_app
+    from app import ensure_database_schema
+    ensure_database_schema(current_app._get_current_object())
+    config_ids = select_config_ids(config_ids)
+    if not config_ids:
+        raise click.ClickException('没有可处理的配置（需要已连接数据库并完成属性映射）')
+    return config_ids
+
+
+config_option = click.option('--config-id', 'config_ids', type=int, multiple=True,
+                             help='要处理的配置 ID，可重复；默认处理所有已完成配置的数据库')
+workers_option = click.option('--workers', type=int, default=1, show_default=True,
+                              help='并行的工作进程数')
+
+
+def register_batch_commands(app):
+    """注册批处理命令"""
+
+    @app.cli.command('preview')
+    @config_option
+    @workers_option
+    @click.option('--start', help='排程起始时间（上海时间，如 2024-05-20T09:00），默认当前时间后5分钟')
+    @click.option('--apply-correction', is_flag=True, help='按历史偏差修正预估时间')
+    @click.option('--save', 'save_path', help='把预览结果保存为 JSON 文件，供 confirm --preview-file 使用')
+    def preview_command(config_ids, workers, start, apply_correction, save_path):
+        """计算排程预览（不写入 Notion）"""
+        options = {'start': start, 'apply_correction': apply_correction}
+        emit(run_batch('preview', _prepare(config_ids), options, workers), save_path)
+
+    @app.cli.command('confirm')
+    @config_option
+    @workers_option
+    @click.option('--start', help='排程起始时间（上海时间），未指定预览文件时使用')
+    @click.option('--apply-correction', is_flag=True, help='按历史偏差修正预估时间')
+    @click.option('--preview-file', type=click.Path(exists=True, dir_okay=False),
+                  help='preview --save 保存的预览结果，只写入其中成功的配置')
+    def confirm_command(config_ids, workers, start, apply_correction, preview_file):
+        """排程并写入 Notion"""
+        options = {'start': start, 'apply_correction': apply_correction}
+        if preview_file:
+            with open(preview_file, encoding='utf-8') as f:
+                saved = json.load(f)
+            previews = {
+                str(item['config_id']): item['result']
+                for item in saved.get('results', []) if item.get('ok')
+            }
+            options['previews'] = previews
+            config_ids = config_ids or [int(config_id) for config_id in previews]
+        emit(run_batch('confirm', _prepare(config_ids), options, workers))
+
+    @app.cli.command('delay')
+    @click.option('--config-id', type=int, required=True, help='任务所在的配置 ID')
+    @click.option('--task-id', required=True, help='要延期的任务页面 ID')
+    def delay_command(config_id, task_id):
+        """延期任务并顺延父任务与后续任务"""
+        emit(run_batch('delay', _prepare([config_id]), {'task_id': task_id}))
+
+    @app.cli.command('sync')
+    @config_option
+    @workers_option
+    @click.option('--full', is_flag=True, help='忽略水位线全量同步')
+    def sync_command(config_ids, workers, full):
+        """同步页面镜像"""
+        emit(run_batch('sync', _prepare(config_ids), {'full': full}, workers))
+
+    @app.cli.command('bench')
+    @click.option('--scenario', 'scenarios', multiple=True,
+                  help='要运行的场景（tree_build / scheduling_core / confirm_write_back / delay_cascade），'
+                       '可重复；默认运行全部')
+    @click.option('--repeat', type=int, default=3, show_default=True, help='每个场景运行的次数（取中位数）')
+    @click.option('--roots', type=int, default=20, show_default=True, help='替身中的根任务数')
+    @click.option('--notion-latency', type=float, default=20, show_default=True, help='替身的响应时间（毫秒）')
+    @click.option('--baseline', 'baseline_path', help='基线文件，默认 benchmarks/baseline.json')
+    @click.option('--save', is_flag=True, help='把本次结果记录为当前 git 版本的基线')
+    @click.option('--against', help='比较的基线版本，默认最近记录的其他版本')
+    @click.option('--threshold', 'thresholds', multiple=True, metavar='METRIC=PERCENT',
+                  help='允许增加的百分比，可重复（默认 wall_ms=25 api_calls=0 peak_memory_kb=20）')
+    def bench_command(scenarios, repeat, roots, notion_latency, baseline_path, save, against, thresholds):
+        """运行基准场景并与基线比较，有退化时以非零状态退出"""
+        # 基准代码（替身服务器等）只在运行时导入，不增加应用启动的开销
+        from benchmarks.baseline import (
+            DEFAULT_BASELINE_PATH, compare, git_revision, load_baseline, parse_thresholds, save_baseline,
+            select_reference, settings_differ
+        )
+        from benchmarks.scenarios import SCENARIO_NAMES, run_suite
+
+        unknown = set(scenarios) - set(SCENARIO_NAMES)
+        if unknown:
+            raise click.ClickException(f"未知的场景: {', '.join(sorted(unknown))}")
+        baseline_path = baseline_path or DEFAULT_BASELINE_PATH
+        try:
+            limits = parse_thresholds(thresholds)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        revision = git_revision()
+        baseline = load_baseline(baseline_path)
+        try:
+            reference = select_reference(baseline, revision, against)
+        except LookupError as e:
+            raise click.ClickException(str(e))
+
+        def progress(name, item):
+            click.echo(f"⏱️ {name}: {item['wall_ms']} ms，Notion 调用 {item['api_calls']} 次，"
+                       f"峰值内存 {item['peak_memory_kb']} KB", err=True)
+
+        suite = run_suite(scenarios or SCENARIO_NAMES, repeat, roots, notion_latency, progress)
+        report = {'revision': revision, 'against': reference, **suite, 'comparison': [], 'regressions': []}
+        if reference is not None:
+            stored = baseline['revisions'][reference]
+            if settings_differ(stored['settings'], suite['settings']):
+                click.echo(f"⚠️ 基线 {reference} 的运行参数不同: {stored['settings']}", err=True)
+            report['comparison'], report['regressions'] = compare(suite, stored, limits)
+        else:
+            click.echo('ℹ️ 基线中没有可比较的版本，只输出本次结果', err=True)
+        if save:
+            save_baseline(suite, revision, baseline_path)
+            click.echo(f"✅ 已记录为版本 {revision} 的基线: {baseline_path}", err=True)
+
+        click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+        for row in report['regressions']:
+            click.echo(f"❌ {row['scenario']}.{row['metric']}: {row['baseline']} → {row['current']}"
+                       f"（{row['change_percent']}%，阈值 {row['threshold_percent']}%）", err=True)
+        if report['regressions']:
+            sys.exit(1)
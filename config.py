@@ -8,5 +8,80 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///notion_automation.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
-    NOTION_API_BASE_URL = 'https://api.notion.com/v1/'
+    # Notion API 地址，留空使用官方地址；负载测试时指向本地替身（benchmarks/notion_standin.py）
+    NOTION_API_BASE_URL = os.getenv('NOTION_API_BASE_URL', '')
     NOTION_VERSION = '2022-06-28'
+    
+    # Notion 写发件箱的并发与重试（OUTBOX_DRAIN_WORKERS 为未启用自适应并发时的线程数）
+    OUTBOX_DRAIN_WORKERS = int(os.getenv('OUTBOX_DRAIN_WORKERS', '3'))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '3'))
+    
+    # 写入前的 last_edited_time 预检查：批量达到阈值且镜像足够新时跳过
+    FRESHNESS_SKIP_THRESHOLD = int(os.getenv('FRESHNESS_SKIP_THRESHOLD', '50'))
+    MIRROR_FRESHNESS_SECONDS = int(os.getenv('MIRROR_FRESHNESS_SECONDS', '60'))
+    # 进程级页面缓存的有效期（秒），0 表示只使用请求级缓存
+    PAGE_CACHE_TTL_SECONDS = int(os.getenv('PAGE_CACHE_TTL_SECONDS', '0'))
+    
+    # 异步 Notion 访问：独立的读写通过事件循环线程并发执行，按令牌限速
+    NOTION_ASYNC_ENABLED = os.getenv('NOTION_ASYNC_ENABLED', 'true').lower() == 'true'
+    NOTION_RATE_LIMIT_PER_SECOND = float(os.getenv('NOTION_RATE_LIMIT_PER_SECOND', '3'))
+    NOTION_RATE_LIMIT_BURST = int(os.getenv('NOTION_RATE_LIMIT_BURST', '3'))
+    NOTION_MAX_CONCURRENCY = int(os.getenv('NOTION_MAX_CONCURRENCY', '4'))
+    # 优先级调度：同步调用也从令牌的调度器领取名额；权重与排队延迟目标按
+    # "interactive_read:8,interactive_write:4,background_sync:2,bulk_write:1" 的格式配置
+    NOTION_SCHEDULER_ENABLED = os.getenv('NOTION_SCHEDULER_ENABLED', 'true').lower() == 'true'
+    NOTION_PRIORITY_WEIGHTS = os.getenv('NOTION_PRIORITY_WEIGHTS', '')
+    NOTION_PRIORITY_TARGETS_MS = os.getenv('NOTION_PRIORITY_TARGETS_MS', '')
+    # 批量写入（发件箱、冲突调整）的自适应并发：按延迟与限速响应在 [MIN, MAX] 之间 AIMD 调整
+    BULK_WRITE_ADAPTIVE_ENABLED = os.getenv('BULK_WRITE_ADAPTIVE_ENABLED', 'true').lower() == 'true'
+    BULK_WRITE_MIN_CONCURRENCY = int(os.getenv('BULK_WRITE_MIN_CONCURRENCY', '1'))
+    BULK_WRITE_MAX_CONCURRENCY = int(os.getenv('BULK_WRITE_MAX_CONCURRENCY', '8'))
+    BULK_WRITE_LATENCY_TARGET_MS = int(os.getenv('BULK_WRITE_LATENCY_TARGET_MS', '1500'))
+    # 熔断器：连续 CIRCUIT_FAILURE_THRESHOLD 次故障（5xx、超时、慢于 CIRCUIT_SLOW_CALL_MS）后打开，
+    # 打开期间调用立即失败、排程写入暂存到发件箱，CIRCUIT_OPEN_SECONDS 后探测（失败则加倍，最多 MAX）
+    CIRCUIT_BREAKER_ENABLED = os.getenv('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+    CIRCUIT_OPEN_SECONDS = int(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+    CIRCUIT_MAX_OPEN_SECONDS = int(os.getenv('CIRCUIT_MAX_OPEN_SECONDS', '300'))
+    CIRCUIT_SLOW_CALL_MS = int(os.getenv('CIRCUIT_SLOW_CALL_MS', '15000'))
+    # Notion 调用录制/回放（离线基准测试）：NOTION_CASSETTE_MODE 为 record 或 replay，
+    # 回放延迟为录制延迟乘以 NOTION_REPLAY_LATENCY_SCALE（0 表示不等待），见 benchmarks/replay_session.py
+    NOTION_CASSETTE_MODE = os.getenv('NOTION_CASSETTE_MODE', '').lower()
+    NOTION_CASSETTE_PATH = os.getenv('NOTION_CASSETTE_PATH', 'instance/notion_cassette.jsonl.gz')
+    NOTION_REPLAY_LATENCY_SCALE = float(os.getenv('NOTION_REPLAY_LATENCY_SCALE', '1.0'))
+    # 数据库结构缓存的有效期（秒），配置页面总是重新获取
+    SCHEMA_CACHE_TTL_SECONDS = int(os.getenv('SCHEMA_CACHE_TTL_SECONDS', '600'))
+    # 合并并发的相同读取（相同令牌、端点和参数只调用一次 Notion）
+    READ_COALESCING_ENABLED = os.getenv('READ_COALESCING_ENABLED', 'true').lower() == 'true'
+    # 配置缓存：本进程修改配置时立即失效，TTL 限制其他进程修改后的最长延迟（0 表示只按版本失效）
+    CONFIG_CACHE_TTL_SECONDS = int(os.getenv('CONFIG_CACHE_TTL_SECONDS', '60'))
+    # 设置页面：令牌状态与数据库目录的缓存时间（秒），过期后在后台或按需刷新
+    TOKEN_STATUS_TTL_SECONDS = int(os.getenv('TOKEN_STATUS_TTL_SECONDS', '300'))
+    DATABASE_LIST_TTL_SECONDS = int(os.getenv('DATABASE_LIST_TTL_SECONDS', '300'))
+    
+    # 缓存预热：启动时一次，之后每天在 WARMUP_TIMES（上海时间，逗号分隔）运行
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', 'true').lower() == 'true'
+    WARMUP_TIMES = os.getenv('WARMUP_TIMES', '08:50')
+    
+    # 启动：默认在第一个请求时建表；MIGRATE_ON_INIT 强制初始化 Flask-Migrate
+    CREATE_SCHEMA_ON_STARTUP = os.getenv('CREATE_SCHEMA_ON_STARTUP', 'false').lower() == 'true'
+    MIGRATE_ON_INIT = os.getenv('MIGRATE_ON_INIT', 'false').lower() == 'true'
+    
+    # 响应输出：gzip/brotli 压缩（brotli 需安装 brotli 包）与 orjson 编码（需安装 orjson）
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '500'))
+    COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', '6'))
+    BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+    FAST_JSON_ENABLED = os.getenv('FAST_JSON_ENABLED', 'true').lower() == 'true'
+    
+    # 性能剖析（默认关闭）：开启后请求可带 X-Profile: sampling 或 cprofile 头剖析，也可在 /admin/profiles
+    # 切换为剖析所有请求；耗时超过 SLOW_REQUEST_THRESHOLD_MS（0 表示不捕获）的请求自动保存采样剖析
+    # 与 Notion 调用分布，最多保留 PROFILE_BUFFER_SIZE 个
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    # 剖析页面、X-Profile 头与 /api/metrics 的访问令牌（请求头 X-Admin-Token 或 admin_token 参数），
+    # 未设置时只允许本机访问；部署在反向代理之后时应设置
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+    SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '2000'))
+    PROFILE_BUFFER_SIZE = int(os.getenv('PROFILE_BUFFER_SIZE', '50'))
+    PROFILE_SAMPLE_INTERVAL_MS = int(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
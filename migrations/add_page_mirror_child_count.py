@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+数据迁移脚本：为页面镜像添加子任务计数，用于叶节点查询
+
+运行方式：
+python migrations/add_page_mirror_child_count.py
+
+迁移步骤：
+1. 为 page_mirror 添加 child_count 字段
+2. 创建 (config_id, timebox_start) 组合索引
+3. 用镜像中已有的父子关系回填子任务计数
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+
+from app import create_app
+from models.database import db, PageMirror
+
+INDEX_STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_page_mirror_config_start ON page_mirror (config_id, timebox_start)",
+]
+
+
+def add_missing_columns():
+    """为旧表补充新字段"""
+    columns = [col['name'] for col in inspect(db.engine).get_columns('page_mirror')]
+    if 'child_count' not in columns:
+        print("➕ 添加字段 page_mirror.child_count")
+        with db.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE page_mirror ADD COLUMN child_count INTEGER DEFAULT 0"))
+    else:
+        print("ℹ️  字段 child_count 已存在")
+
+
+def create_indexes():
+    """创建组合索引（已存在则跳过）"""
+    with db.engine.begin() as conn:
+        for statement in INDEX_STATEMENTS:
+            conn.execute(text(statement))
+    print(f"✅ 已确认 {len(INDEX_STATEMENTS)} 个索引")
+
+
+def backfill_child_counts():
+    """按镜像中的父子关系重建子任务计数"""
+    counts = {
+        (config_id, parent_id): count
+        for config_id, parent_id, count in db.session.query(
+            PageMirror.config_id, PageMirror.parent_id, db.func.count(PageMirror.id)
+        ).filter(
+            PageMirror.parent_id.isnot(None),
+            PageMirror.archived.is_(False),
+            PageMirror.timebox_start.isnot(None)
+        ).group_by(PageMirror.config_id, PageMirror.parent_id)
+    }
+
+    updated = 0
+    for row in PageMirror.query.order_by(PageMirror.id).yield_per(500):
+        row.child_count = counts.get((row.config_id, row.page_id), 0)
+        updated += 1
+
+    db.session.commit()
+    print(f"✅ 回填了 {updated} 个镜像页面的子任务计数")
+
+
+def migrate():
+    """执行迁移"""
+    app = create_app()
+
+    with app.app_context():
+        print("🚀 开始迁移页面镜像结构...")
+
+        db.create_all()
+
+        try:
+            add_missing_columns()
+            create_indexes()
+            backfill_child_counts()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ 迁移失败: {str(e)}")
+            return
+
+        print("\n✨ 迁移完成！")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+数据迁移脚本：为排程/任务操作记录添加索引，并建立按天预聚合表
+
+运行方式：
+python migrations/add_schedule_history_indexes.py
+
+迁移步骤：
+1. 为 schedule_operation 添加 api_duration_ms 字段
+2. 为 task_operation / schedule_operation 创建 (config_id, created_at)、(config_id, status) 组合索引
+3. 创建 schedule_daily_stat 预聚合表
+4. 用已有的排程记录回填预聚合数据
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+
+from app import create_app
+from models.database import db, ScheduleOperation, ScheduleDailyStat
+from services.history import apply_to_daily_stat
+
+INDEX_STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_task_operation_config_created ON task_operation (config_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_task_operation_config_status ON task_operation (config_id, status)",
+    "CREATE INDEX IF NOT EXISTS ix_schedule_operation_config_created ON schedule_operation (config_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_schedule_operation_config_status ON schedule_operation (config_id, status)",
+]
+
+
+def add_missing_columns():
+    """为旧表补充新字段"""
+    columns = [col['name'] for col in inspect(db.engine).get_columns('schedule_operation')]
+    if 'api_duration_ms' not in columns:
+        print("➕ 添加字段 schedule_operation.api_duration_ms")
+        with db.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE schedule_operation ADD COLUMN api_duration_ms INTEGER DEFAULT 0"))
+    else:
+        print("ℹ️  字段 api_duration_ms 已存在")
+
+
+def create_indexes():
+    """创建组合索引（已存在则跳过）"""
+    with db.engine.begin() as conn:
+        for statement in INDEX_STATEMENTS:
+            conn.execute(text(statement))
+    print(f"✅ 已确认 {len(INDEX_STATEMENTS)} 个索引")
+
+
+def backfill_daily_stats():
+    """清空并用历史排程记录重建预聚合表"""
+    ScheduleDailyStat.query.delete()
+    db.session.flush()
+
+    count = 0
+    completed = ScheduleOperation.query.filter(ScheduleOperation.status != 'pending')
+    for operation in completed.order_by(ScheduleOperation.id).yield_per(500):
+        apply_to_daily_stat(operation)
+        count += 1
+        if count % 500 == 0:
+            db.session.flush()
+
+    db.session.commit()
+    print(f"✅ 回填了 {count} 条排程记录的日聚合数据")
+
+
+def migrate():
+    """执行迁移"""
+    app = create_app()
+
+    with app.app_context():
+        print("🚀 开始迁移排程历史结构...")
+
+        # create_all 只会创建缺失的表（schedule_daily_stat），不会修改已有表
+        db.create_all()
+
+        try:
+            add_missing_columns()
+            create_indexes()
+            backfill_daily_stats()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ 迁移失败: {str(e)}")
+            return
+
+        print("\n✨ 迁移完成！")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+数据迁移脚本：为任务计划记录添加取整前的计划时长
+
+运行方式：
+python migrations/add_task_plan_planned_minutes.py
+
+迁移步骤：
+1. 为 task_plan_record 添加 planned_minutes 字段
+
+已有的记录保持为空：其中混有父任务的计划，预估修正只使用新写入的叶任务记录
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+
+from app import create_app
+from models.database import db
+
+
+def add_missing_columns():
+    """为旧表补充新字段"""
+    columns = [col['name'] for col in inspect(db.engine).get_columns('task_plan_record')]
+    if 'planned_minutes' not in columns:
+        print("➕ 添加字段 task_plan_record.planned_minutes")
+        with db.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE task_plan_record ADD COLUMN planned_minutes FLOAT"))
+    else:
+        print("ℹ️  字段 planned_minutes 已存在")
+
+
+def migrate():
+    """执行迁移"""
+    app = create_app()
+
+    with app.app_context():
+        print("🚀 开始迁移任务计划记录结构...")
+
+        db.create_all()
+
+        try:
+            add_missing_columns()
+        except Exception as e:
+            print(f"❌ 迁移失败: {str(e)}")
+            return
+
+        print("\n✨ 迁移完成！")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -18,6 +18,11 @@ class CalendarDatabaseConfig(db.Model):
     # 关联的操作记录
     task_operations = db.relationship('TaskOperation', backref='config', lazy=True, cascade='all, delete-orphan')
     schedule_operations = db.relationship('ScheduleOperation', backref='config', lazy=True, cascade='all, delete-orphan')
+    schedule_daily_stats = db.relationship('ScheduleDailyStat', backref='config', lazy=True, cascade='all, delete-orphan')
+    mirrored_pages = db.relationship('PageMirror', backref='config', lazy='dynamic', cascade='all, delete-orphan')
+    mirror_state = db.relationship('PageMirrorState', backref='config', uselist=False, cascade='all, delete-orphan')
+    task_plans = db.relationship('TaskPlanRecord', backref='config', lazy='dynamic', cascade='all, delete-orphan')
+    outbox_entries = db.relationship('NotionWriteOutbox', backref='config', lazy='dynamic', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<CalendarDatabaseConfig {self.database_id}>'
@@ -27,9 +32,11 @@ class CalendarDatabaseConfig(db.Model):
         return self.property_mapping or {}
     
     def set_property_mapping(self, mapping_dict):
-        """设置属性映射"""
+        """设置属性映射（提交后配置缓存失效）"""
+        from services.config_cache import config_cache
         self.property_mapping = mapping_dict
         self.updated_at = datetime.utcnow()
+        config_cache.bump_on_commit(db.session)
     
     def update_property_mapping(self, **kwargs):
         """更新属性映射的部分字段"""
@@ -69,12 +76,27 @@ class CalendarDatabaseConfig(db.Model):
     
     @staticmethod
     def get_current_config():
-        """获取当前配置（应该只有一条记录）"""
-        return CalendarDatabaseConfig.query.first()
+        """获取当前请求选择的工作区配置，未选择（或已删除）时返回第一个配置"""
+        from services.workspaces import selected_config_id
+        config_id = selected_config_id()
+        if config_id is not None:
+            config = db.session.get(CalendarDatabaseConfig, config_id)
+            if config is not None:
+                return config
+        return CalendarDatabaseConfig.query.order_by(CalendarDatabaseConfig.id).first()
+    
+    @staticmethod
+    def get_all_configs():
+        """所有工作区配置（按创建顺序）"""
+        return CalendarDatabaseConfig.query.order_by(CalendarDatabaseConfig.id).all()
 
 class TaskOperation(db.Model):
     """任务操作记录表"""
     __tablename__ = 'task_operation'
+    __table_args__ = (
+        db.Index('ix_task_operation_config_created', 'config_id', 'created_at'),
+        db.Index('ix_task_operation_config_status', 'config_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     config_id = db.Column(db.Integer, db.ForeignKey('calendar_database_config.id'), nullable=False)
@@ -91,6 +113,11 @@ class TaskOperation(db.Model):
 class ScheduleOperation(db.Model):
     """排程操作记录表"""
     __tablename__ = 'schedule_operation'
+    __table_args__ = (
+        # 历史页按配置 + 创建时间做 keyset 分页
+        db.Index('ix_schedule_operation_config_created', 'config_id', 'created_at', 'id'),
+        db.Index('ix_schedule_operation_config_status', 'config_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     config_id = db.Column(db.Integer, db.ForeignKey('calendar_database_config.id'), nullable=False)
@@ -99,8 +126,127 @@ class ScheduleOperation(db.Model):
     start_time = db.Column(db.DateTime, nullable=False)
     include_breaks = db.Column(db.Boolean, default=False)
     status = db.Column(db.String(50), default='pending')
+    api_duration_ms = db.Column(db.Integer, default=0)  # 写回 Notion 的耗时
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    task_plans = db.relationship('TaskPlanRecord', backref='operation', lazy='dynamic')
+    outbox_entries = db.relationship('NotionWriteOutbox', backref='operation', lazy='dynamic')
+    
     def __repr__(self):
         return f'<ScheduleOperation {self.id}: {self.tasks_scheduled} tasks>'
 
+class ScheduleDailyStat(db.Model):
+    """排程操作按天预聚合表（每次写入排程记录时增量更新）"""
+    __tablename__ = 'schedule_daily_stat'
+    __table_args__ = (
+        db.UniqueConstraint('config_id', 'day', name='uq_schedule_daily_stat_config_day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    config_id = db.Column(db.Integer, db.ForeignKey('calendar_database_config.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)  # 上海时区日期
+    operations_count = db.Column(db.Integer, default=0)
+    partial_count = db.Column(db.Integer, default=0)
+    tasks_scheduled = db.Column(db.Integer, default=0)
+    api_duration_ms_total = db.Column(db.Integer, default=0)
+    
+    def __repr__(self):
+        return f'<ScheduleDailyStat {self.day}: {self.operations_count} ops>'
+    
+    @property
+    def partial_failure_rate(self):
+        """部分失败的排程占比"""
+        if not self.operations_count:
+            return 0.0
+        return self.partial_count / self.operations_count
+    
+    @property
+    def avg_api_duration_ms(self):
+        """平均每次排程的 API 写回耗时"""
+        if not self.operations_count:
+            return 0
+        return self.api_duration_ms_total // self.operations_count
+
+
+class PageMirror(db.Model):
+    """Notion 页面本地镜像（按 last_edited_time 增量同步）"""
+    __tablename__ = 'page_mirror'
+    __table_args__ = (
+        db.UniqueConstraint('config_id', 'page_id', name='uq_page_mirror_config_page'),
+        db.Index('ix_page_mirror_config_edited', 'config_id', 'last_edited_time'),
+        db.Index('ix_page_mirror_config_start', 'config_id', 'timebox_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    config_id = db.Column(db.Integer, db.ForeignKey('calendar_database_config.id'), nullable=False)
+    page_id = db.Column(db.String(100), nullable=False)
+    title = db.Column(db.String(500), default='')
+    priority = db.Column(db.String(50), default='')
+    status = db.Column(db.String(100), default='')
+    estimated_minutes = db.Column(db.Float, default=0)
+    timebox_start = db.Column(db.DateTime, nullable=True)  # UTC
+    timebox_end = db.Column(db.DateTime, nullable=True)  # UTC
+    parent_id = db.Column(db.String(100), nullable=True)
+    child_count = db.Column(db.Integer, default=0)  # 有时间盒、未归档的子任务数，0 表示叶节点
+    archived = db.Column(db.Boolean, default=False)
+    last_edited_time = db.Column(db.DateTime, nullable=True)  # UTC
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PageMirror {self.page_id}>'
+
+class PageMirrorState(db.Model):
+    """页面镜像的同步状态（每个配置一行）"""
+    __tablename__ = 'page_mirror_state'
+    
+    config_id = db.Column(db.Integer, db.ForeignKey('calendar_database_config.id'), primary_key=True)
+    content_version = db.Column(db.Integer, default=0, nullable=False)  # 镜像内容实际变化时才递增，用于 ETag
+    synced_at = db.Column(db.DateTime, nullable=True)  # 最近一次同步完成的时间（UTC），没有变化也会更新
+    
+    def __repr__(self):
+        return f'<PageMirrorState {self.config_id} v{self.content_version}>'
+
+class TaskPlanRecord(db.Model):
+    """排程写回时每个叶任务的计划时间（用于计划与实际的对比分析）"""
+    __tablename__ = 'task_plan_record'
+    __table_args__ = (
+        db.Index('ix_task_plan_record_config_page', 'config_id', 'page_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    config_id = db.Column(db.Integer, db.ForeignKey('calendar_database_config.id'), nullable=False)
+    operation_id = db.Column(db.Integer, db.ForeignKey('schedule_operation.id'), nullable=True)
+    page_id = db.Column(db.String(100), nullable=False)
+    priority = db.Column(db.String(50), default='')
+    estimated_minutes = db.Column(db.Float, default=0)
+    planned_minutes = db.Column(db.Float, nullable=True)  # 取整到5分钟前的计划时长（含修正）
+    planned_start = db.Column(db.DateTime, nullable=False)  # UTC
+    planned_end = db.Column(db.DateTime, nullable=False)  # UTC
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TaskPlanRecord {self.page_id}>'
+
+class NotionWriteOutbox(db.Model):
+    """Notion 写操作发件箱：先落库再执行，失败的写入可以单独重放"""
+    __tablename__ = 'notion_write_outbox'
+    __table_args__ = (
+        db.Index('ix_notion_write_outbox_operation_status', 'operation_id', 'status'),
+        db.Index('ix_notion_write_outbox_config_status', 'config_id', 'status'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    config_id = db.Column(db.Integer, db.ForeignKey('calendar_database_config.id'), nullable=False)
+    operation_id = db.Column(db.Integer, db.ForeignKey('schedule_operation.id'), nullable=True)
+    kind = db.Column(db.String(50), nullable=False)  # task_time / rest_task / rest_cleanup
+    action = db.Column(db.String(20), nullable=False)  # update / create
+    page_id = db.Column(db.String(100), nullable=True)  # create 成功后回填新页面 ID
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), default='pending')  # pending / succeeded / failed / deferred
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NotionWriteOutbox {self.id}: {self.action} {self.status}>'
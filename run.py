@@ -4,6 +4,7 @@ Notion Automation Tool - 启动文件
 """
 
 if __name__ == "__main__":
-    from app import create_app
+    from app import create_app, start_warmup
     app = create_app()
+    start_warmup(app, use_reloader=True)
     app.run(debug=True, host="0.0.0.0", port=5001)
@@ -0,0 +1,99 @@
+"""
+批量写入的自适应并发（AIMD：加性增、乘性减）
+
+- 每次批量写入成功且平滑后的延迟低于目标时，并发上限增加 1/上限（约每一轮加 1）
+- 收到限速响应（429 / rate_limited）、超时，或平滑延迟超过目标时，上限乘以 decrease_factor，
+  两次减小之间至少间隔一个平滑延迟，避免同一批慢请求把上限连续砍到底
+- 上限限制在 [min_limit, max_limit] 之间，由 PriorityScheduler 用来限制 bulk_write 的在途数量
+"""
+
+import time
+
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 8
+DEFAULT_LATENCY_TARGET_MS = 1500
+DEFAULT_DECREASE_FACTOR = 0.5
+LATENCY_SMOOTHING = 0.2
+THROTTLE_CODES = ('rate_limited',)
+THROTTLE_STATUSES = (429, 502, 503, 504)
+
+
+def is_throttle(error):
+    """调用失败是否表示 Notion 在限速或过载（应减小并发）"""
+    if error is None:
+        return False
+    status = getattr(error, 'status', None)
+    code = getattr(error, 'code', None)
+    if status in THROTTLE_STATUSES or code in THROTTLE_CODES:
+        return True
+    name = type(error).__name__
+    return 'Timeout' in name or name == 'RequestTimeoutError'
+
+
+class AIMDController:
+    """单个令牌的批量写入并发上限（只在事件循环线程中更新）"""
+
+    def __init__(self, min_limit=DEFAULT_MIN_LIMIT, max_limit=DEFAULT_MAX_LIMIT, initial_limit=None,
+                 latency_target_ms=DEFAULT_LATENCY_TARGET_MS, decrease_factor=DEFAULT_DECREASE_FACTOR):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target_ms = latency_target_ms
+        self.decrease_factor = decrease_factor
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial_limit or 2)))
+        self.latency_ms = None  # 平滑后的延迟
+        self._last_decrease_at = 0.0
+        self.stats = {'successes': 0, 'throttles': 0, 'slow': 0, 'increases': 0, 'decreases': 0}
+
+    @property
+    def current(self):
+        """当前允许的在途数量"""
+        return max(self.min_limit, int(self.limit))
+
+    def on_result(self, latency_ms, error=None):
+        """记录一次调用的结果，按结果调整上限"""
+        if error is not None and not is_throttle(error):
+            # 参数错误等与负载无关的失败不影响上限
+            return
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += LATENCY_SMOOTHING * (latency_ms - self.latency_ms)
+
+        if error is not None:
+            self.stats['throttles'] += 1
+            self._decrease()
+        elif self.latency_ms > self.latency_target_ms:
+            self.stats['slow'] += 1
+            self._decrease()
+        else:
+            self.stats['successes'] += 1
+            if self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.stats['increases'] += 1
+
+    def on_throttle(self):
+        """其他类别的调用被限速：令牌的额度已经用完，同样减小批量写入的并发"""
+        self.stats['throttles'] += 1
+        self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        cooldown = max(0.2, (self.latency_ms or 0) / 1000)
+        if now - self._last_decrease_at < cooldown:
+            return
+        self._last_decrease_at = now
+        limit = max(self.min_limit, self.limit * self.decrease_factor)
+        if limit < self.limit:
+            self.limit = limit
+            self.stats['decreases'] += 1
+
+    def snapshot(self):
+        return {
+            'limit': self.current,
+            'limit_exact': round(self.limit, 2),
+            'min_limit': self.min_limit,
+            'max_limit': self.max_limit,
+            'latency_ewma_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'latency_target_ms': self.latency_target_ms,
+            **self.stats,
+        }
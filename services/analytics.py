@@ -0,0 +1,173 @@
+"""
+计划与实际对比分析：基于本地保存的排程计划和页面镜像构建列式数组，
+计算各优先级的超时分布，并为排程器提供预估时间修正系数
+"""
+
+import numpy as np
+
+from models.database import db, PageMirror, TaskPlanRecord
+
+# 样本过少时不给出修正，修正系数限制在合理区间内
+MIN_SAMPLES_FOR_CORRECTION = 5
+CORRECTION_CLIP = (0.5, 3.0)
+PERCENTILES = (50, 90)
+UNSET_PRIORITY_LABEL = '未设置'
+
+
+def load_duration_columns(config_id):
+    """
+    以每个页面最近一次的排程计划为准，关联镜像中的实际时间盒，
+    构建列式数组
+
+    只使用记录了取整前计划时长的叶任务计划；更早的记录中混有父任务（时间跨度包含子任务与休息），不参与统计
+
+    Returns:
+        dict: {
+            'page_ids': np.ndarray[object],
+            'priorities': np.ndarray[object],
+            'estimate': np.ndarray[float64]  预估分钟,
+            'planned': np.ndarray[float64]   计划时长（分钟，取整到5分钟后）,
+            'planned_raw': np.ndarray[float64] 取整前的计划时长（分钟）,
+            'actual': np.ndarray[float64]    当前时间盒时长（分钟，延期后）,
+        }
+    """
+    latest_plan_ids = db.session.query(
+        db.func.max(TaskPlanRecord.id)
+    ).filter(
+        TaskPlanRecord.config_id == config_id
+    ).group_by(TaskPlanRecord.page_id)
+
+    rows = db.session.query(
+        TaskPlanRecord.page_id,
+        TaskPlanRecord.priority,
+        TaskPlanRecord.estimated_minutes,
+        TaskPlanRecord.planned_minutes,
+        TaskPlanRecord.planned_start,
+        TaskPlanRecord.planned_end,
+        PageMirror.timebox_start,
+        PageMirror.timebox_end,
+    ).join(
+        PageMirror,
+        db.and_(
+            PageMirror.config_id == TaskPlanRecord.config_id,
+            PageMirror.page_id == TaskPlanRecord.page_id
+        )
+    ).filter(
+        TaskPlanRecord.id.in_(latest_plan_ids),
+        TaskPlanRecord.planned_minutes.isnot(None),
+        PageMirror.archived.is_(False),
+        PageMirror.timebox_start.isnot(None),
+        PageMirror.timebox_end.isnot(None)
+    ).all()
+
+    if not rows:
+        empty = np.empty(0, dtype=np.float64)
+        return {
+            'page_ids': np.empty(0, dtype=object),
+            'priorities': np.empty(0, dtype=object),
+            'estimate': empty,
+            'planned': empty.copy(),
+            'planned_raw': empty.copy(),
+            'actual': empty.copy(),
+        }
+
+    page_ids, priorities, estimate, planned_raw, planned_start, planned_end, actual_start, actual_end = zip(*rows)
+
+    def minutes_between(starts, ends):
+        start_arr = np.array(starts, dtype='datetime64[s]')
+        end_arr = np.array(ends, dtype='datetime64[s]')
+        return (end_arr - start_arr).astype(np.float64) / 60.0
+
+    return {
+        'page_ids': np.array(page_ids, dtype=object),
+        'priorities': np.array([p or '' for p in priorities], dtype=object),
+        'estimate': np.array(estimate, dtype=np.float64),
+        'planned': minutes_between(planned_start, planned_end),
+        'planned_raw': np.array(planned_raw, dtype=np.float64),
+        'actual': minutes_between(actual_start, actual_end),
+    }
+
+
+def compute_overrun_distribution(columns):
+    """
+    按优先级统计实际时长相对预估的超时分布
+
+    排程时计划时长向上取整到5分钟，时间盒比预估多出的取整部分不算超时：
+    实际时长先扣除 (计划时长 - 取整前的计划时长) 再与原始预估比较
+
+    Returns:
+        dict: {priority: {'count', 'mean_ratio', 'p50_ratio', 'p90_ratio',
+                          'mean_overrun_minutes', 'overrun_share', 'mean_slip_minutes'}}
+    """
+    estimate = columns['estimate']
+    valid = estimate > 0
+    if not valid.any():
+        return {}
+
+    priorities = columns['priorities'][valid]
+    estimate = estimate[valid]
+    planned = columns['planned'][valid]
+    actual = columns['actual'][valid]
+    unrounded_actual = actual - (planned - columns['planned_raw'][valid])
+
+    ratio = unrounded_actual / estimate
+    overrun = unrounded_actual - estimate
+    slip = actual - planned  # 延期联动造成的实际时间盒相对计划的变化
+
+    labels, inverse = np.unique(priorities.astype(str), return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(labels))
+
+    def group_mean(values):
+        return np.bincount(inverse, weights=values, minlength=len(labels)) / counts
+
+    mean_ratio = group_mean(ratio)
+    mean_overrun = group_mean(overrun)
+    mean_slip = group_mean(slip)
+    overrun_share = group_mean((overrun > 0).astype(np.float64))
+
+    # 按组排序后一次切片计算分位数，避免逐组布尔掩码扫描
+    order = np.argsort(inverse, kind='stable')
+    sorted_ratio = ratio[order]
+    boundaries = np.concatenate(([0], np.cumsum(counts)))
+
+    distribution = {}
+    for index, label in enumerate(labels):
+        group = sorted_ratio[boundaries[index]:boundaries[index + 1]]
+        p50, p90 = np.percentile(group, PERCENTILES)
+        distribution[str(label) or UNSET_PRIORITY_LABEL] = {
+            'count': int(counts[index]),
+            'mean_ratio': round(float(mean_ratio[index]), 3),
+            'p50_ratio': round(float(p50), 3),
+            'p90_ratio': round(float(p90), 3),
+            'mean_overrun_minutes': round(float(mean_overrun[index]), 1),
+            'overrun_share': round(float(overrun_share[index]), 3),
+            'mean_slip_minutes': round(float(mean_slip[index]), 1),
+        }
+    return distribution
+
+
+def compute_correction_factors(columns, min_samples=MIN_SAMPLES_FOR_CORRECTION):
+    """
+    以各优先级实际/预估比值的中位数作为预估时间修正系数
+
+    Returns:
+        dict: {priority: factor}，样本不足的优先级不出现在结果中
+    """
+    factors = {}
+    for priority, stats in compute_overrun_distribution(columns).items():
+        if stats['count'] < min_samples:
+            continue
+        factors[priority] = float(np.clip(stats['p50_ratio'], *CORRECTION_CLIP))
+    return factors
+
+
+def get_correction_factors(config_id):
+    """排程器使用的入口：从数据库构建数组并返回修正系数"""
+    return compute_correction_factors(load_duration_columns(config_id))
+
+
+def corrected_estimate(estimated_minutes, priority, factors):
+    """按优先级修正单个任务的预估时间"""
+    if not factors:
+        return estimated_minutes
+    return estimated_minutes * factors.get(priority or UNSET_PRIORITY_LABEL, 1.0)
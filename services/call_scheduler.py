@@ -0,0 +1,239 @@
+"""
+Notion 调用的优先级调度：每个令牌一个调度器，所有调用（同步客户端和异步执行器）
+都从这里领取执行名额，共享同一个限速桶和并发上限
+
+调用分为四类：
+- interactive_read：页面请求中的读取（/delay 选择器、预览等）
+- interactive_write：页面请求中的写入（延期调整等）
+- background_sync：后台线程、命令行中的读取（预热、镜像同步）
+- bulk_write：批量写入（发件箱 drain），以及后台的写入
+
+名额按权重公平分配（stride 调度：每类有一个 pass 值，每领取一次加 1/权重，
+取 pass 最小的类）；某类队首的等待超过它的延迟目标时优先放行。
+交互请求没有排队时，批量任务可以用满全部剩余额度
+
+bulk_write 可以配置自适应并发（services/adaptive_concurrency.py）：它的在途数量由 AIMD
+控制器决定，不占用其他类别的并发上限；其余类别共享 max_concurrency
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import threading
+import time
+
+from flask import has_request_context
+
+from services.adaptive_concurrency import is_throttle
+from services.instrumentation import percentile
+
+INTERACTIVE_READ = 'interactive_read'
+INTERACTIVE_WRITE = 'interactive_write'
+BACKGROUND_SYNC = 'background_sync'
+BULK_WRITE = 'bulk_write'
+CALL_CLASSES = (INTERACTIVE_READ, INTERACTIVE_WRITE, BACKGROUND_SYNC, BULK_WRITE)
+
+DEFAULT_WEIGHTS = {INTERACTIVE_READ: 8, INTERACTIVE_WRITE: 4, BACKGROUND_SYNC: 2, BULK_WRITE: 1}
+DEFAULT_TARGETS_MS = {INTERACTIVE_READ: 300, INTERACTIVE_WRITE: 1000, BACKGROUND_SYNC: 5000, BULK_WRITE: 30000}
+WRITE_METHODS = ('create', 'update', 'delete', 'append')
+STATS_WINDOW = 500
+
+_background = ContextVar('notion_background_calls', default=False)
+
+
+def is_write(endpoint):
+    """endpoint（如 pages.update）是否为写操作"""
+    return endpoint.rsplit('.', 1)[-1] in WRITE_METHODS
+
+
+@contextmanager
+def background_calls():
+    """把代码块中的 Notion 调用标记为后台调用（读取为 background_sync，写入为 bulk_write）"""
+    reset_token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(reset_token)
+
+
+def classify(endpoint):
+    """按调用类型和当前上下文确定优先级类别（需要在发起调用的线程中计算）"""
+    background = _background.get() or not has_request_context()
+    if is_write(endpoint):
+        return BULK_WRITE if background else INTERACTIVE_WRITE
+    return BACKGROUND_SYNC if background else INTERACTIVE_READ
+
+
+def parse_class_settings(text, defaults):
+    """
+    解析 "interactive_read:8,bulk_write:1" 形式的配置，未列出的类别使用默认值
+
+    Returns:
+        dict: 类别 -> 数值
+    """
+    settings = dict(defaults)
+    for item in (text or '').split(','):
+        name, _, value = item.partition(':')
+        name = name.strip()
+        if name not in settings:
+            continue
+        try:
+            settings[name] = max(float(value), 0.001)
+        except ValueError:
+            print(f"⚠️ 忽略无效的优先级配置: {item}")
+    return settings
+
+
+class PriorityScheduler:
+    """
+    单个令牌的调度器：限速桶 + 并发上限 + 按类别的等待队列
+
+    acquire / release 只在令牌的事件循环线程中调用，统计信息可以从任意线程读取
+    """
+
+    def __init__(self, rate_per_second, burst, max_concurrency, weights=None, targets_ms=None, adaptive=None):
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.targets_ms = dict(targets_ms or DEFAULT_TARGETS_MS)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.in_flight = 0
+        # 类别 -> AIMDController，这些类别的在途数量由控制器单独限制
+        self.adaptive = dict(adaptive or {})
+        self._in_flight_by_class = {name: 0 for name in CALL_CLASSES}
+        self._queues = {name: deque() for name in CALL_CLASSES}
+        self._pass = {name: 0.0 for name in CALL_CLASSES}
+        self._virtual_time = 0.0
+        self._timer = None
+        self._stats_lock = threading.Lock()
+        self._waits = {name: deque(maxlen=STATS_WINDOW) for name in CALL_CLASSES}
+        self._granted = {name: 0 for name in CALL_CLASSES}
+        self._missed = {name: 0 for name in CALL_CLASSES}
+
+    async def acquire(self, call_class):
+        """等待一个执行名额，返回排队时间（毫秒）"""
+        if call_class not in self._queues:
+            raise ValueError(f"未知的调用类别: {call_class}")
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._queues[call_class]
+        if not queue:
+            # 空闲后重新排队的类别不能积攒之前没用的份额
+            self._pass[call_class] = max(self._pass[call_class], self._virtual_time)
+        enqueued_at = time.monotonic()
+        queue.append((waiter, enqueued_at))
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(call_class)
+            raise
+        return (time.monotonic() - enqueued_at) * 1000
+
+    def release(self, call_class, latency_ms=None, error=None):
+        """
+        一次调用结束，归还并发名额
+
+        Args:
+            call_class: acquire 时的类别
+            latency_ms: 调用耗时（不含排队），用于自适应并发
+            error: 调用抛出的异常，限速响应会减小自适应类别的并发
+        """
+        self.in_flight = max(0, self.in_flight - 1)
+        self._in_flight_by_class[call_class] = max(0, self._in_flight_by_class[call_class] - 1)
+        controller = self.adaptive.get(call_class)
+        if controller is not None and latency_ms is not None:
+            controller.on_result(latency_ms, error)
+        elif is_throttle(error):
+            for controller in self.adaptive.values():
+                controller.on_throttle()
+        self._dispatch()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _has_capacity(self, call_class):
+        controller = self.adaptive.get(call_class)
+        if controller is not None:
+            return self._in_flight_by_class[call_class] < controller.current
+        shared = self.in_flight - sum(self._in_flight_by_class[name] for name in self.adaptive)
+        return shared < self.max_concurrency
+
+    def _pick(self, now):
+        """选择下一个放行的类别：先看是否有超过延迟目标的队首，再按 pass 值"""
+        candidates = [name for name in CALL_CLASSES if self._queues[name] and self._has_capacity(name)]
+        if not candidates:
+            return None
+        overdue = max(
+            candidates,
+            key=lambda name: (now - self._queues[name][0][1]) * 1000 / self.targets_ms[name]
+        )
+        if (now - self._queues[overdue][0][1]) * 1000 >= self.targets_ms[overdue]:
+            return overdue
+        return min(candidates, key=lambda name: (self._pass[name], CALL_CLASSES.index(name)))
+
+    def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            call_class = self._pick(now)
+            if call_class is None:
+                return
+            waiter, enqueued_at = self._queues[call_class][0]
+            if waiter.done():
+                # 等待方已超时或取消
+                self._queues[call_class].popleft()
+                continue
+            self._refill()
+            if self.tokens < 1:
+                if self._timer is None:
+                    delay = (1 - self.tokens) / self.rate
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+                return
+            self._queues[call_class].popleft()
+            self.tokens -= 1
+            self.in_flight += 1
+            self._in_flight_by_class[call_class] += 1
+            self._virtual_time = self._pass[call_class]
+            self._pass[call_class] += 1 / self.weights[call_class]
+            wait_ms = (now - enqueued_at) * 1000
+            with self._stats_lock:
+                self._waits[call_class].append(wait_ms)
+                self._granted[call_class] += 1
+                if wait_ms > self.targets_ms[call_class]:
+                    self._missed[call_class] += 1
+            waiter.set_result(None)
+
+    def snapshot(self):
+        """各类别的排队数、放行数、排队时间 p50/p95 与超过目标的次数"""
+        with self._stats_lock:
+            waits = {name: sorted(values) for name, values in self._waits.items()}
+            granted = dict(self._granted)
+            missed = dict(self._missed)
+        classes = {}
+        for name in CALL_CLASSES:
+            classes[name] = {
+                'weight': self.weights[name],
+                'target_ms': self.targets_ms[name],
+                'queued': len(self._queues[name]),
+                'in_flight': self._in_flight_by_class[name],
+                'granted': granted[name],
+                'wait_p50_ms': round(percentile(waits[name], 0.5), 1) if waits[name] else None,
+                'wait_p95_ms': round(percentile(waits[name], 0.95), 1) if waits[name] else None,
+                'target_misses': missed[name],
+            }
+        return {
+            'in_flight': self.in_flight,
+            'max_concurrency': self.max_concurrency,
+            'rate_per_second': self.rate,
+            'classes': classes,
+            'adaptive': {name: controller.snapshot() for name, controller in self.adaptive.items()},
+        }
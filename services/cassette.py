@@ -0,0 +1,220 @@
+"""
+Notion 调用的录制与回放（离线基准测试用）
+
+- 录制（NOTION_CASSETTE_MODE=record）：经过 NotionGateway 的每次 SDK 调用把
+  (端点, 参数, 响应或错误, 耗时) 追加到磁盘上的 cassette；同时记录页面路由的请求顺序
+  和用到的配置（数据库 ID、属性映射），以便整段会话离线重放
+- 回放（NOTION_CASSETTE_MODE=replay）：不访问网络，按 (端点, 规范化参数) 匹配录制的响应，
+  同一请求多次出现时按录制顺序返回；参数含当天日期等无法精确匹配时，退回到同一端点的录制顺序。
+  延迟按录制值乘以 NOTION_REPLAY_LATENCY_SCALE（0 表示不等待）
+
+cassette 为 JSON Lines（.gz 结尾时 gzip 压缩），写入前去掉令牌：
+请求/响应中形如 secret_xxx / ntn_xxx 的字符串和名为 token 的表单字段都会被替换
+"""
+
+from collections import defaultdict, deque
+from datetime import datetime
+import gzip
+import json
+import re
+import threading
+import time
+
+from services.singleflight import normalize_body
+
+CASSETTE_VERSION = 1
+TOKEN_PATTERN = re.compile(r'\b(secret_|ntn_)[A-Za-z0-9]{10,}')
+SCRUBBED = '<scrubbed>'
+SECRET_FIELDS = ('token', 'notion_token', 'auth', 'csrf_token')
+
+
+class CassetteMiss(LookupError):
+    """回放时找不到匹配的录制调用"""
+
+
+class ReplayedAPIError(Exception):
+    """回放录制时的 Notion 错误（保留 status / code，熔断器和自适应并发按原样处理）"""
+
+    def __init__(self, message, status=None, code=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def scrub(value):
+    """递归去掉令牌"""
+    if isinstance(value, str):
+        return TOKEN_PATTERN.sub(SCRUBBED, value)
+    if isinstance(value, dict):
+        return {
+            key: SCRUBBED if key in SECRET_FIELDS and item else scrub(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [scrub(item) for item in value]
+    return value
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def read_entries(path):
+    """读取 cassette 中的全部记录"""
+    with _open(path, 'r') as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+class Cassette:
+    """一个 cassette 文件，录制或回放（线程安全）"""
+
+    def __init__(self, path, mode, latency_scale=1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"未知的 cassette 模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._recorded_configs = set()
+        self._calls = defaultdict(deque)  # (endpoint, body) -> 录制的调用
+        self._by_endpoint = defaultdict(deque)  # endpoint -> 录制的调用（按顺序）
+        self.stats = {'calls': 0, 'exact': 0, 'fallback': 0, 'misses': 0}
+        if mode == 'record':
+            self._append({'type': 'meta', 'version': CASSETTE_VERSION,
+                          'recorded_at': datetime.utcnow().isoformat()})
+        else:
+            self._load()
+
+    # ---- 录制 ----
+
+    def _append(self, entry):
+        line = json.dumps(scrub(entry), ensure_ascii=False, separators=(',', ':'), default=str)
+        with self._lock:
+            # gzip 追加会产生多个 member，读取时按一个流处理
+            with _open(self.path, 'a') as handle:
+                handle.write(line + '\n')
+
+    def record_call(self, endpoint, kwargs, response=None, error=None, latency_ms=0.0):
+        entry = {'type': 'call', 'endpoint': endpoint, 'request': kwargs,
+                 'latency_ms': round(latency_ms, 1)}
+        if error is not None:
+            entry['error'] = {
+                'type': type(error).__name__, 'message': str(error),
+                'status': getattr(error, 'status', None), 'code': getattr(error, 'code', None),
+            }
+        else:
+            entry['response'] = response
+        self._append(entry)
+
+    def record_route(self, method, path, query, form, status, elapsed_ms):
+        self._append({'type': 'route', 'method': method, 'path': path, 'query': query,
+                      'form': form, 'status': status, 'elapsed_ms': round(elapsed_ms, 1)})
+
+    def record_config(self, config):
+        """记录会话用到的配置（每个配置一次，不含令牌）"""
+        if config.id in self._recorded_configs:
+            return
+        self._recorded_configs.add(config.id)
+        self._append({'type': 'config', 'config_id': config.id, 'database_id': config.database_id,
+                      'property_mapping': dict(config.mapping)})
+
+    # ---- 回放 ----
+
+    def _load(self):
+        for entry in read_entries(self.path):
+            if entry.get('type') != 'call':
+                continue
+            body = normalize_body(entry.get('request'))
+            self._calls[(entry['endpoint'], body)].append(entry)
+            self._by_endpoint[entry['endpoint']].append(entry)
+
+    def _take(self, endpoint, kwargs):
+        key = (endpoint, normalize_body(scrub(kwargs)))
+        with self._lock:
+            # 每个队列保留最后一条，之后的相同请求重复返回它
+            self.stats['calls'] += 1
+            queue = self._calls.get(key)
+            if queue:
+                entry = queue.popleft() if len(queue) > 1 else queue[0]
+                self.stats['exact'] += 1
+            elif self._by_endpoint.get(endpoint):
+                queue = self._by_endpoint[endpoint]
+                entry = queue.popleft() if len(queue) > 1 else queue[0]
+                self.stats['fallback'] += 1
+            else:
+                self.stats['misses'] += 1
+                raise CassetteMiss(f"cassette 中没有 {endpoint} 的录制")
+        return entry
+
+    def replay_call(self, endpoint, kwargs):
+        entry = self._take(endpoint, kwargs)
+        delay = (entry.get('latency_ms') or 0) * self.latency_scale / 1000
+        if delay > 0:
+            time.sleep(delay)
+        error = entry.get('error')
+        if error:
+            raise ReplayedAPIError(error.get('message'), status=error.get('status'), code=error.get('code'))
+        return json.loads(json.dumps(entry.get('response')))
+
+    # ---- 客户端包装 ----
+
+    def wrap(self, client):
+        """
+        包装 notion_client.Client：录制模式下透传并记录，回放模式下不需要真实客户端
+        """
+        return _CassetteProxy(self, client if self.mode == 'record' else None, '')
+
+
+class _CassetteProxy:
+    """按属性路径拼出端点名（pages.retrieve、users.me），调用时录制或回放"""
+
+    def __init__(self, cassette, target, path):
+        self._cassette = cassette
+        self._target = target
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        target = getattr(self._target, name) if self._target is not None else None
+        return _CassetteProxy(self._cassette, target, f'{self._path}.{name}' if self._path else name)
+
+    def __call__(self, *args, **kwargs):
+        request = dict(kwargs, _args=list(args)) if args else kwargs
+        if self._cassette.mode == 'replay':
+            return self._cassette.replay_call(self._path, request)
+        started = time.perf_counter()
+        try:
+            response = self._target(*args, **kwargs)
+        except Exception as e:
+            self._cassette.record_call(self._path, request, error=e,
+                                       latency_ms=(time.perf_counter() - started) * 1000)
+            raise
+        self._cassette.record_call(self._path, request, response=response,
+                                   latency_ms=(time.perf_counter() - started) * 1000)
+        return response
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(mode, path, latency_scale=1.0):
+    """进程内共享的 cassette（mode 为空时返回 None）"""
+    if not mode or not path:
+        return None
+    with _cassettes_lock:
+        cassette = _cassettes.get((mode, path))
+        if cassette is None:
+            cassette = _cassettes[(mode, path)] = Cassette(path, mode, latency_scale)
+            print(f"📼 Notion cassette {mode}: {path}")
+        cassette.latency_scale = latency_scale
+        return cassette
+
+
+def reset_cassettes():
+    """丢弃进程内的 cassette（重放从头开始匹配）"""
+    with _cassettes_lock:
+        _cassettes.clear()
@@ -0,0 +1,250 @@
+"""
+按令牌的熔断器：Notion 变慢或不可用时快速失败，而不是每个调用都等到超时
+
+- 关闭（closed）：正常调用；连续 failure_threshold 次故障（5xx、超时、连接错误，
+  或耗时超过 slow_call_ms）后打开
+- 打开（open）：所有调用立即抛出 CircuitOpenError，不排队、不访问网络；
+  经过 open_seconds 后进入半开，并在后台用探测函数（users.me）主动探测一次
+- 半开（half_open）：只放行一个探测调用，其余仍快速失败；探测成功则关闭，
+  失败则重新打开并把打开时间加倍（不超过 max_open_seconds）
+
+429 限速不算故障（由自适应并发处理）；参数错误等 4xx 说明服务正常，也不算故障。
+熔断关闭时通知监听者（用于重放打开期间暂存到发件箱的写入）
+"""
+
+import threading
+import time
+
+from services.notion_gateway import token_key
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATE_LABELS = {CLOSED: '正常', OPEN: '已熔断', HALF_OPEN: '探测恢复中'}
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_OPEN_SECONDS = 30
+DEFAULT_MAX_OPEN_SECONDS = 300
+DEFAULT_SLOW_CALL_MS = 15000
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器打开时的快速失败"""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(1, int(retry_after))
+        super().__init__(f'Notion 暂时不可用（连续请求失败，已暂停访问），约 {self.retry_after} 秒后自动重试')
+
+
+def is_outage(error):
+    """调用失败是否说明 Notion 故障（5xx、超时、网络错误）"""
+    if error is None or isinstance(error, CircuitOpenError):
+        return False
+    status = getattr(error, 'status', None)
+    if isinstance(status, int):
+        return status >= 500
+    name = type(error).__name__
+    return any(part in name for part in ('Timeout', 'Connect', 'Network', 'Transport', 'Protocol'))
+
+
+class CircuitBreaker:
+    """单个令牌的熔断状态"""
+
+    def __init__(self, key, registry, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 open_seconds=DEFAULT_OPEN_SECONDS, max_open_seconds=DEFAULT_MAX_OPEN_SECONDS,
+                 slow_call_ms=DEFAULT_SLOW_CALL_MS):
+        self.key = key
+        self.registry = registry
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.slow_call_ms = slow_call_ms
+        self.probe = None  # 无参函数，打开后用于主动探测
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._current_open_seconds = open_seconds
+        self._opened_until = 0.0
+        self._probe_in_flight = False
+        self._timer = None
+        self.stats = {'opens': 0, 'rejected': 0, 'failures': 0, 'probes': 0, 'last_error': None}
+
+    def retry_after(self):
+        return max(0.0, self._opened_until - time.monotonic())
+
+    def before_call(self):
+        """
+        调用前检查，打开时抛出 CircuitOpenError
+
+        Returns:
+            bool: 本次调用是否为半开状态下的探测
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() >= self._opened_until:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self.stats['probes'] += 1
+                return True
+            self.stats['rejected'] += 1
+            retry_after = self.retry_after() or 1
+        raise CircuitOpenError(retry_after)
+
+    def record(self, latency_ms=None, error=None, probe=False):
+        """记录一次调用结果（latency_ms 为 None 时不做慢调用判断）"""
+        failure = is_outage(error) or (
+            error is None and latency_ms is not None and latency_ms > self.slow_call_ms
+        )
+        closed = False
+        with self._lock:
+            if failure:
+                self.stats['failures'] += 1
+                self.stats['last_error'] = str(error) if error is not None else f'慢调用 {latency_ms:.0f} ms'
+            if probe:
+                self._probe_in_flight = False
+                if failure:
+                    self._open(min(self._current_open_seconds * 2, self.max_open_seconds))
+                else:
+                    closed = self._close()
+            elif self.state == CLOSED:
+                if failure:
+                    self._failures += 1
+                    if self._failures >= self.failure_threshold:
+                        self._open(self.open_seconds)
+                elif error is None or not isinstance(error, CircuitOpenError):
+                    self._failures = 0
+        if closed:
+            self.registry.notify_closed(self.key)
+
+    def release_probe(self, probe):
+        """探测调用没有真正执行（例如排队超时）时归还探测名额"""
+        if probe:
+            with self._lock:
+                self._probe_in_flight = False
+
+    def call(self, fn):
+        """在熔断器保护下执行 fn"""
+        probe = self.before_call()
+        started = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            self.record((time.monotonic() - started) * 1000, e, probe)
+            raise
+        self.record((time.monotonic() - started) * 1000, None, probe)
+        return result
+
+    def _open(self, seconds):
+        # 调用方持有锁
+        self.state = OPEN
+        self._failures = 0
+        self._current_open_seconds = seconds
+        self._opened_until = time.monotonic() + seconds
+        self.stats['opens'] += 1
+        print(f"🔌 Notion 熔断器已打开（工作区 {self.key[:8]}），{seconds:.0f} 秒后探测: {self.stats['last_error']}")
+        self._schedule_probe(seconds)
+
+    def _close(self):
+        # 调用方持有锁
+        was_open = self.state != CLOSED
+        self.state = CLOSED
+        self._failures = 0
+        self._current_open_seconds = self.open_seconds
+        if was_open:
+            print(f"🔌 Notion 熔断器已关闭（工作区 {self.key[:8]}）")
+        return was_open
+
+    def _schedule_probe(self, seconds):
+        if self.probe is None:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(seconds, self._run_probe)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run_probe(self):
+        self._timer = None
+        try:
+            self.call(self.probe)
+        except Exception:
+            # 探测失败或已有其他探测在进行，状态已在 record 中更新
+            pass
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'label': STATE_LABELS[self.state],
+                'retry_after_seconds': round(self.retry_after()) if self.state != CLOSED else 0,
+                'consecutive_failures': self._failures,
+                **self.stats,
+            }
+
+
+class CircuitBreakerRegistry:
+    """按令牌管理熔断器"""
+
+    def __init__(self):
+        self.enabled = True
+        self.settings = {}
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._listeners = {}
+
+    def configure(self, enabled=True, **settings):
+        """更新参数（已创建的熔断器保持不变）"""
+        self.enabled = enabled
+        self.settings = {key: value for key, value in settings.items() if value}
+
+    def for_token(self, token, probe=None):
+        """
+        令牌的熔断器，未启用时返回 None
+
+        Args:
+            probe: 主动探测函数（第一次提供时保存）
+        """
+        if not self.enabled:
+            return None
+        key = token_key(token)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(key, self, **self.settings)
+        if breaker.probe is None and probe is not None:
+            breaker.probe = probe
+        return breaker
+
+    def state(self, token):
+        """令牌的熔断状态快照，没有记录时返回 None"""
+        with self._lock:
+            breaker = self._breakers.get(token_key(token))
+        return breaker.snapshot() if breaker is not None else None
+
+    def add_listener(self, name, listener):
+        """
+        注册熔断关闭时的回调 listener(token_key)
+
+        同名的回调只保留最后注册的一个，多次创建应用不会让回调重复执行
+        """
+        with self._lock:
+            self._listeners[name] = listener
+
+    def notify_closed(self, key):
+        with self._lock:
+            listeners = list(self._listeners.values())
+        for listener in listeners:
+            try:
+                listener(key)
+            except Exception as e:
+                print(f"⚠️ 熔断恢复回调失败: {str(e)}")
+
+    def snapshot(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.key[:8]: breaker.snapshot() for breaker in breakers}
+
+
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,148 @@
+"""
+进程内配置缓存：请求热路径上不再查询 calendar_database_config、不再重复解析映射
+
+- 缓存的是只读快照 ConfigSnapshot（配置字段 + 预先校验过的只读映射）
+- 全局版本号：set_property_mapping 提交后、/connect 保存后、/reset-config 后递增，
+  版本变化时下一次读取重新加载所有配置（配置只有几条，一次查询全部载入）
+- CONFIG_CACHE_TTL_SECONDS 限制多进程部署下其他进程修改配置后的最长延迟
+- 需要修改配置的地方通过 snapshot.model() 取得 ORM 对象
+"""
+
+import threading
+import time
+from types import MappingProxyType
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+DEFAULT_TTL_SECONDS = 60
+# 排程功能必需的映射字段（与 CalendarDatabaseConfig.is_mapping_complete_for_scheduling 一致）
+SCHEDULING_REQUIRED_FIELDS = (
+    'title_property',
+    'timebox_start_property',
+    'schedule_status_property',
+    'schedule_status_todo_value'
+)
+_BUMP_ON_COMMIT = 'config_cache_bump'
+
+
+class ConfigSnapshot:
+    """配置的只读快照，接口与 CalendarDatabaseConfig 的读取方法一致"""
+
+    __slots__ = ('id', 'token', 'database_id', 'created_at', 'updated_at', 'version',
+                 'mapping', 'mapping_complete')
+
+    def __init__(self, config, version):
+        mapping = dict(config.property_mapping or {})
+        values = {
+            'id': config.id,
+            'token': config.token,
+            'database_id': config.database_id,
+            'created_at': config.created_at,
+            'updated_at': config.updated_at,
+            'version': version,
+            'mapping': MappingProxyType(mapping),
+            'mapping_complete': all(mapping.get(field) for field in SCHEDULING_REQUIRED_FIELDS),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ConfigSnapshot 是只读的，请通过 model() 修改配置')
+
+    def __repr__(self):
+        return f'<ConfigSnapshot #{self.id} {self.database_id} v{self.version}>'
+
+    def get_property_mapping(self):
+        """属性映射的可修改副本"""
+        return dict(self.mapping)
+
+    def is_mapping_complete_for_scheduling(self):
+        return self.mapping_complete
+
+    def get_mapped_property(self, property_type):
+        return self.mapping.get(property_type)
+
+    def get_mapped_property_id(self, property_type):
+        return self.mapping.get(property_type)
+
+    def model(self):
+        """对应的 ORM 对象（用于写入）"""
+        from models.database import db, CalendarDatabaseConfig
+        return db.session.get(CalendarDatabaseConfig, self.id)
+
+
+class ConfigCache:
+    """按版本号失效的配置快照缓存"""
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._version = 0
+        self._loaded_version = None
+        self._loaded_at = 0.0
+        self._snapshots = {}  # config_id -> ConfigSnapshot，按 ID 排序
+        self.stats = {'hits': 0, 'loads': 0, 'bumps': 0}
+
+    @property
+    def version(self):
+        return self._version
+
+    def bump(self):
+        """配置已变化：递增版本号，下一次读取重新加载"""
+        with self._lock:
+            self._version += 1
+            self.stats['bumps'] += 1
+
+    def bump_on_commit(self, session):
+        """在 session 提交成功后再递增版本号（避免并发请求在提交前载入旧数据）"""
+        session.info[_BUMP_ON_COMMIT] = True
+
+    def _is_fresh(self):
+        if self._loaded_version != self._version:
+            return False
+        return not self.ttl_seconds or time.monotonic() - self._loaded_at <= self.ttl_seconds
+
+    def _snapshots_by_id(self):
+        with self._lock:
+            if self._is_fresh():
+                self.stats['hits'] += 1
+                return self._snapshots
+            version = self._version
+        # 在锁外查询数据库，载入期间的 bump 会让结果在下一次读取时再次失效
+        from models.database import CalendarDatabaseConfig
+        configs = CalendarDatabaseConfig.get_all_configs()
+        snapshots = {config.id: ConfigSnapshot(config, version) for config in configs}
+        with self._lock:
+            self.stats['loads'] += 1
+            if self._version == version:
+                self._snapshots = snapshots
+                self._loaded_version = version
+                self._loaded_at = time.monotonic()
+        return snapshots
+
+    def get(self, config_id):
+        """指定 ID 的配置快照，不存在时返回 None"""
+        return self._snapshots_by_id().get(config_id)
+
+    def all(self):
+        """所有配置快照（按 ID 排序）"""
+        return list(self._snapshots_by_id().values())
+
+    def current(self):
+        """当前请求选择的工作区快照，未选择或已删除时返回第一个配置"""
+        from services.workspaces import selected_config_id
+        snapshots = self._snapshots_by_id()
+        config_id = selected_config_id()
+        if config_id is not None and config_id in snapshots:
+            return snapshots[config_id]
+        return next(iter(snapshots.values()), None)
+
+
+config_cache = ConfigCache()
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_after_commit(session):
+    if session.info.pop(_BUMP_ON_COMMIT, False):
+        config_cache.bump()
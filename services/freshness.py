@@ -0,0 +1,146 @@
+"""
+写入前的乐观并发检查：每个计划写入携带计算时页面的 last_edited_time，
+写入前用一次批量查询找出之后被修改过的页面
+
+批量查询只取计划计算之后修改过的页面（Notion 的 last_edited_time 精确到分钟，向前留出余量），
+再逐个与计划时的版本比较；被修改且影响排程输入的任务不写入，需要重新预览排程
+"""
+
+from datetime import datetime, timedelta
+
+import pytz
+
+from models.database import db, PageMirror
+from services.mirror import iterate_database_query, extract_page_fields, to_utc_naive
+
+# 批量达到该规模且镜像足够新时跳过预检查
+DEFAULT_SKIP_THRESHOLD = 50
+DEFAULT_MIRROR_MAX_AGE_SECONDS = 60
+# last_edited_time 精确到分钟，查询起点在计划时间取整后再提前的余量（含时钟偏差）
+EDITED_SINCE_MARGIN = timedelta(minutes=1)
+CLOSED_STATUSES = ('已完成', '已取消')
+
+
+def collect_planned_versions(tasks):
+    """从任务列表中收集 {page_id: last_edited_time}（缺少版本信息的页面不参与检查）"""
+    return {
+        task['id']: task['last_edited_time']
+        for task in tasks
+        if task.get('id') and task.get('last_edited_time')
+    }
+
+
+def mirror_proves_fresh(config_id, planned, max_age_seconds=DEFAULT_MIRROR_MAX_AGE_SECONDS):
+    """
+    镜像在 max_age_seconds 内同步过，且所有页面的版本与计划时一致时，
+    认为这批页面未被修改
+    """
+    if not planned:
+        return True
+
+    oldest_allowed = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    rows = db.session.query(
+        PageMirror.page_id, PageMirror.last_edited_time, PageMirror.synced_at
+    ).filter(
+        PageMirror.config_id == config_id,
+        PageMirror.page_id.in_(list(planned.keys()))
+    ).all()
+    if len(rows) != len(planned):
+        return False
+
+    for page_id, last_edited_time, synced_at in rows:
+        if synced_at is None or synced_at < oldest_allowed:
+            return False
+        if last_edited_time != to_utc_naive(planned[page_id]):
+            return False
+    return True
+
+
+def edited_since(planned, planned_at=None):
+    """
+    批量查询的起点（UTC naive）：计划计算的时间取整到分钟再减去余量
+
+    没有计划时间时（旧的预览）使用计划版本中最新的 last_edited_time：
+    计划之后的修改一定不早于读取时任何页面的版本
+    """
+    if planned_at is not None:
+        since = planned_at.astimezone(pytz.utc).replace(tzinfo=None) if planned_at.tzinfo else planned_at
+    else:
+        since = max(to_utc_naive(value) for value in planned.values())
+    return since.replace(second=0, microsecond=0) - EDITED_SINCE_MARGIN
+
+
+def find_edited_pages(notion, config, planned, planned_at=None):
+    """
+    一次批量查询找出计划之后被修改过的页面
+
+    Args:
+        notion: NotionClient 实例
+        config: 配置对象
+        planned: {page_id: 计划时的 last_edited_time 字符串}
+        planned_at: 计划计算的时间（读取任务之前），为空时按计划版本推算
+
+    Returns:
+        dict: {page_id: 最新的原始页面}
+    """
+    if not planned:
+        return {}
+
+    # 只查询计划之后修改过的页面，而不是逐页 retrieve
+    edited_filter = {
+        "timestamp": "last_edited_time",
+        "last_edited_time": {
+            "on_or_after": pytz.utc.localize(edited_since(planned, planned_at)).isoformat()
+        }
+    }
+
+    edited = {}
+    for page in iterate_database_query(notion, config.database_id, filter=edited_filter):
+        page_id = page['id']
+        if page_id not in planned:
+            continue
+        if to_utc_naive(page.get('last_edited_time')) != to_utc_naive(planned[page_id]):
+            edited[page_id] = page
+    return edited
+
+
+def check_plan_freshness(notion, config, planned, planned_at=None,
+                         skip_threshold=DEFAULT_SKIP_THRESHOLD,
+                         mirror_max_age_seconds=DEFAULT_MIRROR_MAX_AGE_SECONDS):
+    """
+    写入前的预检查入口：大批量且镜像证明新鲜时跳过 API 查询
+
+    Returns:
+        dict: {page_id: 最新的原始页面}，为空表示全部新鲜
+    """
+    if not planned:
+        return {}
+
+    if len(planned) >= skip_threshold and mirror_proves_fresh(config.id, planned, mirror_max_age_seconds):
+        print(f"🪞 镜像证明 {len(planned)} 个页面未修改，跳过预检查")
+        return {}
+
+    edited = find_edited_pages(notion, config, planned, planned_at)
+    if edited:
+        print(f"⚠️ {len(edited)} 个页面在计划后被修改: {list(edited.keys())}")
+    return edited
+
+
+def plan_inputs_changed(task, fresh_page, mapping):
+    """
+    判断页面的修改是否影响排程输入（预估时间、优先级、状态、父任务）
+
+    只改了描述等无关属性时，原计划仍然可以写入
+    """
+    fields = extract_page_fields(fresh_page, mapping)
+    if fields['archived'] or fields['status'] in CLOSED_STATUSES:
+        return True
+
+    planned_parents = task.get('parent_tasks') or []
+    planned_parent_id = planned_parents[0].get('id') if planned_parents else None
+    return (
+        float(task.get('estimated_time') or 0) != fields['estimated_minutes']
+        or (task.get('priority') or '') != fields['priority']
+        or (task.get('status') or '') != fields['status']
+        or planned_parent_id != fields['parent_id']
+    )
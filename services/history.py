@@ -0,0 +1,228 @@
+"""
+排程历史：操作记录写入、按天预聚合以及 keyset 分页查询
+"""
+
+from datetime import datetime, timedelta
+import base64
+
+import pytz
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from models.database import db, ScheduleOperation, ScheduleDailyStat, TaskPlanRecord
+
+SHANGHAI_TZ = pytz.timezone('Asia/Shanghai')
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def local_day(utc_dt):
+    """将数据库中的 UTC 时间转换为上海时区日期，作为日聚合的键"""
+    if utc_dt is None:
+        utc_dt = datetime.utcnow()
+    return pytz.utc.localize(utc_dt).astimezone(SHANGHAI_TZ).date()
+
+
+def adjust_daily_stat(operation, operations=0, partial=0, tasks=0, api_ms=0):
+    """
+    按增量调整排程记录所在日期的预聚合行（调用方负责提交事务）
+
+    同一配置的两个排程同时完成时可能同时插入当天的行：插入放在保存点中，
+    唯一约束冲突时改为更新对方插入的行；计数用 SQL 表达式累加，不会互相覆盖
+    """
+    day = local_day(operation.created_at)
+    stat = ScheduleDailyStat.query.filter_by(config_id=operation.config_id, day=day).first()
+    if stat is None:
+        try:
+            with db.session.begin_nested():
+                stat = ScheduleDailyStat(
+                    config_id=operation.config_id,
+                    day=day,
+                    operations_count=0,
+                    partial_count=0,
+                    tasks_scheduled=0,
+                    api_duration_ms_total=0
+                )
+                db.session.add(stat)
+        except IntegrityError:
+            stat = ScheduleDailyStat.query.filter_by(config_id=operation.config_id, day=day).one()
+
+    stat.operations_count = ScheduleDailyStat.operations_count + operations
+    stat.partial_count = ScheduleDailyStat.partial_count + partial
+    stat.tasks_scheduled = ScheduleDailyStat.tasks_scheduled + tasks
+    stat.api_duration_ms_total = ScheduleDailyStat.api_duration_ms_total + int(api_ms)
+    return stat
+
+
+def apply_to_daily_stat(operation):
+    """把一条已完成的排程记录累加到对应日期的预聚合行"""
+    return adjust_daily_stat(
+        operation,
+        operations=1,
+        partial=0 if operation.status == 'completed' else 1,
+        tasks=operation.tasks_scheduled or 0,
+        api_ms=operation.api_duration_ms or 0
+    )
+
+
+def to_utc_naive(dt):
+    """带时区的 datetime 转为数据库使用的 UTC naive 时间"""
+    if dt.tzinfo is None:
+        dt = SHANGHAI_TZ.localize(dt)
+    return dt.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def iter_scheduled_tasks(tasks):
+    """深度优先遍历任务树中已排程的任务"""
+    for task in tasks:
+        if task.get('scheduled') and task.get('start_time') and task.get('end_time'):
+            yield task
+        if task.get('children'):
+            yield from iter_scheduled_tasks(task['children'])
+
+
+def iter_scheduled_leaves(tasks):
+    """
+    深度优先遍历任务树中已排程的叶任务
+
+    父任务的时间跨度包含子任务与休息时间，不反映自身预估的准确度，不记录
+    """
+    for task in tasks:
+        if task.get('children'):
+            yield from iter_scheduled_leaves(task['children'])
+        elif task.get('scheduled') and task.get('start_time') and task.get('end_time'):
+            yield task
+
+
+def add_task_plans(operation, task_tree, page_ids=None):
+    """
+    为排程操作保存每个叶任务的预估与计划时间（调用方负责提交事务）
+
+    Args:
+        page_ids: 只记录这些页面（时间已写入 Notion 的任务），None 表示全部
+    """
+    count = 0
+    for task in iter_scheduled_leaves(task_tree):
+        if page_ids is not None and task['id'] not in page_ids:
+            continue
+        if not isinstance(task['start_time'], datetime) or not isinstance(task['end_time'], datetime):
+            continue
+        db.session.add(TaskPlanRecord(
+            config_id=operation.config_id,
+            operation=operation,
+            page_id=task['id'],
+            priority=task.get('priority') or '',
+            estimated_minutes=float(task.get('estimated_time') or 0),
+            planned_minutes=float(task.get('planned_minutes') or task.get('estimated_time') or 0),
+            planned_start=to_utc_naive(task['start_time']),
+            planned_end=to_utc_naive(task['end_time'])
+        ))
+        count += 1
+    return count
+
+
+def create_schedule_operation(config, start_time):
+    """在写回 Notion 之前创建排程记录，供发件箱行关联"""
+    operation = ScheduleOperation(
+        config_id=config.id,
+        database_id=config.database_id,
+        tasks_scheduled=0,
+        start_time=start_time,
+        status='pending',
+        api_duration_ms=0,
+        created_at=datetime.utcnow()
+    )
+    db.session.add(operation)
+    db.session.commit()
+    return operation
+
+
+def complete_schedule_operation(operation, success_count, total_count, api_duration_ms=0, task_tree=None,
+                                written_page_ids=None):
+    """
+    写回结束后更新排程记录，并在同一事务内更新日聚合
+
+    同一排程可多次完成（重放失败写入后），日聚合只按变化量调整
+
+    Args:
+        operation: create_schedule_operation 创建的记录
+        success_count: 成功写回的任务数（累计）
+        total_count: 计划写回的任务数
+        api_duration_ms: 本次写回 Notion 的耗时（毫秒）
+        task_tree: 已排程的任务树，提供时同时保存每个任务的计划时间
+        written_page_ids: 时间已成功写入的页面，只为这些任务保存计划（暂缓、失败或暂存的任务不记录）
+    """
+    first_completion = operation.status == 'pending'
+    was_partial = operation.status == 'partial'
+    previous_tasks = operation.tasks_scheduled or 0
+
+    operation.tasks_scheduled = success_count
+    operation.status = 'completed' if success_count == total_count else 'partial'
+    operation.api_duration_ms = (operation.api_duration_ms or 0) + int(api_duration_ms)
+
+    is_partial = operation.status == 'partial'
+    adjust_daily_stat(
+        operation,
+        operations=1 if first_completion else 0,
+        partial=int(is_partial) - (0 if first_completion else int(was_partial)),
+        tasks=success_count - (0 if first_completion else previous_tasks),
+        api_ms=api_duration_ms
+    )
+    if task_tree:
+        add_task_plans(operation, task_tree, page_ids=written_page_ids)
+    db.session.commit()
+    return operation
+
+
+def encode_cursor(operation):
+    """将 (created_at, id) 编码为不透明的翻页游标"""
+    raw = f"{operation.created_at.isoformat()}|{operation.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析翻页游标，无效游标返回 None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at_str, operation_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at_str), int(operation_id)
+    except (ValueError, TypeError, UnicodeDecodeError, AttributeError):
+        return None
+
+
+def get_schedule_history_page(config_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    按 (created_at, id) 倒序做 keyset 分页，避免 OFFSET 随历史增长变慢
+
+    Returns:
+        tuple: (本页操作列表, 下一页游标或 None)
+    """
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    query = ScheduleOperation.query.filter(ScheduleOperation.config_id == config_id)
+
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, operation_id = position
+        query = query.filter(or_(
+            ScheduleOperation.created_at < created_at,
+            and_(ScheduleOperation.created_at == created_at, ScheduleOperation.id < operation_id)
+        ))
+
+    # 多取一条用于判断是否还有下一页
+    rows = query.order_by(
+        ScheduleOperation.created_at.desc(),
+        ScheduleOperation.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def get_daily_stats(config_id, days=30):
+    """读取最近若干天的预聚合数据（按日期倒序）"""
+    days = max(1, min(int(days or 30), 366))
+    since = local_day(datetime.utcnow()) - timedelta(days=days - 1)
+    return ScheduleDailyStat.query.filter(
+        ScheduleDailyStat.config_id == config_id,
+        ScheduleDailyStat.day >= since
+    ).order_by(ScheduleDailyStat.day.desc()).all()
@@ -0,0 +1,182 @@
+"""
+运行时计时与统计
+
+- 启动阶段计时：设置环境变量 STARTUP_TIMING=1 后，打印模块导入与应用初始化各阶段的耗时
+- 请求统计：每个端点最近的首字节时间（TTFB）、总耗时、原始/实际发送大小与 Notion 调用数；
+  设置 REQUEST_TIMING=1 时逐个请求打印
+- Notion 调用追踪：一个请求内经过 NotionGateway 的调用（端点、耗时、是否失败）
+"""
+
+from collections import defaultdict, deque
+from contextvars import ContextVar
+import itertools
+import os
+import threading
+import time
+
+
+class PhaseTimer:
+    """记录若干阶段的结束时间点，按阶段输出耗时"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started_at = time.perf_counter()
+        self.last_at = self.started_at
+        self.phases = []
+
+    def mark(self, name):
+        """记录一个阶段结束"""
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last_at) * 1000))
+        self.last_at = now
+
+    def report(self, title='启动阶段耗时'):
+        """启用时打印各阶段耗时，返回 [(阶段, 毫秒)]"""
+        phases = list(self.phases)
+        if self.enabled and phases:
+            total = sum(ms for _, ms in phases)
+            print(f"⏱️ {title}（共 {total:.1f} ms）")
+            for name, ms in phases:
+                print(f"   {name:<24} {ms:8.1f} ms")
+        self.phases = []
+        self.last_at = time.perf_counter()
+        return phases
+
+
+startup_timer = PhaseTimer(enabled=os.getenv('STARTUP_TIMING', '').lower() in ('1', 'true'))
+
+
+def percentile(values, fraction):
+    """已排序列表的百分位数（最近秩）"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return values[index]
+
+
+class NotionCallTrace:
+    """一个请求内的 Notion 调用（gather 并发执行的一批调用共用一个批次号）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = []  # (endpoint, 毫秒, 是否失败, 批次号)
+
+    def record(self, endpoint, elapsed_ms, error=None, batch=None):
+        with self._lock:
+            self.calls.append((endpoint, elapsed_ms, error is not None, batch))
+
+    @property
+    def count(self):
+        return len(self.calls)
+
+    def summary(self):
+        """
+        按端点汇总：调用数、失败数、耗时
+
+        notion_ms 为等待 Notion 的时间：顺序调用累加，并发的一批只计最长的一个
+        """
+        with self._lock:
+            calls = list(self.calls)
+        endpoints = {}
+        batches = {}
+        notion_ms = 0.0
+        for endpoint, elapsed_ms, failed, batch in calls:
+            item = endpoints.setdefault(endpoint, {'count': 0, 'errors': 0, 'ms': 0.0})
+            item['count'] += 1
+            item['errors'] += int(failed)
+            item['ms'] += elapsed_ms
+            if batch is None:
+                notion_ms += elapsed_ms
+            else:
+                batches[batch] = max(batches.get(batch, 0.0), elapsed_ms)
+        notion_ms += sum(batches.values())
+        for item in endpoints.values():
+            item['ms'] = round(item['ms'], 1)
+        return {
+            'calls': len(calls),
+            'errors': sum(item['errors'] for item in endpoints.values()),
+            'notion_ms': round(notion_ms, 1),
+            'endpoints': dict(sorted(endpoints.items(), key=lambda pair: -pair[1]['count'])),
+        }
+
+
+_notion_trace = ContextVar('notion_call_trace', default=None)
+_batch_ids = itertools.count(1)
+
+
+def begin_notion_trace():
+    """开始追踪当前请求（或命令）中的 Notion 调用"""
+    trace = NotionCallTrace()
+    _notion_trace.set(trace)
+    return trace
+
+
+def end_notion_trace():
+    _notion_trace.set(None)
+
+
+def current_notion_trace():
+    return _notion_trace.get()
+
+
+def next_batch_id():
+    return next(_batch_ids)
+
+
+def record_notion_call(endpoint, elapsed_ms, error=None, batch=None):
+    """记录一次 Notion 调用（没有进行中的追踪时忽略）"""
+    trace = _notion_trace.get()
+    if trace is not None:
+        trace.record(endpoint, elapsed_ms, error, batch)
+
+
+class RequestMetrics:
+    """按端点保存最近 window 个请求的计时与大小"""
+
+    def __init__(self, window=500, verbose=False):
+        self.window = window
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, endpoint, ttfb_ms, total_ms, raw_bytes, sent_bytes, encoding=None, streamed=False,
+               notion_calls=0):
+        with self._lock:
+            self._samples[endpoint].append(
+                (ttfb_ms, total_ms, raw_bytes, sent_bytes, encoding, streamed, notion_calls)
+            )
+        if self.verbose:
+            mode = '流式' if streamed else '整体'
+            print(f"📦 {endpoint}: TTFB {ttfb_ms:.1f} ms，总计 {total_ms:.1f} ms，"
+                  f"{raw_bytes} → {sent_bytes} 字节（{encoding or '未压缩'}，{mode}），Notion 调用 {notion_calls} 次")
+
+    def snapshot(self):
+        """各端点的统计：请求数、TTFB/总耗时的 p50/p95、平均大小与压缩率、平均 Notion 调用数"""
+        with self._lock:
+            samples = {endpoint: list(items) for endpoint, items in self._samples.items()}
+        result = {}
+        for endpoint, items in sorted(samples.items()):
+            ttfb = sorted(item[0] for item in items)
+            total = sorted(item[1] for item in items)
+            raw_bytes = sum(item[2] for item in items)
+            sent_bytes = sum(item[3] for item in items)
+            result[endpoint] = {
+                'count': len(items),
+                'ttfb_p50_ms': round(percentile(ttfb, 0.5), 1),
+                'ttfb_p95_ms': round(percentile(ttfb, 0.95), 1),
+                'total_p50_ms': round(percentile(total, 0.5), 1),
+                'total_p95_ms': round(percentile(total, 0.95), 1),
+                'avg_raw_bytes': raw_bytes // len(items),
+                'avg_sent_bytes': sent_bytes // len(items),
+                'compression_ratio': round(sent_bytes / raw_bytes, 3) if raw_bytes else None,
+                'streamed': sum(1 for item in items if item[5]),
+                'notion_calls_avg': round(sum(item[6] for item in items) / len(items), 2),
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+request_metrics = RequestMetrics(verbose=os.getenv('REQUEST_TIMING', '').lower() in ('1', 'true'))
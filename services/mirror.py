@@ -0,0 +1,328 @@
+"""
+Notion 页面本地镜像：按 last_edited_time 增量同步数据库页面到 page_mirror 表
+"""
+
+from datetime import datetime, timedelta
+
+import pytz
+
+from models.database import db, PageMirror, PageMirrorState, TaskPlanRecord
+
+# 增量同步时回看一段时间，避免 Notion last_edited_time 只精确到分钟导致漏页
+SYNC_OVERLAP = timedelta(minutes=2)
+QUERY_PAGE_SIZE = 100
+
+
+def to_utc_naive(time_str):
+    """将 Notion 时间字符串转换为不带时区的 UTC datetime（数据库存储格式）"""
+    if not time_str:
+        return None
+    try:
+        dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        return None
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def iterate_database_query(notion, database_id, **query_kwargs):
+    """遍历 databases.query 的所有分页结果"""
+    start_cursor = None
+    while True:
+        kwargs = dict(query_kwargs, database_id=database_id, page_size=QUERY_PAGE_SIZE)
+        if start_cursor:
+            kwargs['start_cursor'] = start_cursor
+        response = notion.databases.query(**kwargs)
+        for page in response.get('results', []):
+            yield page
+        if not response.get('has_more') or not response.get('next_cursor'):
+            break
+        start_cursor = response['next_cursor']
+
+
+def extract_page_fields(page, mapping):
+    """按属性映射从原始页面中提取镜像字段"""
+    properties = page.get('properties', {}) or {}
+
+    def prop(name):
+        return (properties.get(name) or {}) if name else {}
+
+    title_items = prop(mapping.get('title_property')).get('title') or []
+    title = title_items[0].get('plain_text', '') if title_items else ''
+
+    priority = (prop(mapping.get('priority_property')).get('select') or {}).get('name', '')
+    status = (prop(mapping.get('status_property')).get('status') or {}).get('name', '')
+    estimated = prop(mapping.get('estimated_time_property')).get('number') or 0
+
+    timebox_start_property = mapping.get('timebox_start_property')
+    timebox_end_property = mapping.get('timebox_end_property')
+    start_date = prop(timebox_start_property).get('date') or {}
+    timebox_start = to_utc_naive(start_date.get('start'))
+    if timebox_end_property and timebox_end_property != timebox_start_property:
+        timebox_end = to_utc_naive((prop(timebox_end_property).get('date') or {}).get('start'))
+    else:
+        timebox_end = to_utc_naive(start_date.get('end'))
+
+    parent_relations = prop(mapping.get('parent_task_property')).get('relation') or []
+
+    return {
+        'title': title[:500],
+        'priority': priority or '',
+        'status': status or '',
+        'estimated_minutes': float(estimated),
+        'timebox_start': timebox_start,
+        'timebox_end': timebox_end,
+        'parent_id': parent_relations[0]['id'] if parent_relations else None,
+        'archived': bool(page.get('archived') or page.get('in_trash')),
+        'last_edited_time': to_utc_naive(page.get('last_edited_time')),
+    }
+
+
+def upsert_pages(config, mapping, pages):
+    """
+    将一批原始页面写入镜像（调用方负责提交事务）
+
+    archived / in_trash 的页面写入为归档行（从回收站恢复的页面重新变为未归档），
+    新旧父任务的子任务数都会重新统计；镜像内容（提取的字段或子任务数）有变化时递增内容版本
+
+    Returns:
+        list: 本次写入的 PageMirror 行
+    """
+    pages = list(pages)
+    if not pages:
+        return []
+
+    page_ids = [page['id'] for page in pages]
+    existing = {
+        row.page_id: row
+        for row in PageMirror.query.filter(
+            PageMirror.config_id == config.id,
+            PageMirror.page_id.in_(page_ids)
+        )
+    }
+
+    now = datetime.utcnow()
+    rows = []
+    affected_parents = set()
+    changed = False
+    for page in pages:
+        row = existing.get(page['id'])
+        if row is None:
+            row = PageMirror(config_id=config.id, page_id=page['id'], child_count=0)
+            db.session.add(row)
+            existing[page['id']] = row
+            # 新行的子任务可能先于它同步进镜像
+            affected_parents.add(row.page_id)
+            changed = True
+        affected_parents.add(row.parent_id)
+        for key, value in extract_page_fields(page, mapping).items():
+            if getattr(row, key) != value:
+                setattr(row, key, value)
+                changed = True
+        affected_parents.add(row.parent_id)
+        row.synced_at = now
+        rows.append(row)
+
+    if refresh_child_counts(config.id, affected_parents) or changed:
+        bump_content_version(config.id)
+    return rows
+
+
+def refresh_child_counts(config_id, parent_ids):
+    """
+    重新统计受影响父任务的子任务数（只统计有时间盒且未归档的子任务），
+    调用方负责提交事务
+
+    Returns:
+        bool: 是否有子任务数发生变化
+    """
+    parent_ids = [parent_id for parent_id in set(parent_ids) if parent_id]
+    if not parent_ids:
+        return False
+
+    db.session.flush()
+    counts = dict(db.session.query(
+        PageMirror.parent_id, db.func.count(PageMirror.id)
+    ).filter(
+        PageMirror.config_id == config_id,
+        PageMirror.parent_id.in_(parent_ids),
+        PageMirror.archived.is_(False),
+        PageMirror.timebox_start.isnot(None)
+    ).group_by(PageMirror.parent_id).all())
+
+    changed = False
+    for row in PageMirror.query.filter(
+        PageMirror.config_id == config_id,
+        PageMirror.page_id.in_(parent_ids)
+    ):
+        child_count = counts.get(row.page_id, 0)
+        if row.child_count != child_count:
+            row.child_count = child_count
+            changed = True
+    return changed
+
+
+def apply_planned_times(config_id, operation_id, page_ids):
+    """
+    排程写入成功后，把计划时间同步到镜像，不必等下一次同步（调用方负责提交事务）
+
+    Returns:
+        int: 更新的镜像行数
+    """
+    page_ids = [page_id for page_id in page_ids if page_id]
+    if not page_ids:
+        return 0
+
+    plans = {
+        plan.page_id: plan
+        for plan in TaskPlanRecord.query.filter(
+            TaskPlanRecord.operation_id == operation_id,
+            TaskPlanRecord.page_id.in_(page_ids)
+        )
+    }
+    if not plans:
+        return 0
+
+    now = datetime.utcnow()
+    affected_parents = set()
+    updated = 0
+    changed = False
+    for row in PageMirror.query.filter(
+        PageMirror.config_id == config_id,
+        PageMirror.page_id.in_(list(plans.keys()))
+    ):
+        plan = plans[row.page_id]
+        if row.timebox_start is None:
+            affected_parents.add(row.parent_id)
+        if (row.timebox_start, row.timebox_end) != (plan.planned_start, plan.planned_end):
+            row.timebox_start = plan.planned_start
+            row.timebox_end = plan.planned_end
+            changed = True
+        row.synced_at = now
+        updated += 1
+
+    if refresh_child_counts(config_id, affected_parents) or changed:
+        bump_content_version(config_id)
+    return updated
+
+
+def mark_pages_archived(config_id, page_ids):
+    """
+    在镜像中把页面标记为归档，并重新统计其父任务的子任务数（调用方负责提交事务）
+
+    Notion 的查询不返回已归档或删除的页面，增量同步看不到它们，
+    由归档写入成功后或全量同步发现页面缺失时调用
+
+    Returns:
+        int: 新标记为归档的行数
+    """
+    page_ids = list({page_id for page_id in page_ids if page_id})
+    now = datetime.utcnow()
+    affected_parents = set()
+    marked = 0
+    for offset in range(0, len(page_ids), QUERY_PAGE_SIZE):
+        for row in PageMirror.query.filter(
+            PageMirror.config_id == config_id,
+            PageMirror.page_id.in_(page_ids[offset:offset + QUERY_PAGE_SIZE]),
+            PageMirror.archived.is_(False)
+        ):
+            row.archived = True
+            row.synced_at = now
+            affected_parents.add(row.parent_id)
+            marked += 1
+
+    if marked:
+        refresh_child_counts(config_id, affected_parents)
+        bump_content_version(config_id)
+    return marked
+
+
+def get_mirror_state(config_id):
+    """获取配置的镜像状态行，不存在时创建（调用方负责提交事务）"""
+    state = db.session.get(PageMirrorState, config_id)
+    if state is None:
+        state = PageMirrorState(config_id=config_id, content_version=0)
+        db.session.add(state)
+    return state
+
+
+def bump_content_version(config_id):
+    """镜像内容发生变化时递增内容版本（调用方负责提交事务）"""
+    state = get_mirror_state(config_id)
+    state.content_version = (state.content_version or 0) + 1
+
+
+def get_mirror_version(config_id):
+    """
+    镜像的版本标识 (内容版本, 最近同步时间)
+
+    内容版本只在镜像内容变化时递增，没有变化的增量同步只更新同步时间
+
+    Returns:
+        tuple: (int, datetime 或 None)，从未同步过时为 (0, None)
+    """
+    state = db.session.get(PageMirrorState, config_id)
+    if state is None:
+        return 0, None
+    return state.content_version or 0, state.synced_at
+
+
+def get_mirror_watermark(config_id):
+    """镜像中最新的 last_edited_time，作为增量同步的起点"""
+    return db.session.query(db.func.max(PageMirror.last_edited_time)).filter(
+        PageMirror.config_id == config_id
+    ).scalar()
+
+
+def sync_pages(notion, config, mapping, full=False):
+    """
+    增量同步数据库页面到本地镜像
+
+    全量扫描时，镜像中有但 Notion 没有返回的页面（已归档或删除）标记为归档
+
+    Args:
+        notion: NotionClient 实例
+        config: 配置对象
+        mapping: 属性映射字典
+        full: 为 True 时忽略水位线，全量扫描
+
+    Returns:
+        int: 同步的页面数量
+    """
+    query_kwargs = {}
+    watermark = None if full else get_mirror_watermark(config.id)
+    if watermark:
+        query_kwargs['filter'] = {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {
+                "on_or_after": pytz.utc.localize(watermark - SYNC_OVERLAP).isoformat()
+            }
+        }
+
+    synced = 0
+    batch = []
+    seen_page_ids = set()
+    for page in iterate_database_query(notion, config.database_id, **query_kwargs):
+        batch.append(page)
+        seen_page_ids.add(page['id'])
+        if len(batch) >= QUERY_PAGE_SIZE:
+            synced += len(upsert_pages(config, mapping, batch))
+            batch = []
+    synced += len(upsert_pages(config, mapping, batch))
+
+    if not watermark:
+        missing = [
+            page_id for page_id, in db.session.query(PageMirror.page_id).filter(
+                PageMirror.config_id == config.id,
+                PageMirror.archived.is_(False)
+            )
+            if page_id not in seen_page_ids
+        ]
+        if missing:
+            print(f"🪞 {mark_pages_archived(config.id, missing)} 个页面已在 Notion 中归档或删除")
+    get_mirror_state(config.id).synced_at = datetime.utcnow()
+    db.session.commit()
+
+    print(f"🪞 镜像同步完成: {synced} 个页面 ({'全量' if not watermark else '增量'})")
+    return synced
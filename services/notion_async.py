@@ -0,0 +1,227 @@
+"""
+异步 Notion 访问层：notion_client.AsyncClient + httpx 连接池，
+运行在受管理的事件循环线程中，Flask 视图通过 run_calls 同步调用
+
+每个令牌（即每个工作区）有自己的事件循环线程、连接池和优先级调度器（限速桶 + 并发上限），
+一个团队的大批量写入不会阻塞另一个团队的读取；令牌逐次通过 auth 参数传入。
+同步客户端的调用也通过 run_sync 在同一个调度器领取名额，见 services/call_scheduler.py
+"""
+
+import asyncio
+import atexit
+from functools import partial
+import threading
+import time
+
+from services.adaptive_concurrency import AIMDController
+from services.call_scheduler import PriorityScheduler, INTERACTIVE_READ, BACKGROUND_SYNC, BULK_WRITE
+from services.notion_gateway import token_key
+
+DEFAULT_RATE_PER_SECOND = 3.0  # Notion 对每个集成的平均限速
+DEFAULT_BURST = 3
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_CALL_TIMEOUT_SECONDS = 120
+# 每个工作区的连接池大小
+POOL_MAX_CONNECTIONS = 10
+POOL_MAX_KEEPALIVE_CONNECTIONS = 5
+
+
+class _TokenWorker:
+    """单个令牌的事件循环线程、连接池与优先级调度器"""
+
+    def __init__(self, key, scheduler, base_url=None):
+        self.key = key
+        self.scheduler = scheduler
+        self.base_url = base_url
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name=f'notion-async-{key[:8]}', daemon=True)
+        self.thread.start()
+        self.client = None
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def prepare(self):
+        # 只在事件循环线程中调用，httpx.AsyncClient 和 asyncio 原语必须在所属的循环中使用
+        if self.client is None:
+            # httpx / notion_client 在第一次调用时才导入
+            import httpx
+            from notion_client import AsyncClient
+            limits = httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_KEEPALIVE_CONNECTIONS
+            )
+            options = {'base_url': self.base_url} if self.base_url else {}
+            self.client = AsyncClient(client=httpx.AsyncClient(limits=limits), **options)
+        return self.client
+
+    def stop(self):
+        """关闭连接池并停止事件循环"""
+        if self.client is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result(5)
+            except Exception:
+                pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class AsyncNotionRunner:
+    """按令牌管理事件循环线程、AsyncClient 和限速状态"""
+
+    def __init__(self, rate_per_second=DEFAULT_RATE_PER_SECOND, burst=DEFAULT_BURST,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.weights = None
+        self.targets_ms = None
+        # bulk_write 的 AIMD 参数，为 None 时批量写入与其他类别共享固定的并发上限
+        self.bulk_adaptive = None
+        # Notion API 地址（为 None 时使用 SDK 默认地址）
+        self.base_url = None
+        self._lock = threading.Lock()
+        self._workers = {}
+
+    def configure(self, rate_per_second=None, burst=None, max_concurrency=None, weights=None, targets_ms=None,
+                  bulk_adaptive=None, base_url=None):
+        """
+        更新限速与优先级参数（已创建的令牌状态保持不变）
+
+        bulk_adaptive: AIMDController 的参数字典（min_limit、max_limit、latency_target_ms 等），
+        传入空字典以外的值时启用批量写入的自适应并发
+        """
+        if rate_per_second:
+            self.rate_per_second = rate_per_second
+        if burst:
+            self.burst = burst
+        if max_concurrency:
+            self.max_concurrency = max_concurrency
+        if weights:
+            self.weights = weights
+        if targets_ms:
+            self.targets_ms = targets_ms
+        if bulk_adaptive is not None:
+            self.bulk_adaptive = bulk_adaptive or None
+        if base_url is not None:
+            self.base_url = base_url or None
+
+    def _get_worker(self, token):
+        key = token_key(token)
+        with self._lock:
+            worker = self._workers.get(key)
+            if worker is not None and worker.is_alive():
+                return worker
+            adaptive = {BULK_WRITE: AIMDController(**self.bulk_adaptive)} if self.bulk_adaptive else None
+            scheduler = PriorityScheduler(
+                self.rate_per_second, self.burst, self.max_concurrency,
+                weights=self.weights, targets_ms=self.targets_ms, adaptive=adaptive
+            )
+            worker = self._workers[key] = _TokenWorker(key, scheduler, self.base_url)
+            print(f"🔄 Notion 异步事件循环已启动（工作区 {key[:8]}）")
+            return worker
+
+    async def _call(self, worker, token, endpoint, kwargs, priority):
+        group, method = endpoint.split('.')
+        client = worker.prepare()
+        await worker.scheduler.acquire(priority)
+        started = time.monotonic()
+        error = None
+        try:
+            function = getattr(getattr(client, group), method)
+            return await function(auth=token, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            worker.scheduler.release(priority, (time.monotonic() - started) * 1000, error)
+
+    async def _gather(self, worker, token, calls, priorities):
+        return await asyncio.gather(
+            *(
+                self._call(worker, token, endpoint, kwargs, priority)
+                for (endpoint, kwargs), priority in zip(calls, priorities)
+            ),
+            return_exceptions=True
+        )
+
+    def run_calls(self, token, calls, timeout=DEFAULT_CALL_TIMEOUT_SECONDS, priorities=None):
+        """
+        并发执行一批 Notion 调用
+
+        Args:
+            token: Notion 令牌
+            calls: [(endpoint, kwargs)]，endpoint 形如 'pages.retrieve'
+            timeout: 整批调用的超时时间（秒）
+            priorities: 与 calls 对应的调用类别（默认 interactive_read）
+
+        Returns:
+            list: 与 calls 顺序一致的结果，失败的调用对应异常对象
+        """
+        if not calls:
+            return []
+        calls = list(calls)
+        priorities = list(priorities or [INTERACTIVE_READ] * len(calls))
+        worker = self._get_worker(token)
+        future = asyncio.run_coroutine_threadsafe(self._gather(worker, token, calls, priorities), worker.loop)
+        return future.result(timeout)
+
+    def run_sync(self, token, priority, fn, timeout=DEFAULT_CALL_TIMEOUT_SECONDS):
+        """
+        在调用方线程中执行同步客户端的调用 fn，执行前从令牌的调度器领取名额
+
+        Args:
+            token: Notion 令牌
+            priority: 调用类别
+            fn: 无参函数（一次 SDK 调用）
+            timeout: 等待名额的超时时间（秒）
+        """
+        worker = self._get_worker(token)
+        future = asyncio.run_coroutine_threadsafe(worker.scheduler.acquire(priority), worker.loop)
+        try:
+            future.result(timeout)
+        except BaseException:
+            # 超时的同时名额刚好被放行时，由这里归还
+            if not future.cancel() and future.done() and future.exception() is None:
+                worker.loop.call_soon_threadsafe(worker.scheduler.release, priority)
+            raise
+        started = time.monotonic()
+        error = None
+        try:
+            return fn()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            latency_ms = (time.monotonic() - started) * 1000
+            worker.loop.call_soon_threadsafe(partial(worker.scheduler.release, priority, latency_ms, error))
+
+    def warm(self, token):
+        """启动令牌的事件循环、建立连接池，并用一次 users.me 调用打开到 Notion 的连接"""
+        result = self.run_calls(token, [('users.me', {})], priorities=[BACKGROUND_SYNC])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def scheduler_snapshot(self):
+        """各工作区调度器的统计（按令牌键前 8 位）"""
+        with self._lock:
+            workers = [worker for worker in self._workers.values() if worker.is_alive()]
+        return {worker.key[:8]: worker.scheduler.snapshot() for worker in workers}
+
+    def active_workers(self):
+        """正在运行的工作区事件循环数"""
+        with self._lock:
+            return sum(1 for worker in self._workers.values() if worker.is_alive())
+
+    def shutdown(self):
+        """关闭所有连接池并停止事件循环"""
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers = {}
+        for worker in workers:
+            worker.stop()
+
+
+# 应用内共享的异步执行器
+async_runner = AsyncNotionRunner()
+atexit.register(async_runner.shutdown)
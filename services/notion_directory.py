@@ -0,0 +1,189 @@
+"""
+令牌状态与数据库目录缓存：设置页面不再在每次打开时实时调用 Notion
+
+- TokenStatusCache：令牌是否有效，TTL 内直接返回缓存，过期后在后台线程刷新
+  （同一令牌同时只刷新一次），也可以按需同步刷新
+- DatabaseDirectory：令牌可访问的数据库列表（分页拉取 search 的全部结果后缓存），
+  按标题过滤并分页返回，几百个数据库的工作区也只在缓存过期时访问 Notion
+"""
+
+import threading
+import time
+
+from services.notion_gateway import token_key
+from services.search_index import normalize_text
+
+DEFAULT_STATUS_TTL_SECONDS = 300
+DEFAULT_DIRECTORY_TTL_SECONDS = 300
+SEARCH_PAGE_SIZE = 100
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+DATABASE_FILTER = {"value": "database", "property": "object"}
+
+
+def database_title(database):
+    """数据库标题（纯文本）"""
+    return ''.join(part.get('plain_text', '') for part in database.get('title') or []) or '未命名数据库'
+
+
+def fetch_databases(notion):
+    """分页获取令牌可访问的全部数据库，只保留列表需要的字段"""
+    databases = []
+    cursor = None
+    while True:
+        kwargs = {'filter': DATABASE_FILTER, 'page_size': SEARCH_PAGE_SIZE}
+        if cursor:
+            kwargs['start_cursor'] = cursor
+        response = notion.search(**kwargs)
+        for database in response.get('results', []):
+            title = database_title(database)
+            databases.append({
+                'id': database['id'],
+                'title': title,
+                'url': database.get('url'),
+                'last_edited_time': database.get('last_edited_time'),
+                '_normalized': normalize_text(title),
+            })
+        if not response.get('has_more') or not response.get('next_cursor'):
+            return databases
+        cursor = response['next_cursor']
+
+
+class TokenStatusCache:
+    """令牌有效性缓存：token_key -> {'valid', 'error', 'checked_at'}"""
+
+    def __init__(self, ttl_seconds=DEFAULT_STATUS_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._statuses = {}
+        self._refreshing = set()
+
+    def record(self, token, valid, error=None):
+        status = {'valid': valid, 'error': error, 'checked_at': time.time()}
+        with self._lock:
+            self._statuses[token_key(token)] = status
+        return status
+
+    def get(self, token):
+        """
+        缓存的令牌状态
+
+        Returns:
+            tuple: (状态字典或 None, 是否已过期)
+        """
+        with self._lock:
+            status = self._statuses.get(token_key(token))
+        if status is None:
+            return None, True
+        return status, time.time() - status['checked_at'] > self.ttl_seconds
+
+    def refresh(self, token, check_fn):
+        """同步检查令牌（check_fn 抛出异常视为无效）"""
+        try:
+            check_fn()
+            return self.record(token, True)
+        except Exception as e:
+            return self.record(token, False, str(e))
+
+    def refresh_in_background(self, token, check_fn):
+        """在后台线程刷新（同一令牌正在刷新时不重复启动）"""
+        key = token_key(token)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.refresh(token, check_fn)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name='token-status-refresh', daemon=True).start()
+        return True
+
+    def invalidate(self, token):
+        with self._lock:
+            self._statuses.pop(token_key(token), None)
+
+
+class DatabaseDirectory:
+    """按令牌缓存的数据库目录"""
+
+    def __init__(self, ttl_seconds=DEFAULT_DIRECTORY_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}  # token_key -> (databases, fetched_at)
+        self._fetch_locks = {}
+
+    def _fetch_lock(self, key):
+        with self._lock:
+            lock = self._fetch_locks.get(key)
+            if lock is None:
+                lock = self._fetch_locks[key] = threading.Lock()
+            return lock
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.ttl_seconds:
+            return None
+        return entry
+
+    def databases(self, token, notion_factory, refresh=False):
+        """
+        令牌可访问的全部数据库（缓存过期或 refresh 时重新拉取，同一令牌只拉取一次）
+
+        Returns:
+            tuple: (数据库列表, 拉取时间 monotonic)
+        """
+        key = token_key(token)
+        entry = None if refresh else self._cached(key)
+        if entry is not None:
+            return entry
+        with self._fetch_lock(key):
+            entry = None if refresh else self._cached(key)
+            if entry is None:
+                entry = (fetch_databases(notion_factory()), time.monotonic())
+                with self._lock:
+                    self._entries[key] = entry
+        return entry
+
+    def search(self, token, notion_factory, query='', cursor=0, limit=DEFAULT_PAGE_LIMIT, refresh=False):
+        """
+        按标题过滤并分页
+
+        Args:
+            query: 标题关键字（忽略大小写与全角/半角）
+            cursor: 上一页返回的 next_cursor（偏移量）
+            limit: 每页数量
+
+        Returns:
+            dict: {'databases', 'next_cursor', 'has_more', 'total', 'cached_seconds'}
+        """
+        databases, fetched_at = self.databases(token, notion_factory, refresh)
+        needle = normalize_text(query.strip()) if query else ''
+        matched = [item for item in databases if needle in item['_normalized']] if needle else databases
+        limit = max(1, min(limit or DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT))
+        cursor = max(0, cursor or 0)
+        page = matched[cursor:cursor + limit]
+        has_more = cursor + limit < len(matched)
+        return {
+            'databases': [
+                {key: value for key, value in item.items() if not key.startswith('_')}
+                for item in page
+            ],
+            'next_cursor': str(cursor + limit) if has_more else None,
+            'has_more': has_more,
+            'total': len(matched),
+            'cached_seconds': int(time.monotonic() - fetched_at)
+        }
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token_key(token), None)
+
+
+token_status_cache = TokenStatusCache()
+database_directory = DatabaseDirectory()
@@ -0,0 +1,443 @@
+"""
+Notion 客户端包装层：在 SDK 前面加请求级的页面/查询缓存
+
+- pages.retrieve 按页面 ID 缓存，同一请求内重复读取不再访问 API
+- databases.query 的结果按参数缓存，返回的页面同时写入页面缓存
+- 只保留 last_edited_time 更新的版本，旧版本不会覆盖新版本
+- 经由本包装层的 pages.update / pages.create 自动失效相关缓存
+- 可选的进程级短 TTL 页面缓存（PAGE_CACHE_TTL_SECONDS，0 表示关闭）
+- gather 并发执行一批相互独立的调用（异步执行器或线程池），同样经过缓存
+- retrieve_schema 按 (令牌, 数据库) 缓存数据库结构（SCHEMA_CACHE_TTL_SECONDS）
+- 缓存未命中的 databases.query / databases.retrieve 经过 read_flight，
+  多个请求并发的相同读取只调用一次 Notion；写入后令牌的合并键随之失效
+- 传入 scheduler 时，每次 SDK 调用前按调用类别从令牌的优先级调度器领取名额
+  （services/call_scheduler.py），search、users 等透传端点同样经过调度
+- 传入 breaker 时，调用先经过令牌的熔断器（services/circuit_breaker.py），
+  熔断打开时立即抛出 CircuitOpenError，不进入调度队列
+- 实际发出的调用记录到当前请求的 Notion 调用追踪（services/instrumentation.py）
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import threading
+import time
+
+from services.call_scheduler import classify
+from services.instrumentation import record_notion_call, next_batch_id
+from services.mirror import to_utc_naive
+from services.singleflight import read_flight
+
+
+def _is_newer_or_same(candidate, current):
+    """candidate 的 last_edited_time 不早于 current 时返回 True"""
+    candidate_time = to_utc_naive(candidate.get('last_edited_time'))
+    current_time = to_utc_naive(current.get('last_edited_time'))
+    if candidate_time is None or current_time is None:
+        return True
+    return candidate_time >= current_time
+
+
+def token_key(token):
+    """进程级缓存的令牌键（不直接保存令牌）"""
+    return hashlib.sha1((token or '').encode('utf-8')).hexdigest()[:16]
+
+
+class PageCache:
+    """页面缓存：page_id -> (页面, 写入时间)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages = {}
+
+    def get(self, page_id, max_age_seconds=None):
+        with self._lock:
+            item = self._pages.get(page_id)
+            if item is None:
+                return None
+            page, stored_at = item
+            if max_age_seconds is not None and time.monotonic() - stored_at > max_age_seconds:
+                del self._pages[page_id]
+                return None
+            return page
+
+    def put(self, page):
+        """写入页面，已有更新版本时忽略"""
+        page_id = page.get('id') if isinstance(page, dict) else None
+        if not page_id or 'properties' not in page:
+            return
+        with self._lock:
+            item = self._pages.get(page_id)
+            if item is not None and not _is_newer_or_same(page, item[0]):
+                return
+            self._pages[page_id] = (page, time.monotonic())
+
+    def invalidate(self, page_id):
+        with self._lock:
+            self._pages.pop(page_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+class SharedPageCache:
+    """进程级页面缓存，按令牌隔离"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._caches = {}
+
+    def for_token(self, token):
+        key = token_key(token)
+        with self._lock:
+            cache = self._caches.get(key)
+            if cache is None:
+                cache = self._caches[key] = PageCache()
+            return cache
+
+    def clear(self):
+        with self._lock:
+            self._caches.clear()
+
+
+shared_page_cache = SharedPageCache()
+
+
+class SchemaCache:
+    """进程级数据库结构缓存：(令牌, database_id) -> (结构, 写入时间)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = {}
+
+    def get(self, token, database_id, max_age_seconds):
+        with self._lock:
+            item = self._schemas.get((token_key(token), database_id))
+        if item is None or time.monotonic() - item[1] > max_age_seconds:
+            return None
+        return item[0]
+
+    def put(self, token, database_id, schema):
+        with self._lock:
+            self._schemas[(token_key(token), database_id)] = (schema, time.monotonic())
+
+    def invalidate(self, token, database_id=None):
+        key = token_key(token)
+        with self._lock:
+            for cache_key in list(self._schemas):
+                if cache_key[0] == key and database_id in (None, cache_key[1]):
+                    del self._schemas[cache_key]
+
+
+schema_cache = SchemaCache()
+
+
+class _PagesEndpoint:
+    def __init__(self, gateway):
+        self._gateway = gateway
+        self._endpoint = gateway.client.pages
+
+    def retrieve(self, page_id, **kwargs):
+        gateway = self._gateway
+        if kwargs:
+            # 带 filter_properties 等参数时返回的是部分页面，不走缓存
+            return gateway.invoke('pages.retrieve', lambda: self._endpoint.retrieve(page_id=page_id, **kwargs))
+
+        page = gateway.memo.get(page_id)
+        if page is None and gateway.shared is not None:
+            page = gateway.shared.get(page_id, max_age_seconds=gateway.shared_ttl_seconds)
+            if page is not None:
+                gateway.memo.put(page)
+        if page is not None:
+            gateway.stats['retrieve_hits'] += 1
+            return page
+
+        gateway.stats['retrieve_misses'] += 1
+        page = gateway.invoke('pages.retrieve', lambda: self._endpoint.retrieve(page_id=page_id))
+        gateway.remember(page)
+        return page
+
+    def update(self, page_id, **kwargs):
+        gateway = self._gateway
+        try:
+            page = gateway.invoke('pages.update', lambda: self._endpoint.update(page_id=page_id, **kwargs))
+        finally:
+            gateway.forget(page_id)
+        # 更新接口返回的是写入后的完整页面
+        gateway.remember(page)
+        return page
+
+    def create(self, **kwargs):
+        try:
+            return self._gateway.invoke('pages.create', lambda: self._endpoint.create(**kwargs))
+        finally:
+            self._gateway.clear_queries()
+
+    def __getattr__(self, name):
+        return _scheduled(self._gateway, getattr(self._endpoint, name), f'pages.{name}')
+
+
+class _DatabasesEndpoint:
+    def __init__(self, gateway):
+        self._gateway = gateway
+        self._endpoint = gateway.client.databases
+
+    def query(self, **kwargs):
+        gateway = self._gateway
+        key = json.dumps(kwargs, sort_keys=True, default=str)
+        with gateway.lock:
+            response = gateway.queries.get(key)
+        if response is not None:
+            gateway.stats['query_hits'] += 1
+            return response
+
+        gateway.stats['query_misses'] += 1
+        response = read_flight.do(
+            gateway.scope, 'databases.query', kwargs,
+            lambda: gateway.invoke('databases.query', lambda: self._endpoint.query(**kwargs))
+        )
+        with gateway.lock:
+            gateway.queries[key] = response
+        for page in response.get('results', []) or []:
+            gateway.remember(page)
+        return response
+
+    def retrieve(self, database_id, **kwargs):
+        return read_flight.do(
+            self._gateway.scope, 'databases.retrieve', dict(kwargs, database_id=database_id),
+            lambda: self._gateway.invoke(
+                'databases.retrieve', lambda: self._endpoint.retrieve(database_id=database_id, **kwargs)
+            )
+        )
+
+    def __getattr__(self, name):
+        return _scheduled(self._gateway, getattr(self._endpoint, name), f'databases.{name}')
+
+
+class NotionGateway:
+    """
+    包装 notion_client.Client，接口与 SDK 一致（notion.pages.retrieve(...) 等）
+
+    每个请求创建一个实例，实例内的缓存随请求结束而丢弃
+    """
+
+    def __init__(self, client, token=None, shared_ttl_seconds=0, dispatcher=None, schema_ttl_seconds=0,
+                 scheduler=None, breaker=None):
+        self.client = client
+        self.token = token
+        self.scope = token_key(token)
+        self.schema_ttl_seconds = schema_ttl_seconds
+        # dispatcher(token, calls, priorities) -> results，为 None 时用线程池调用同步客户端
+        self.dispatcher = dispatcher
+        # scheduler(token, priority, fn) -> fn()，同步调用前领取名额，为 None 时直接调用
+        self.scheduler = scheduler
+        self.breaker = breaker
+        self.lock = threading.Lock()
+        self.memo = PageCache()
+        self.queries = {}
+        self.shared_ttl_seconds = shared_ttl_seconds
+        self.shared = shared_page_cache.for_token(token) if shared_ttl_seconds and token else None
+        self.stats = {'retrieve_hits': 0, 'retrieve_misses': 0, 'query_hits': 0, 'query_misses': 0}
+        self.pages = _PagesEndpoint(self)
+        self.databases = _DatabasesEndpoint(self)
+
+    def retrieve_schema(self, database_id, refresh=False):
+        """
+        获取数据库结构（databases.retrieve），在 schema_ttl_seconds 内复用进程级缓存
+
+        配置页面等需要最新结构的地方传 refresh=True，同时刷新缓存
+        """
+        if not refresh and self.schema_ttl_seconds:
+            schema = schema_cache.get(self.token, database_id, self.schema_ttl_seconds)
+            if schema is not None:
+                return schema
+        schema = self.databases.retrieve(database_id)
+        schema_cache.put(self.token, database_id, schema)
+        return schema
+
+    def invoke(self, endpoint, fn):
+        """执行一次同步 SDK 调用（先经过熔断器，有调度器时再按调用类别排队）"""
+        started = time.perf_counter()
+        try:
+            result = self._guarded(classify(endpoint), fn)
+        except Exception as e:
+            record_notion_call(endpoint, (time.perf_counter() - started) * 1000, e)
+            raise
+        record_notion_call(endpoint, (time.perf_counter() - started) * 1000)
+        return result
+
+    def _guarded(self, priority, fn):
+        if self.breaker is None:
+            return fn() if self.scheduler is None else self.scheduler(self.token, priority, fn)
+
+        probe = self.breaker.before_call()
+        started = []
+
+        def timed():
+            # 只计算调用本身的耗时，不含排队
+            started.append(time.monotonic())
+            return fn()
+
+        try:
+            result = timed() if self.scheduler is None else self.scheduler(self.token, priority, timed)
+        except Exception as e:
+            if not started:
+                self.breaker.release_probe(probe)
+            else:
+                self.breaker.record((time.monotonic() - started[0]) * 1000, e, probe)
+            raise
+        self.breaker.record((time.monotonic() - started[0]) * 1000, None, probe)
+        return result
+
+    def remember(self, page):
+        """把读取到的页面放入请求缓存和进程缓存"""
+        if not isinstance(page, dict):
+            return
+        self.memo.put(page)
+        if self.shared is not None:
+            self.shared.put(page)
+
+    def forget(self, page_id):
+        """页面被写入后失效相关缓存"""
+        self.memo.invalidate(page_id)
+        if self.shared is not None:
+            self.shared.invalidate(page_id)
+        self.clear_queries()
+
+    def clear_queries(self):
+        """写入后清空查询缓存，之后的读取也不再加入写入前开始的合并读取"""
+        with self.lock:
+            self.queries.clear()
+        read_flight.invalidate(self.scope)
+
+    def _cached_result(self, endpoint, kwargs):
+        """gather 中可以由缓存直接返回的读取"""
+        if endpoint == 'pages.retrieve' and set(kwargs) == {'page_id'}:
+            page = self.memo.get(kwargs['page_id'])
+            if page is not None:
+                self.stats['retrieve_hits'] += 1
+            return page
+        if endpoint == 'databases.query':
+            with self.lock:
+                response = self.queries.get(json.dumps(kwargs, sort_keys=True, default=str))
+            if response is not None:
+                self.stats['query_hits'] += 1
+            return response
+        return None
+
+    def _call_sync(self, endpoint, kwargs, priority):
+        group, method = endpoint.split('.')
+        function = getattr(getattr(self.client, group), method)
+        try:
+            return self._guarded(priority, lambda: function(**kwargs))
+        except Exception as e:
+            return e
+
+    def _record_result(self, endpoint, kwargs, result):
+        """按调用类型更新缓存"""
+        if endpoint == 'pages.update':
+            self.forget(kwargs.get('page_id'))
+        elif endpoint == 'pages.create':
+            self.clear_queries()
+        if isinstance(result, Exception):
+            return
+        if endpoint == 'pages.retrieve':
+            self.stats['retrieve_misses'] += 1
+            if set(kwargs) == {'page_id'}:
+                self.remember(result)
+        elif endpoint == 'pages.update':
+            self.remember(result)
+        elif endpoint == 'databases.query':
+            self.stats['query_misses'] += 1
+            with self.lock:
+                self.queries[json.dumps(kwargs, sort_keys=True, default=str)] = result
+            for page in result.get('results', []) or []:
+                self.remember(page)
+
+    def gather(self, calls, max_concurrency=None):
+        """
+        并发执行一批相互独立的调用
+
+        Args:
+            calls: [(endpoint, kwargs)]，endpoint 为 pages.retrieve / pages.update /
+                   pages.create / databases.query 等
+            max_concurrency: 没有异步执行器时线程池的大小（默认顺序执行）
+
+        Returns:
+            list: 与 calls 顺序一致的结果，失败的调用对应异常对象（不抛出）
+        """
+        calls = list(calls)
+        results = [None] * len(calls)
+        pending = []
+        for position, (endpoint, kwargs) in enumerate(calls):
+            cached = self._cached_result(endpoint, kwargs)
+            if cached is not None:
+                results[position] = cached
+            else:
+                pending.append(position)
+        if not pending:
+            return results
+
+        pending_calls = [calls[position] for position in pending]
+        # 调用类别依赖请求上下文，在调用方线程中确定
+        priorities = [classify(endpoint) for endpoint, _ in pending_calls]
+        started = time.perf_counter()
+        if self.breaker is not None and self.breaker.state != 'closed':
+            # 熔断打开时逐个快速失败；半开时第一个调用作为探测，成功后其余继续执行
+            outcomes = [
+                self._call_sync(endpoint, kwargs, priority)
+                for (endpoint, kwargs), priority in zip(pending_calls, priorities)
+            ]
+        elif self.dispatcher is not None:
+            outcomes = self.dispatcher(self.token, pending_calls, priorities=priorities)
+            if self.breaker is not None:
+                for outcome in outcomes:
+                    self.breaker.record(error=outcome if isinstance(outcome, Exception) else None)
+        elif max_concurrency and max_concurrency > 1 and len(pending_calls) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(pending_calls))) as executor:
+                outcomes = list(executor.map(
+                    lambda item: self._call_sync(item[0][0], item[0][1], item[1]),
+                    zip(pending_calls, priorities)
+                ))
+        else:
+            outcomes = [
+                self._call_sync(endpoint, kwargs, priority)
+                for (endpoint, kwargs), priority in zip(pending_calls, priorities)
+            ]
+
+        # 缓存和调用追踪只在调用方线程中更新（同一批调用按批次记录，耗时为整批的耗时）
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        batch = next_batch_id()
+        for position, outcome in zip(pending, outcomes):
+            endpoint, kwargs = calls[position]
+            record_notion_call(endpoint, elapsed_ms, outcome if isinstance(outcome, Exception) else None, batch)
+            self._record_result(endpoint, kwargs, outcome)
+            results[position] = outcome
+        return results
+
+    def __getattr__(self, name):
+        # search、users 等其他端点透传（经过调度器）
+        return _scheduled(self, getattr(self.client, name), name)
+
+
+def _scheduled(gateway, value, path):
+    """端点和方法包装为经过调度器的代理，普通数据属性原样返回"""
+    if callable(value) or hasattr(value, '__dict__'):
+        return _ScheduledProxy(gateway, value, path)
+    return value
+
+
+class _ScheduledProxy:
+    """透传 SDK 端点，调用时经过网关的调度器（notion.users.me() 的类别按 users.me 判断）"""
+
+    def __init__(self, gateway, target, path):
+        self._gateway = gateway
+        self._target = target
+        self._path = path
+
+    def __call__(self, *args, **kwargs):
+        return self._gateway.invoke(self._path, lambda: self._target(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return _scheduled(self._gateway, getattr(self._target, name), f'{self._path}.{name}')
@@ -0,0 +1,261 @@
+"""
+Notion 写发件箱：所有排程写入先记录到 notion_write_outbox，再由 drain 并发执行，
+失败的行保留在表中，可以只重放失败部分
+
+熔断器打开时被拒绝的写入标记为 deferred（不计入尝试次数），熔断关闭后自动重放
+
+pages.create 没有幂等键：超时的创建可能已经成功，重试（包括重放）前先按标题与开始时间
+查询是否已有该页面，找到时直接记为成功，避免重复创建休息任务
+"""
+
+from datetime import datetime
+import time
+
+
+from models.database import db, NotionWriteOutbox
+from services.call_scheduler import background_calls
+from services.circuit_breaker import CircuitOpenError
+from services.mirror import to_utc_naive
+
+RETRY_BASE_DELAY = 0.5  # 秒，指数退避的初始等待
+DEFAULT_WORKERS = 3
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def enqueue_write(config_id, kind, action, payload, page_id=None, operation_id=None):
+    """
+    记录一条待执行的 Notion 写操作（调用方负责提交事务）
+
+    Args:
+        config_id: 配置 ID
+        kind: 写入类别，如 task_time / rest_task / rest_cleanup / delay_time
+        action: update（pages.update）或 create（pages.create）
+        payload: 传给 Notion SDK 的参数（不含 page_id）
+        page_id: update 的目标页面
+        operation_id: 关联的排程操作 ID（延期调整等不属于排程的写入为 None）
+    """
+    entry = NotionWriteOutbox(
+        config_id=config_id,
+        operation_id=operation_id,
+        kind=kind,
+        action=action,
+        page_id=page_id,
+        payload=payload,
+        status='pending',
+        attempts=0
+    )
+    db.session.add(entry)
+    return entry
+
+
+def outbox_call(entry):
+    """把发件箱行转换为 (endpoint, kwargs) 调用"""
+    if entry.action == 'create':
+        return 'pages.create', dict(entry.payload)
+    if entry.action == 'update':
+        return 'pages.update', dict(entry.payload, page_id=entry.page_id)
+    raise ValueError(f"未知的发件箱操作: {entry.action}")
+
+
+def created_page_query(payload):
+    """
+    查询 create 是否已经成功的参数：同一数据库中标题相同、开始时间不早于计划开始时间的页面
+
+    Returns:
+        tuple: (databases.query 参数, 时间属性名, 开始时间)；payload 中没有标题或时间时返回 None
+    """
+    database_id = (payload.get('parent') or {}).get('database_id')
+    title_property = title = date_property = start = None
+    for name, value in (payload.get('properties') or {}).items():
+        if 'title' in value and title_property is None:
+            title_property = name
+            title = ''.join(item.get('text', {}).get('content', '') for item in value['title'])
+        elif 'date' in value and date_property is None and (value['date'] or {}).get('start'):
+            date_property, start = name, value['date']['start']
+    if not (database_id and title and date_property):
+        return None
+    query = {
+        'database_id': database_id,
+        'filter': {'and': [
+            {'property': title_property, 'title': {'equals': title}},
+            {'property': date_property, 'date': {'on_or_after': start}},
+        ]},
+        'page_size': 100,
+    }
+    return query, date_property, start
+
+
+def find_created_page(response, date_property, start):
+    """查询结果中开始时间与计划完全一致的页面 ID"""
+    expected = to_utc_naive(start)
+    for page in response.get('results', []) or []:
+        date = ((page.get('properties') or {}).get(date_property) or {}).get('date') or {}
+        if date.get('start') and to_utc_naive(date['start']) == expected:
+            return page['id']
+    return None
+
+
+def reconcile_creates(notion, entries):
+    """
+    检查之前尝试过的 create 是否实际已经成功
+
+    Returns:
+        tuple: (已存在页面的行, 可以重试的行, 检查失败、本轮不重试的行)
+    """
+    checks = [(entry, created_page_query(entry.payload)) for entry in entries]
+    queries = [(entry, check) for entry, check in checks if check is not None]
+    with background_calls():
+        responses = notion.gather([('databases.query', check[0]) for _, check in queries])
+    found, retry, unknown = [], [entry for entry, check in checks if check is None], []
+    for (entry, (_, date_property, start)), response in zip(queries, responses):
+        if isinstance(response, Exception):
+            entry.last_error = f"检查创建结果失败: {response}"
+            unknown.append(entry)
+            continue
+        page_id = find_created_page(response, date_property, start)
+        if page_id:
+            entry.page_id = page_id
+            found.append(entry)
+        else:
+            retry.append(entry)
+    return found, retry, unknown
+
+
+def drain_outbox(notion, entries, max_workers=DEFAULT_WORKERS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    并发执行发件箱中的写操作，并把结果写回各行
+
+    每一轮把所有待执行的写入交给 notion.gather 并发执行（作为 bulk_write 受调度器约束），
+    失败的写入在指数退避后进入下一轮；每轮结束提交各行状态，中途退出时重放只执行未成功的写入。
+    之前尝试过的 create 先确认页面是否已经存在
+
+    Args:
+        notion: NotionGateway 实例
+        entries: 待执行的 NotionWriteOutbox 行（pending、failed 或 deferred）
+        max_workers: 没有异步执行器时的并发线程数
+        max_attempts: 本次 drain 中每条写入的最大尝试次数
+
+    Returns:
+        tuple: (成功数, 失败数)
+    """
+    pending = [entry for entry in entries if entry.status != 'succeeded']
+    if not pending:
+        return 0, 0
+
+    succeeded = 0
+    deferred = 0
+    attempt = 0
+    while pending and attempt < max_attempts:
+        attempt += 1
+        if attempt > 1:
+            time.sleep(RETRY_BASE_DELAY * (2 ** (attempt - 2)))
+
+        retry = []
+        attempted_creates = [entry for entry in pending if entry.action == 'create' and entry.attempts]
+        if attempted_creates:
+            found, retry_creates, unknown = reconcile_creates(notion, attempted_creates)
+            for entry in found:
+                entry.status = 'succeeded'
+                entry.last_error = None
+                entry.updated_at = datetime.utcnow()
+                succeeded += 1
+            for entry in unknown:
+                # 无法确认是否已创建：本轮不重试，计入一次尝试
+                entry.attempts += 1
+                entry.updated_at = datetime.utcnow()
+                retry.append(entry)
+            skipped = {id(entry) for entry in found + unknown}
+            pending = [entry for entry in pending if id(entry) not in skipped]
+            if found:
+                print(f"🔁 {len(found)} 个之前超时的创建已在 Notion 中存在，不再重复创建")
+
+        # 发件箱写入按批量写入排队，交互请求的读写优先
+        with background_calls():
+            results = notion.gather([outbox_call(entry) for entry in pending], max_concurrency=max_workers)
+        for entry, result in zip(pending, results):
+            entry.updated_at = datetime.utcnow()
+            if isinstance(result, CircuitOpenError):
+                # Notion 不可用：写入留在发件箱，熔断关闭后重放
+                entry.status = 'deferred'
+                entry.last_error = str(result)
+                deferred += 1
+                continue
+            entry.attempts = (entry.attempts or 0) + 1
+            if isinstance(result, Exception):
+                entry.last_error = str(result)
+                retry.append(entry)
+                continue
+            entry.status = 'succeeded'
+            entry.last_error = None
+            if entry.action == 'create' and isinstance(result, dict) and result.get('id'):
+                entry.page_id = result['id']
+            succeeded += 1
+        pending = retry
+        # 每轮提交：进程中途退出时已成功的写入不会在重放时再次执行
+        db.session.commit()
+
+    for entry in pending:
+        entry.status = 'failed'
+        print(f"❌ 发件箱写入失败 #{entry.id} ({entry.kind} {entry.page_id}): {entry.last_error}")
+
+    db.session.commit()
+    print(f"📮 发件箱执行完成: 成功 {succeeded}，失败 {len(pending)}" + (f"，暂存 {deferred}" if deferred else ''))
+    return succeeded, len(pending)
+
+
+def get_replayable_entries(operation_id):
+    """获取排程操作中尚未成功的写入"""
+    return NotionWriteOutbox.query.filter(
+        NotionWriteOutbox.operation_id == operation_id,
+        NotionWriteOutbox.status != 'succeeded'
+    ).order_by(NotionWriteOutbox.id).all()
+
+
+def count_deferred_entries(operation_id):
+    """排程操作中因熔断暂存的写入数"""
+    return NotionWriteOutbox.query.filter_by(operation_id=operation_id, status='deferred').count()
+
+
+def get_deferred_operation_ids(config_id):
+    """有暂存写入的排程操作 ID（按 ID 排序）"""
+    rows = db.session.query(NotionWriteOutbox.operation_id).filter(
+        NotionWriteOutbox.config_id == config_id,
+        NotionWriteOutbox.status == 'deferred',
+        NotionWriteOutbox.operation_id.isnot(None)
+    ).distinct().order_by(NotionWriteOutbox.operation_id).all()
+    return [operation_id for operation_id, in rows]
+
+
+def has_deferred_writes(config_id):
+    """配置是否有因熔断暂存的写入"""
+    return db.session.query(NotionWriteOutbox.query.filter_by(
+        config_id=config_id, status='deferred'
+    ).exists()).scalar()
+
+
+def get_unattached_deferred_entries(config_id):
+    """不属于排程操作的暂存写入（如延期调整），按 ID 排序"""
+    return NotionWriteOutbox.query.filter(
+        NotionWriteOutbox.config_id == config_id,
+        NotionWriteOutbox.status == 'deferred',
+        NotionWriteOutbox.operation_id.is_(None)
+    ).order_by(NotionWriteOutbox.id).all()
+
+
+def count_operation_results(operation_id, counted_kinds):
+    """
+    统计排程操作的写入结果（仅统计 counted_kinds 中的类别）
+
+    Returns:
+        tuple: (成功数, 总数)
+    """
+    rows = db.session.query(
+        NotionWriteOutbox.status, db.func.count(NotionWriteOutbox.id)
+    ).filter(
+        NotionWriteOutbox.operation_id == operation_id,
+        NotionWriteOutbox.kind.in_(counted_kinds)
+    ).group_by(NotionWriteOutbox.status).all()
+
+    total = sum(count for _, count in rows)
+    success = sum(count for status, count in rows if status == 'succeeded')
+    return success, total
@@ -0,0 +1,142 @@
+"""
+排程预览存储：预览页面只返回汇总信息，任务树通过 JSON 接口按层级懒加载
+
+预览生成时把任务树压缩为只含展示字段的节点（时间转为字符串、预先计算子孙数量），
+按 preview_id 保存在进程内（有数量上限和过期时间）。接口返回前几层，
+更深的子树按节点路径（如 "0.2.1"，每一级为在兄弟中的下标）按需获取
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import time
+import uuid
+
+DEFAULT_MAX_PREVIEWS = 200
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_DEPTH = 2
+MAX_DEPTH = 10
+NODE_FIELDS = ('id', 'name', 'priority', 'estimated_time', 'status')
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else (value or None)
+
+
+def compact_nodes(tasks, prefix=''):
+    """
+    把任务树压缩为预览节点
+
+    Returns:
+        tuple: (节点列表, 节点总数)
+    """
+    nodes = []
+    total = 0
+    for index, task in enumerate(tasks):
+        path = f'{prefix}.{index}' if prefix else str(index)
+        children, descendant_count = compact_nodes(task.get('children') or [], path)
+        node = {field: task.get(field) for field in NODE_FIELDS}
+        node.update({
+            'path': path,
+            'start_time': _iso(task.get('start_time')),
+            'end_time': _iso(task.get('end_time')),
+            'child_count': len(children),
+            'descendant_count': descendant_count,
+            'children': children,
+        })
+        nodes.append(node)
+        total += 1 + descendant_count
+    return nodes, total
+
+
+def latest_end_time(nodes):
+    """任务（不含休息）中最晚的结束时间（ISO 字符串）"""
+    latest = None
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        end_time = node.get('end_time')
+        if end_time and (latest is None or datetime.fromisoformat(end_time) > datetime.fromisoformat(latest)):
+            latest = end_time
+        stack.extend(node['children'])
+    return latest
+
+
+def truncate(nodes, depth):
+    """只保留 depth 层，被截断的节点不带 children（child_count 仍然可用）"""
+    result = []
+    for node in nodes:
+        item = {key: value for key, value in node.items() if key != 'children'}
+        if depth > 1:
+            item['children'] = truncate(node['children'], depth - 1)
+        result.append(item)
+    return result
+
+
+class PreviewStore:
+    """进程内的预览缓存（LRU + 过期时间）"""
+
+    def __init__(self, max_previews=DEFAULT_MAX_PREVIEWS, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_previews = max_previews
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._previews = OrderedDict()
+
+    def put(self, config_id, task_tree, rest_tasks_info, start_time, total_tasks):
+        """保存预览，返回 (preview_id, 汇总信息)"""
+        nodes, node_count = compact_nodes(task_tree)
+        summary = {
+            'start_time': _iso(start_time),
+            'end_time': latest_end_time(nodes),
+            'total_tasks': total_tasks,
+            'node_count': node_count,
+            'root_count': len(nodes),
+            'rest_tasks_count': len(rest_tasks_info),
+        }
+        preview_id = uuid.uuid4().hex
+        with self._lock:
+            self._previews[preview_id] = (config_id, time.monotonic(), summary, nodes)
+            while len(self._previews) > self.max_previews:
+                self._previews.popitem(last=False)
+        return preview_id, summary
+
+    def get(self, preview_id, config_id):
+        """
+        取出预览（只能由生成它的配置访问）
+
+        Returns:
+            tuple: (汇总信息, 节点列表)，不存在或已过期时返回 (None, None)
+        """
+        with self._lock:
+            entry = self._previews.get(preview_id)
+            if entry is None:
+                return None, None
+            if time.monotonic() - entry[1] > self.ttl_seconds:
+                del self._previews[preview_id]
+                return None, None
+            self._previews.move_to_end(preview_id)
+        if entry[0] != config_id:
+            return None, None
+        return entry[2], entry[3]
+
+    def discard(self, preview_id):
+        with self._lock:
+            self._previews.pop(preview_id, None)
+
+
+def find_node(nodes, path):
+    """按路径（"0.2.1"）查找节点，路径无效时返回 None"""
+    node = None
+    children = nodes
+    try:
+        for part in path.split('.'):
+            if not part.isdigit():
+                return None
+            node = children[int(part)]
+            children = node['children']
+    except IndexError:
+        return None
+    return node
+
+
+preview_store = PreviewStore()
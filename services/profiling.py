@@ -0,0 +1,348 @@
+"""
+按需的请求剖析与慢请求捕获
+
+- 显式剖析：请求带 X-Profile 头（sampling 或 cprofile），或在 /admin/profiles 把模式切换为剖析所有请求
+- 确定性剖析（cProfile）：记录每个函数的调用次数与耗时，开销较大；同一时间只剖析一个请求，
+  其余请求退回采样（Python 3.12 起同一时间也只能启用一个 cProfile）
+- 采样剖析：后台线程每 PROFILE_SAMPLE_INTERVAL_MS 记录一次被剖析请求所在线程的调用栈，函数耗时为估计值
+- 慢请求捕获：SLOW_REQUEST_THRESHOLD_MS 大于 0 时每个请求都以采样方式剖析，超过阈值的请求保存结果，其余丢弃
+
+保存的结果（热点函数、调用栈、按端点的 Notion 调用分布）放在有界的环形缓冲区中，最多 PROFILE_BUFFER_SIZE 个。
+以上都需要 PROFILING_ENABLED=true
+"""
+
+from collections import Counter, deque
+from datetime import datetime
+import functools
+import itertools
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('off', 'sampling', 'cprofile')
+HEADER_MODES = {'1': 'sampling', 'true': 'sampling', 'sampling': 'sampling',
+                'cprofile': 'cprofile', 'deterministic': 'cprofile'}
+TOP_FUNCTIONS = 30
+TOP_STACKS = 15
+MAX_STACK_DEPTH = 64
+
+
+@functools.lru_cache(maxsize=4096)
+def describe_code(code):
+    """函数的显示名称，以及是否为应用自身的代码（不在 site-packages 或标准库中）"""
+    filename = code.co_filename
+    is_app = filename.startswith(ROOT) and 'site-packages' not in filename
+    location = os.path.relpath(filename, ROOT) if is_app else os.path.basename(filename)
+    return f"{code.co_name} ({location}:{code.co_firstlineno})", is_app
+
+
+class StackSampler:
+    """后台线程定期记录已注册线程的调用栈；没有注册的线程时休眠"""
+
+    def __init__(self, interval_ms=5):
+        self.interval_ms = interval_ms
+        self._lock = threading.Lock()
+        self._active = {}  # 线程 ID -> Counter(调用栈)
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def register(self, thread_id):
+        stacks = Counter()
+        with self._lock:
+            self._active[thread_id] = stacks
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return stacks
+
+    def unregister(self, thread_id):
+        with self._lock:
+            self._active.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            for thread_id, stacks in active.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if stack:
+                    stacks[tuple(reversed(stack))] += 1
+            del frames
+            time.sleep(self.interval_ms / 1000)
+
+
+class ProfileSession:
+    """一个请求的剖析：开始时启用剖析器，结束时汇总热点函数"""
+
+    def __init__(self, profile_id, mode, reason, sampler, trace=None):
+        self.id = profile_id
+        self.mode = mode
+        self.reason = reason
+        self.trace = trace
+        self._sampler = sampler
+        self._thread_id = threading.get_ident()
+        self._profile = None
+        self._stacks = None
+        self.started = time.perf_counter()
+
+    def start(self):
+        if self.mode == 'cprofile':
+            import cProfile  # 只在确定性剖析时导入，不增加启动开销
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._stacks = self._sampler.register(self._thread_id)
+
+    def stop(self):
+        """
+        停止剖析
+
+        Returns:
+            dict: elapsed_ms、hotspots（热点函数）、stacks（调用栈，仅采样）、
+                  top_function（自身耗时最多的应用函数，库调用计入直接调用它的应用函数）
+        """
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        if self._profile is not None:
+            self._profile.disable()
+            hotspots, top_function = self._cprofile_hotspots()
+            stacks = []
+        else:
+            self._sampler.unregister(self._thread_id)
+            hotspots, stacks, top_function = self._sampled_hotspots()
+        return {'elapsed_ms': elapsed_ms, 'hotspots': hotspots, 'stacks': stacks, 'top_function': top_function}
+
+    def _cprofile_hotspots(self):
+        import pstats
+        stats = pstats.Stats(self._profile).stats
+        rows = []
+        for (filename, line, name), (_, calls, self_s, total_s, _) in stats.items():
+            is_app = filename.startswith(ROOT) and 'site-packages' not in filename
+            if is_app:
+                location = os.path.relpath(filename, ROOT)
+            else:
+                location = os.path.basename(filename) if filename != '~' else 'built-in'
+            rows.append({
+                'function': f"{name} ({location}:{line})" if line else name,
+                'calls': calls, 'self_ms': round(self_s * 1000, 2), 'total_ms': round(total_s * 1000, 2),
+                'app': is_app,
+            })
+        app_rows = [row for row in rows if row['app']]
+        top = max(app_rows, key=lambda row: row['self_ms'])['function'] if app_rows else None
+        rows.sort(key=lambda row: -row['total_ms'])
+        return rows[:TOP_FUNCTIONS], top
+
+    def _sampled_hotspots(self):
+        """按采样数估计耗时：total 为出现在调用栈中的次数，self 为位于栈顶的次数"""
+        interval = self._sampler.interval_ms
+        total, own, innermost_app, collapsed = Counter(), Counter(), Counter(), Counter()
+        for stack, count in self._stacks.items():
+            for code in set(stack):
+                total[code] += count
+            own[stack[-1]] += count
+            app_frames = [code for code in stack if describe_code(code)[1]]
+            if app_frames:
+                innermost_app[app_frames[-1]] += count
+            # 调用栈只保留应用自身的函数，栈顶的库函数保留一层，便于看出在等待什么
+            labels = [describe_code(code)[0] for code in stack if describe_code(code)[1]]
+            leaf, leaf_is_app = describe_code(stack[-1])
+            if not leaf_is_app:
+                labels.append(leaf)
+            collapsed[' → '.join(labels)] += count
+        rows = [{
+            'function': describe_code(code)[0], 'calls': None,
+            'self_ms': round(own[code] * interval, 1), 'total_ms': round(samples * interval, 1),
+            'app': describe_code(code)[1],
+        } for code, samples in total.most_common(TOP_FUNCTIONS)]
+        stacks = [{'stack': stack, 'samples': count, 'ms': round(count * interval, 1)}
+                  for stack, count in collapsed.most_common(TOP_STACKS)]
+        top = describe_code(innermost_app.most_common(1)[0][0])[0] if innermost_app else None
+        return rows, stacks, top
+
+
+class ProfileStore:
+    """最近保存的剖析结果（环形缓冲区）"""
+
+    def __init__(self, size=50):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=size)
+        self._ids = itertools.count(1)
+
+    def resize(self, size):
+        with self._lock:
+            self._entries = deque(self._entries, maxlen=max(1, size))
+
+    @property
+    def capacity(self):
+        return self._entries.maxlen
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def next_id(self):
+        return next(self._ids)
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def list(self):
+        """从新到旧"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((entry for entry in self._entries if entry['id'] == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RequestProfiler:
+    """决定哪些请求需要剖析，并保存显式剖析的请求与慢请求"""
+
+    def __init__(self):
+        self.enabled = False
+        self.mode = 'off'  # 管理页面的开关：剖析所有请求的方式
+        self.slow_threshold_ms = 0
+        self.sampler = StackSampler()
+        self.store = ProfileStore()
+        self._cprofile_lock = threading.Lock()
+
+    def configure(self, enabled=False, slow_threshold_ms=0, buffer_size=50, sample_interval_ms=5):
+        self.enabled = enabled
+        self.slow_threshold_ms = slow_threshold_ms
+        self.sampler.interval_ms = max(1, sample_interval_ms)
+        self.store.resize(buffer_size)
+
+    def set_mode(self, mode):
+        if mode not in MODES:
+            raise ValueError(f"未知的剖析模式: {mode}")
+        self.mode = mode
+
+    def begin(self, header_value=None, trace=None):
+        """
+        开始剖析当前请求
+
+        Returns:
+            ProfileSession | None: 不需要剖析时返回 None
+        """
+        if not self.enabled:
+            return None
+        requested = HEADER_MODES.get((header_value or '').strip().lower())
+        if requested:
+            reason = 'header'
+        elif self.mode != 'off':
+            requested, reason = self.mode, 'toggle'
+        elif self.slow_threshold_ms > 0:
+            requested, reason = 'sampling', 'slow'
+        else:
+            return None
+        if requested == 'cprofile' and not self._cprofile_lock.acquire(blocking=False):
+            requested = 'sampling'
+        session = ProfileSession(self.store.next_id(), requested, reason, self.sampler, trace)
+        try:
+            session.start()
+        except ValueError:
+            # 其他剖析工具（调试器、外部的 cProfile）已经启用
+            if requested != 'cprofile':
+                raise
+            self._cprofile_lock.release()
+            session = ProfileSession(session.id, 'sampling', reason, self.sampler, trace)
+            session.start()
+        return session
+
+    def finish(self, session, method, path, endpoint, status):
+        """结束剖析；显式剖析的请求与慢请求保存到缓冲区，返回保存的结果"""
+        try:
+            result = session.stop()
+        finally:
+            if session.mode == 'cprofile':
+                self._cprofile_lock.release()
+        elapsed_ms = result.pop('elapsed_ms')
+        slow = self.slow_threshold_ms > 0 and elapsed_ms >= self.slow_threshold_ms
+        if session.reason == 'slow' and not slow:
+            return None
+        entry = {
+            'id': session.id,
+            'captured_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'method': method, 'path': path, 'endpoint': endpoint, 'status': status,
+            'elapsed_ms': round(elapsed_ms, 1), 'mode': session.mode, 'reason': session.reason, 'slow': slow,
+            'notion': session.trace.summary() if session.trace is not None else None,
+            **result,
+        }
+        self.store.add(entry)
+        if slow:
+            print(f"🐢 慢请求 {method} {path}: {entry['elapsed_ms']} ms，已保存剖析 #{session.id}")
+        return entry
+
+    def status(self):
+        return {
+            'enabled': self.enabled, 'mode': self.mode, 'slow_threshold_ms': self.slow_threshold_ms,
+            'sample_interval_ms': self.sampler.interval_ms, 'buffer_size': self.store.capacity,
+            'captured': len(self.store),
+        }
+
+
+profiler = RequestProfiler()
+
+# 剖析页面本身和静态文件不剖析
+EXCLUDED_ENDPOINTS = {None, 'static', 'profiles', 'profile_detail', 'update_profiling'}
+
+
+def init_profiling(app, header_allowed=None):
+    """
+    按配置启用剖析并注册请求钩子（在 init_response_pipeline 之后调用，请求的 Notion 调用追踪已经开始）
+
+    header_allowed: 无参函数，返回 False 时忽略该请求的 X-Profile 头（只允许管理员显式剖析）
+    """
+    from flask import g, request
+    from services.instrumentation import current_notion_trace
+
+    profiler.configure(
+        enabled=app.config.get('PROFILING_ENABLED', False),
+        slow_threshold_ms=app.config.get('SLOW_REQUEST_THRESHOLD_MS', 0),
+        buffer_size=app.config.get('PROFILE_BUFFER_SIZE', 50),
+        sample_interval_ms=app.config.get('PROFILE_SAMPLE_INTERVAL_MS', 5),
+    )
+
+    @app.before_request
+    def start_profiling():
+        if not profiler.enabled or request.endpoint in EXCLUDED_ENDPOINTS:
+            return
+        header_value = request.headers.get('X-Profile')
+        if header_value and header_allowed is not None and not header_allowed():
+            header_value = None
+        g.profile_session = profiler.begin(header_value, current_notion_trace())
+
+    @app.after_request
+    def mark_profiled(response):
+        session = g.get('profile_session')
+        if session is not None:
+            g.profile_status = response.status_code
+            if session.reason != 'slow':
+                response.headers['X-Profile-Id'] = str(session.id)
+        return response
+
+    @app.teardown_request
+    def finish_profiling(error=None):
+        # 流式响应在输出结束后才执行 teardown，渲染的耗时也计入
+        session = g.pop('profile_session', None)
+        if session is not None:
+            status = g.pop('profile_status', 500 if error is not None else None)
+            path = request.full_path.rstrip('?')
+            profiler.finish(session, request.method, path, request.endpoint, status)
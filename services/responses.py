@@ -0,0 +1,261 @@
+"""
+响应输出优化：流式模板渲染、gzip/brotli 压缩协商、快速 JSON 编码，以及首字节时间/传输大小统计
+
+- stream_page：大页面边渲染边发送（按 STREAM_BUFFER_SIZE 个模板片段合并发送）
+- 压缩：按 Accept-Encoding 选择 br（安装了 brotli 时）或 gzip，流式响应逐块压缩
+- 实际压缩的正文在强 ETag 后加编码后缀（如 abc-gzip），matching_etag / not_modified 处理条件请求，304 同样带 Vary
+- OrjsonProvider：安装了 orjson 时替换 Flask 的 JSON 编码器，datetime 等类型仍按 Flask 默认格式输出
+- 每个请求的首字节时间（TTFB）、原始大小和实际发送大小记录到 request_metrics
+"""
+
+import time
+import zlib
+
+from flask import Response, current_app, g, get_flashed_messages, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+from services.instrumentation import request_metrics, begin_notion_trace, end_notion_trace, current_notion_trace
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/javascript',
+    'application/json', 'application/javascript',
+}
+STREAM_BUFFER_SIZE = 40
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """用 orjson 序列化 jsonify 的响应，orjson 不支持的对象交给 Flask 默认编码"""
+
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def _encode(self, obj, indent=False):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options(indent))
+        except TypeError:
+            # 超出 64 位的整数等 orjson 无法处理的值
+            return None
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - {'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        data = self._encode(obj, indent=bool(kwargs.get('indent')))
+        return data.decode('utf-8') if data is not None else super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        data = self._encode(obj, indent=indent)
+        if data is None:
+            return super().response(obj)
+        return self._app.response_class(data + b'\n', mimetype=self.mimetype)
+
+
+def stream_page(template_name, **context):
+    """
+    流式渲染模板（替代 render_template 用于大页面）
+
+    闪现消息在开始流式输出前取出，保证会话在响应头发出前完成修改
+    """
+    app = current_app._get_current_object()
+    get_flashed_messages(with_categories=True)
+    template = app.jinja_env.get_or_select_template(template_name)
+    app.update_template_context(context)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return Response(stream_with_context(stream), mimetype='text/html')
+
+
+def choose_encoding():
+    """按 Accept-Encoding 选择压缩算法，客户端不接受时返回 None"""
+    accept = request.accept_encodings
+    if brotli is not None and accept.quality('br') > 0:
+        return 'br'
+    if accept.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def negotiated_encoding():
+    """本次请求协商的压缩编码（压缩关闭或客户端不接受压缩时为 None）"""
+    if not current_app.config.get('COMPRESSION_ENABLED', True):
+        return None
+    return choose_encoding()
+
+
+def matching_etag(etag):
+    """
+    If-None-Match 中与当前内容匹配的 ETag，没有匹配时返回 None
+
+    客户端持有的可能是未压缩正文的原 ETag，或按本次协商的编码压缩后带后缀的 ETag
+    """
+    encoding = negotiated_encoding()
+    for candidate in (etag, f'{etag}-{encoding}') if encoding else (etag,):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def _tag_encoding(response, encoding):
+    """正文实际被压缩时给强 ETag 加编码后缀，identity/gzip/br 正文不共用一个强 ETag"""
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+
+
+def not_modified(etag):
+    """304 响应：带上与 200 响应相同的 ETag 和 Vary: Accept-Encoding"""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    if current_app.config.get('COMPRESSION_ENABLED', True):
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+class _Compressor:
+    """gzip / brotli 增量压缩"""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=min(level, 11))
+        else:
+            self._compressor = zlib.compressobj(min(level, 9), zlib.DEFLATED, 31)
+
+    def compress(self, chunk, flush=False):
+        if self.encoding == 'br':
+            data = self._compressor.process(chunk)
+            return data + self._compressor.flush() if flush else data
+        data = self._compressor.compress(chunk)
+        return data + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else data
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def _is_compressible(response):
+    if request.method == 'HEAD' or response.direct_passthrough:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    return response.mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def _stream_body(body, charset, compressor, endpoint, started, trace=None):
+    """逐块压缩流式响应，并在结束时记录首字节时间、大小与 Notion 调用数（渲染中的调用也计入）"""
+    first_chunk_at = None
+    raw_bytes = sent_bytes = 0
+    try:
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            raw_bytes += len(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk, flush=True)
+            if not chunk:
+                continue
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            sent_bytes += len(chunk)
+            yield chunk
+        if compressor is not None:
+            tail = compressor.finish()
+            sent_bytes += len(tail)
+            yield tail
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+        finished = time.perf_counter()
+        request_metrics.record(
+            endpoint,
+            ttfb_ms=((first_chunk_at or finished) - started) * 1000,
+            total_ms=(finished - started) * 1000,
+            raw_bytes=raw_bytes, sent_bytes=sent_bytes,
+            encoding=compressor.encoding if compressor else None,
+            streamed=True, notion_calls=trace.count if trace is not None else 0
+        )
+
+
+def init_response_pipeline(app):
+    """
+    注册压缩与计时钩子，并在安装了 orjson 时替换 JSON 编码器
+
+    应尽早调用：after_request 按注册的逆序执行，这样压缩在其他钩子之后进行
+    """
+    if orjson is not None and app.config.get('FAST_JSON_ENABLED', True):
+        app.json = OrjsonProvider(app)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started_at = time.perf_counter()
+        begin_notion_trace()
+
+    @app.teardown_request
+    def finish_notion_trace(error=None):
+        end_notion_trace()
+
+    @app.after_request
+    def finish_response(response):
+        started = g.pop('request_started_at', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or request.path
+        trace = current_notion_trace()
+        compressor = None
+        if app.config.get('COMPRESSION_ENABLED', True) and _is_compressible(response):
+            response.vary.add('Accept-Encoding')
+            encoding = choose_encoding()
+            if encoding and (response.is_streamed or
+                             response.calculate_content_length() >= app.config.get('COMPRESSION_MIN_SIZE', 500)):
+                level = app.config.get('BROTLI_QUALITY', 5) if encoding == 'br' else app.config.get('COMPRESSION_LEVEL', 6)
+                compressor = _Compressor(encoding, level)
+
+        if response.is_streamed:
+            response.response = _stream_body(response.response, response.charset, compressor, endpoint, started, trace)
+            if compressor is not None:
+                response.headers['Content-Encoding'] = compressor.encoding
+                _tag_encoding(response, compressor.encoding)
+            response.headers.pop('Content-Length', None)
+            return response
+
+        raw = response.get_data()
+        if compressor is not None:
+            data = compressor.compress(raw) + compressor.finish()
+            if len(data) < len(raw):
+                response.set_data(data)
+                response.headers['Content-Encoding'] = compressor.encoding
+                _tag_encoding(response, compressor.encoding)
+            else:
+                compressor = None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        request_metrics.record(
+            endpoint, ttfb_ms=elapsed_ms, total_ms=elapsed_ms,
+            raw_bytes=len(raw), sent_bytes=response.calculate_content_length() or 0,
+            encoding=compressor.encoding if compressor else None,
+            notion_calls=trace.count if trace is not None else 0
+        )
+        server_timing = f'app;dur={elapsed_ms:.1f}'
+        if trace is not None and trace.count:
+            summary = trace.summary()
+            server_timing += f', notion;desc="{summary["calls"]} calls";dur={summary["notion_ms"]:.1f}'
+        response.headers['Server-Timing'] = server_timing
+        return response
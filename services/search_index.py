@@ -0,0 +1,230 @@
+"""
+任务标题的内存搜索索引（延期页面的任务选择器使用）
+
+英文/数字按单词前缀建索引，中日韩文字按单字 + 双字 n-gram 建索引；
+索引从页面镜像构建，之后只按 synced_at 增量刷新
+"""
+
+from datetime import datetime
+import heapq
+import threading
+import time
+import unicodedata
+
+from models.database import PageMirror
+
+MAX_PREFIX_LENGTH = 12
+REFRESH_INTERVAL_SECONDS = 2.0
+DEFAULT_TOP_K = 20
+
+
+def normalize_text(text):
+    """统一全角/半角与大小写"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def is_cjk(char):
+    """是否为中日韩文字（含假名、谚文）"""
+    code = ord(char)
+    return (
+        0x3040 <= code <= 0x30FF      # 平假名、片假名
+        or 0x3400 <= code <= 0x4DBF   # CJK 扩展 A
+        or 0x4E00 <= code <= 0x9FFF   # CJK 统一汉字
+        or 0xAC00 <= code <= 0xD7AF   # 谚文音节
+        or 0xF900 <= code <= 0xFAFF   # CJK 兼容汉字
+    )
+
+
+def split_runs(text):
+    """把规范化后的文本切分为 (是否CJK, 片段) 序列，标点和空白作为分隔符"""
+    runs = []
+    current = []
+    current_cjk = None
+    for char in text:
+        if is_cjk(char):
+            kind = True
+        elif char.isalnum():
+            kind = False
+        else:
+            kind = None
+        if kind != current_cjk and current:
+            if current_cjk is not None:
+                runs.append((current_cjk, ''.join(current)))
+            current = []
+        current_cjk = kind
+        current.append(char)
+    if current and current_cjk is not None:
+        runs.append((current_cjk, ''.join(current)))
+    return runs
+
+
+def index_grams(text):
+    """文档侧的索引键"""
+    grams = set()
+    for cjk, run in split_runs(text):
+        if cjk:
+            grams.update(run)
+            grams.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            grams.update(run[:length] for length in range(1, min(len(run), MAX_PREFIX_LENGTH) + 1))
+    return grams
+
+
+def query_grams(text):
+    """查询侧的索引键（结果还需要子串校验）"""
+    grams = set()
+    pieces = []
+    for cjk, run in split_runs(text):
+        pieces.append(run)
+        if cjk:
+            if len(run) == 1:
+                grams.add(run)
+            else:
+                grams.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            grams.add(run[:MAX_PREFIX_LENGTH])
+    return grams, pieces
+
+
+class TaskSearchIndex:
+    """单个配置的任务标题索引，维护子任务计数以判断叶节点"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.documents = {}  # page_id -> {'title', 'normalized', 'parent_id', 'rank'}
+        self.postings = {}  # gram -> set(page_id)
+        self.child_counts = {}  # parent_id -> 子任务数
+        self.watermark = None  # 已索引的最大 synced_at
+        self.last_refresh = 0.0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def upsert(self, page_id, title, parent_id=None, start=None):
+        """新增或更新一个文档"""
+        with self._lock:
+            self.remove(page_id)
+            normalized = normalize_text(title)
+            recency = -start.timestamp() if isinstance(start, datetime) else 0
+            self.documents[page_id] = {
+                'title': title,
+                'normalized': normalized,
+                'parent_id': parent_id,
+                # 与查询无关的排序键部分预先算好
+                'rank': (len(normalized), recency, page_id),
+            }
+            for gram in index_grams(normalized):
+                self.postings.setdefault(gram, set()).add(page_id)
+            if parent_id:
+                self.child_counts[parent_id] = self.child_counts.get(parent_id, 0) + 1
+
+    def remove(self, page_id):
+        """移除一个文档"""
+        with self._lock:
+            document = self.documents.pop(page_id, None)
+            if document is None:
+                return
+            for gram in index_grams(document['normalized']):
+                postings = self.postings.get(gram)
+                if postings is not None:
+                    postings.discard(page_id)
+                    if not postings:
+                        del self.postings[gram]
+            parent_id = document['parent_id']
+            if parent_id and parent_id in self.child_counts:
+                self.child_counts[parent_id] -= 1
+                if self.child_counts[parent_id] <= 0:
+                    del self.child_counts[parent_id]
+
+    def is_leaf(self, page_id):
+        return not self.child_counts.get(page_id)
+
+    def search(self, query, limit=DEFAULT_TOP_K, leaf_only=True):
+        """
+        返回与查询匹配的前 limit 个任务
+
+        排序：标题以查询开头的优先，其次匹配位置靠前、标题较短、开始时间较新
+        """
+        normalized_query = normalize_text(query).strip()
+        with self._lock:
+            if normalized_query:
+                grams, pieces = query_grams(normalized_query)
+                if not grams:
+                    return []
+                # 从最短的倒排表开始求交集
+                posting_lists = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+                candidates = set(posting_lists[0])
+                for postings in posting_lists[1:]:
+                    candidates &= postings
+                    if not candidates:
+                        return []
+            else:
+                pieces = []
+                candidates = self.documents.keys()
+
+            documents = self.documents
+            child_counts = self.child_counts
+            scored = []
+            for page_id in candidates:
+                if leaf_only and page_id in child_counts:
+                    continue
+                document = documents[page_id]
+                if pieces:
+                    normalized = document['normalized']
+                    position = normalized.find(pieces[0])
+                    if position < 0 or not all(piece in normalized for piece in pieces[1:]):
+                        continue
+                    scored.append((position != 0, position, document['rank']))
+                else:
+                    scored.append((False, 0, document['rank']))
+
+            return [
+                {'id': rank[2], 'title': documents[rank[2]]['title']}
+                for _, _, rank in heapq.nsmallest(limit, scored)
+            ]
+
+    def apply_mirror_rows(self, rows):
+        """把镜像行应用到索引（已归档或没有时间盒的任务被移除）"""
+        with self._lock:
+            for row in rows:
+                if row.archived or row.timebox_start is None:
+                    self.remove(row.page_id)
+                else:
+                    self.upsert(row.page_id, row.title, row.parent_id, row.timebox_start)
+                if row.synced_at and (self.watermark is None or row.synced_at > self.watermark):
+                    self.watermark = row.synced_at
+
+
+_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def get_search_index(config_id, force_refresh=False):
+    """
+    获取配置的搜索索引：首次调用从镜像构建，之后最多每隔
+    REFRESH_INTERVAL_SECONDS 秒按 synced_at 增量刷新一次
+    """
+    with _registry_lock:
+        index = _indexes.get(config_id)
+        if index is None:
+            index = _indexes[config_id] = TaskSearchIndex()
+
+    now = time.monotonic()
+    if not force_refresh and index.watermark is not None and now - index.last_refresh < REFRESH_INTERVAL_SECONDS:
+        return index
+
+    query = PageMirror.query.filter(PageMirror.config_id == config_id)
+    if index.watermark is not None:
+        query = query.filter(PageMirror.synced_at > index.watermark)
+    rows = query.all()
+    if rows:
+        index.apply_mirror_rows(rows)
+        print(f"🔎 搜索索引刷新: {len(rows)} 个页面，共 {len(index)} 个任务")
+    index.last_refresh = now
+    return index
+
+
+def drop_search_index(config_id):
+    """丢弃配置的索引（配置被删除或重置时）"""
+    with _registry_lock:
+        _indexes.pop(config_id, None)
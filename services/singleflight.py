@@ -0,0 +1,202 @@
+"""
+单飞协调器
+
+- SingleFlight（写）：同一配置下相同的提交合并为一次执行，
+  不同的写操作按配置串行执行，避免重复点击或多标签页并发写入同一个数据库
+- ReadCoalescer（读）：按 (令牌, 端点, 规范化后的请求体) 合并并发的相同读取，
+  多个标签页/轮询组件同时发起的 databases.retrieve、待排程任务查询等只调用一次 Notion，
+  结果由所有等待者共享；只合并进行中的调用，结束后不缓存。
+  写入后调用 invalidate(令牌)，之后的读取不会再加入写入前开始的读取
+"""
+
+from collections import defaultdict
+import json
+import threading
+
+DEFAULT_WAIT_SECONDS = 300
+DEFAULT_READ_WAIT_SECONDS = 60
+
+
+class SingleFlightBusy(RuntimeError):
+    """等待同一配置上的其他操作超时"""
+
+
+class _Call:
+    """一次进行中的执行，跟随者等待它的结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """进程内锁注册表：每个配置一把串行锁，每个 (配置, 键) 一个进行中的执行"""
+
+    def __init__(self, wait_seconds=DEFAULT_WAIT_SECONDS):
+        self.wait_seconds = wait_seconds
+        self._registry_lock = threading.Lock()
+        self._config_locks = {}
+        self._inflight = {}
+
+    def _config_lock(self, config_id):
+        with self._registry_lock:
+            lock = self._config_locks.get(config_id)
+            if lock is None:
+                lock = self._config_locks[config_id] = threading.Lock()
+            return lock
+
+    def run(self, config_id, key, fn):
+        """
+        执行 fn，或加入相同键上正在进行的执行
+
+        Args:
+            config_id: 配置 ID，同一配置下的不同操作串行执行
+            key: 操作键，相同键的并发提交共享同一结果
+            fn: 无参函数
+
+        Returns:
+            tuple: (结果, 是否为合并的重复提交)
+        """
+        flight_key = (config_id, key)
+        with self._registry_lock:
+            call = self._inflight.get(flight_key)
+            if call is not None:
+                call.followers += 1
+                leader = False
+            else:
+                call = self._inflight[flight_key] = _Call()
+                leader = True
+
+        if not leader:
+            print(f"🔁 重复提交已合并到进行中的操作: {key}")
+            if not call.done.wait(self.wait_seconds):
+                raise SingleFlightBusy('相同的操作仍在执行中，请稍后刷新查看结果')
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            lock = self._config_lock(config_id)
+            if not lock.acquire(timeout=self.wait_seconds):
+                raise SingleFlightBusy('当前配置有其他操作正在执行，请稍后重试')
+            try:
+                call.result = fn()
+            finally:
+                lock.release()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._registry_lock:
+                self._inflight.pop(flight_key, None)
+            call.done.set()
+
+    def is_busy(self, config_id):
+        """配置上是否有操作正在执行"""
+        lock = self._config_lock(config_id)
+        return lock.locked()
+
+
+def normalize_body(body):
+    """请求体的规范化键：字典键排序、去掉值为 None 的顶层参数"""
+    body = {key: value for key, value in (body or {}).items() if value is not None}
+    return json.dumps(body, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+class ReadCoalescer:
+    """合并并发的相同读取，并统计每个端点的合并比例"""
+
+    def __init__(self, wait_seconds=DEFAULT_READ_WAIT_SECONDS, enabled=True):
+        self.wait_seconds = wait_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._generations = defaultdict(int)
+        self._invalidations = 0
+        self._stats = defaultdict(lambda: {'calls': 0, 'executed': 0, 'coalesced': 0})
+
+    def invalidate(self, scope):
+        """scope 上发生了写入：递增它的代数，进行中的读取不再接受新的等待者"""
+        with self._lock:
+            self._generations[scope] += 1
+            self._invalidations += 1
+
+    def do(self, scope, endpoint, body, fn):
+        """
+        执行读取 fn，或等待相同键上进行中的读取并共享其结果
+
+        Args:
+            scope: 分组键，通常为 token_key(令牌)，不同令牌的读取互不合并
+            endpoint: 端点名称，如 databases.query
+            body: 请求参数字典
+            fn: 无参函数，执行实际的读取
+
+        Returns:
+            fn 的结果（合并的调用方拿到的是同一个对象，调用方不应修改它）
+        """
+        if not self.enabled:
+            return fn()
+        body_key = normalize_body(body)
+        with self._lock:
+            flight_key = (scope, self._generations[scope], endpoint, body_key)
+            stats = self._stats[endpoint]
+            stats['calls'] += 1
+            call = self._inflight.get(flight_key)
+            if call is not None:
+                call.followers += 1
+                stats['coalesced'] += 1
+                leader = False
+            else:
+                call = self._inflight[flight_key] = _Call()
+                stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            if call.done.wait(self.wait_seconds):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            # 进行中的读取太慢，自己再读一次
+            print(f"⏳ 等待合并的读取超时，单独执行: {endpoint}")
+            return fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(flight_key, None)
+            call.done.set()
+
+    def snapshot(self):
+        """各端点的读取次数、实际执行次数、合并次数与合并比例"""
+        with self._lock:
+            stats = {endpoint: dict(values) for endpoint, values in self._stats.items()}
+            inflight = len(self._inflight)
+            invalidations = self._invalidations
+        for values in stats.values():
+            values['coalescing_ratio'] = round(values['coalesced'] / values['calls'], 3) if values['calls'] else 0.0
+        calls = sum(values['calls'] for values in stats.values())
+        coalesced = sum(values['coalesced'] for values in stats.values())
+        return {
+            'enabled': self.enabled,
+            'inflight': inflight,
+            'invalidations': invalidations,
+            'coalescing_ratio': round(coalesced / calls, 3) if calls else 0.0,
+            'endpoints': dict(sorted(stats.items())),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# 应用内共享的协调器
+schedule_flight = SingleFlight()
+read_flight = ReadCoalescer()
@@ -0,0 +1,150 @@
+"""
+缓存预热：启动时以及每天排程时段之前，预先建立连接池、获取数据库结构、
+同步今天的待排程任务并构建任务树，让当天第一次排程预览直接使用热数据
+
+预热的任务树在使用前用一次 last_edited_time 查询确认数据库没有变化
+"""
+
+import copy
+from datetime import datetime, timedelta
+import threading
+import time
+
+import pytz
+
+from services.mirror import iterate_database_query
+
+SHANGHAI_TZ = pytz.timezone('Asia/Shanghai')
+# Notion 的 last_edited_time 只精确到分钟，检查时回看一分钟
+EDIT_CHECK_OVERLAP = timedelta(minutes=1)
+
+
+def shanghai_today():
+    return datetime.now(SHANGHAI_TZ).date()
+
+
+class WarmTreeCache:
+    """每个配置保存一棵预热的任务树（只对构建当天有效）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # config_id -> (day, built_at UTC, tree)
+
+    def put(self, config_id, tree, built_at=None):
+        with self._lock:
+            self._entries[config_id] = (shanghai_today(), built_at or datetime.utcnow(), tree)
+
+    def take(self, config_id):
+        """
+        取出当天的预热任务树（深拷贝，排程会修改任务对象）
+
+        Returns:
+            tuple: (tree, built_at)，没有可用的预热数据时返回 (None, None)
+        """
+        with self._lock:
+            entry = self._entries.get(config_id)
+        if entry is None or entry[0] != shanghai_today():
+            return None, None
+        return copy.deepcopy(entry[2]), entry[1]
+
+    def invalidate(self, config_id):
+        with self._lock:
+            self._entries.pop(config_id, None)
+
+
+warm_tree_cache = WarmTreeCache()
+
+
+def database_changed_since(notion, database_id, since):
+    """用一次带 last_edited_time 过滤的查询判断数据库在 since（UTC naive）之后是否有页面被修改"""
+    edited_filter = {
+        "timestamp": "last_edited_time",
+        "last_edited_time": {
+            "on_or_after": pytz.utc.localize(since - EDIT_CHECK_OVERLAP).isoformat()
+        }
+    }
+    for _ in iterate_database_query(notion, database_id, filter=edited_filter):
+        return True
+    return False
+
+
+def parse_warmup_times(value):
+    """解析 "08:50,13:50" 形式的预热时间（上海时间）"""
+    times = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            hour, minute = item.split(':')
+            times.append((int(hour), int(minute)))
+        except ValueError:
+            print(f"⚠️ 忽略无效的预热时间: {item}")
+    return sorted(times)
+
+
+def next_run_at(times, now=None):
+    """下一次预热的时间（带时区）"""
+    now = now or datetime.now(SHANGHAI_TZ)
+    for day_offset in (0, 1):
+        day = (now + timedelta(days=day_offset)).date()
+        for hour, minute in times:
+            candidate = SHANGHAI_TZ.localize(datetime(day.year, day.month, day.day, hour, minute))
+            if candidate > now:
+                return candidate
+    return None
+
+
+class WarmupScheduler:
+    """后台预热线程：启动时运行一次，之后按配置的时间每天运行"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_run_at = None
+        self.last_duration_ms = None
+
+    def start(self, app, warm_fn, times, run_on_startup=True):
+        """
+        启动预热线程（每个进程只启动一次）
+
+        Args:
+            app: Flask 应用，预热在它的应用上下文中执行
+            warm_fn: 无参预热函数
+            times: [(hour, minute)] 每天的预热时间
+            run_on_startup: 是否在启动时立即预热
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(
+                target=self._loop, args=(app, warm_fn, times, run_on_startup),
+                name='cache-warmup', daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def run_once(self, app, warm_fn):
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                warm_fn()
+        except Exception as e:
+            print(f"⚠️ 缓存预热失败: {str(e)}")
+        finally:
+            self.last_run_at = datetime.utcnow()
+            self.last_duration_ms = int((time.perf_counter() - started) * 1000)
+
+    def _loop(self, app, warm_fn, times, run_on_startup):
+        if run_on_startup:
+            self.run_once(app, warm_fn)
+        while times:
+            target = next_run_at(times)
+            if target is None:
+                return
+            print(f"⏰ 下一次缓存预热: {target.strftime('%Y-%m-%d %H:%M')}")
+            time.sleep(max(0.0, (target - datetime.now(SHANGHAI_TZ)).total_seconds()))
+            self.run_once(app, warm_fn)
+
+
+warmup_scheduler = WarmupScheduler()
@@ -0,0 +1,56 @@
+"""
+多工作区：一个部署同时服务多个数据库配置（每个团队一个）
+
+当前请求使用的配置按以下顺序确定：
+1. 请求头 X-Config-Id（脚本、API 调用）
+2. 查询参数或表单字段 config_id
+3. 会话中选择的工作区（导航栏切换，/workspaces/select）
+都没有时使用第一个配置，单工作区部署的行为不变
+
+限速桶、连接池、页面/结构缓存按令牌隔离，任务树预热、搜索索引和
+写操作队列（schedule_flight）按配置隔离，一个团队的批量写入不会占用另一个团队的配额
+"""
+
+from flask import has_request_context, request, session
+
+CONFIG_HEADER = 'X-Config-Id'
+SESSION_KEY = 'config_id'
+
+
+def _parse_config_id(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def requested_config_id():
+    """请求中显式指定的配置 ID（请求头、查询参数或表单）"""
+    if not has_request_context():
+        return None
+    for value in (request.headers.get(CONFIG_HEADER), request.args.get('config_id')):
+        config_id = _parse_config_id(value)
+        if config_id is not None:
+            return config_id
+    if request.method == 'POST':
+        return _parse_config_id(request.form.get('config_id'))
+    return None
+
+
+def selected_config_id():
+    """当前请求使用的配置 ID，没有请求上下文或未选择时返回 None"""
+    config_id = requested_config_id()
+    if config_id is None and has_request_context():
+        config_id = _parse_config_id(session.get(SESSION_KEY))
+    return config_id
+
+
+def remember_selection(config_id):
+    """把工作区选择保存到会话"""
+    session[SESSION_KEY] = config_id
+
+
+def forget_selection(config_id=None):
+    """清除会话中的工作区选择（指定 config_id 时只在它被选中时清除）"""
+    if config_id is None or _parse_config_id(session.get(SESSION_KEY)) == config_id:
+        session.pop(SESSION_KEY, None)